@@ -0,0 +1,185 @@
+"""
+Admission control for /api/analyze
+Per-user token-bucket rate limits plus a global cap on concurrent upstream
+calls with a bounded FIFO wait queue. State lives in a small local SQLite
+file (WAL mode) so every gunicorn worker on the host shares the same limits
+without an external service.
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    """Request refused; retry_after is a hint in seconds for the Retry-After header"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class AdmissionController:
+    """Cross-process token buckets and upstream concurrency slots
+
+    rate_per_minute <= 0 turns the per-user rate limit off.
+    """
+
+    def __init__(self, path=None, rate_per_minute=10, burst=5, max_concurrency=8,
+                 queue_size=16, max_wait=10.0, slot_ttl=180.0, poll_interval=0.05):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'fuell_admission.db')
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        # Slots older than this belong to a crashed/killed worker (upstream timeout is 120 s)
+        self.slot_ttl = slot_ttl
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._init_schema()
+
+    # -- storage ----------------------------------------------------------
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS slots (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, acquired REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS waiters (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, enqueued REAL)')
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so read-modify-write is atomic across processes
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    # -- per-user token bucket ---------------------------------------------
+
+    def check_rate(self, key):
+        """Take one token from the caller's bucket or raise AdmissionRejected"""
+        if self.rate <= 0:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            if random.random() < 0.01:
+                # Buckets idle long enough to be full again carry no state worth keeping
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.burst / self.rate,))
+
+        if not allowed:
+            raise AdmissionRejected('Too many analyze requests, please slow down', (1 - tokens) / self.rate)
+
+    # -- global upstream concurrency ---------------------------------------
+
+    def _reap(self, conn, now):
+        conn.execute('DELETE FROM slots WHERE acquired < ?', (now - self.slot_ttl,))
+        conn.execute('DELETE FROM waiters WHERE enqueued < ?', (now - self.max_wait - self.slot_ttl,))
+
+    def _reap_dead_workers(self, conn):
+        """Free slots and queue places held by worker processes that no longer exist"""
+        reaped = 0
+        for (pid,) in conn.execute('SELECT DISTINCT pid FROM slots UNION SELECT DISTINCT pid FROM waiters').fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                reaped += conn.execute('DELETE FROM slots WHERE pid = ?', (pid,)).rowcount
+                conn.execute('DELETE FROM waiters WHERE pid = ?', (pid,))
+            except PermissionError:
+                pass
+        return reaped
+
+    def _try_acquire(self, waiter_id=None):
+        """Grab a free slot if one exists and we're at the head of the queue"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._reap(conn, now)
+            active = conn.execute('SELECT COUNT(*) FROM slots').fetchone()[0]
+            if active >= self.max_concurrency:
+                active -= self._reap_dead_workers(conn)
+            free = self.max_concurrency - active
+            if free <= 0:
+                return None
+            if waiter_id is not None:
+                # FIFO: only the oldest `free` waiters may proceed
+                ahead = conn.execute('SELECT COUNT(*) FROM waiters WHERE id < ?', (waiter_id,)).fetchone()[0]
+                if ahead >= free:
+                    return None
+                conn.execute('DELETE FROM waiters WHERE id = ?', (waiter_id,))
+            elif conn.execute('SELECT COUNT(*) FROM waiters').fetchone()[0] >= free:
+                return None
+            return conn.execute('INSERT INTO slots (pid, acquired) VALUES (?, ?)', (os.getpid(), now)).lastrowid
+
+    def _enqueue(self):
+        now = time.time()
+        with self._transaction() as conn:
+            waiting = conn.execute('SELECT COUNT(*) FROM waiters').fetchone()[0]
+            if waiting >= self.queue_size:
+                return None
+            return conn.execute('INSERT INTO waiters (pid, enqueued) VALUES (?, ?)', (os.getpid(), now)).lastrowid
+
+    def _dequeue(self, waiter_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM waiters WHERE id = ?', (waiter_id,))
+
+    def _release(self, slot_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM slots WHERE id = ?', (slot_id,))
+
+    @contextmanager
+    def upstream_slot(self):
+        """Hold one of the global upstream slots for the duration of the block"""
+        slot_id = self._try_acquire()
+        if slot_id is None:
+            waiter_id = self._enqueue()
+            if waiter_id is None:
+                raise AdmissionRejected('Server is busy analyzing other meals, please retry shortly', self.max_wait)
+
+            deadline = time.time() + self.max_wait
+            try:
+                while slot_id is None:
+                    if time.time() >= deadline:
+                        raise AdmissionRejected('Timed out waiting for an analysis slot, please retry shortly', self.max_wait)
+                    time.sleep(self.poll_interval)
+                    slot_id = self._try_acquire(waiter_id)
+            finally:
+                if slot_id is None:
+                    self._dequeue(waiter_id)
+
+        try:
+            yield
+        finally:
+            self._release(slot_id)
+
+    def stats(self):
+        conn = self._connect()
+        return {
+            'active_upstream_calls': conn.execute('SELECT COUNT(*) FROM slots').fetchone()[0],
+            'queued': conn.execute('SELECT COUNT(*) FROM waiters').fetchone()[0],
+            'max_concurrency': self.max_concurrency,
+            'queue_size': self.queue_size,
+        }
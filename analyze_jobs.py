@@ -0,0 +1,276 @@
+"""
+Asynchronous analyze jobs
+POST /api/analyze/jobs stores the request in a local SQLite table and
+returns a job ID straight away; a small pool of worker threads in each
+gunicorn process claims queued jobs, runs the upstream call and stores the
+result for a TTL. Jobs are leased rather than locked, so work claimed by a
+worker that dies is picked up again after a restart.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from admission_control import AdmissionRejected
+from circuit_breaker import CircuitOpen
+
+FINISHED_STATES = ('succeeded', 'failed')
+
+
+class JobQueueFull(Exception):
+    """Too many jobs already waiting"""
+
+
+class AnalyzeJobQueue:
+    """Durable job table plus a per-process pool of worker threads"""
+
+    def __init__(self, runner, path=None, workers=2, result_ttl=3600, max_pending=200,
+                 lease_seconds=300, max_attempts=3, poll_interval=0.25):
+        # runner(payload, user_id, payload_bytes) -> (body, status_code); may raise AdmissionRejected/CircuitOpen
+        self.runner = runner
+        self.path = path or os.path.join(tempfile.gettempdir(), 'fuell_analyze_jobs.db')
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.max_pending = max_pending
+        # A running job whose lease expires is assumed orphaned (upstream timeout is 120 s)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._init_schema()
+
+    # -- storage ----------------------------------------------------------
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS analyze_jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                status TEXT NOT NULL,
+                payload TEXT,
+                payload_bytes INTEGER,
+                result TEXT,
+                http_status INTEGER,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                not_before REAL NOT NULL DEFAULT 0,
+                lease_until REAL,
+                worker_pid INTEGER,
+                finished REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_analyze_jobs_status ON analyze_jobs (status, not_before, created)')
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    # -- public API ---------------------------------------------------------
+
+    def submit(self, payload, user_id=None, payload_bytes=None):
+        """Persist a new job and return its ID"""
+        job_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM analyze_jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if pending >= self.max_pending:
+                raise JobQueueFull('Too many analyses in progress, please retry shortly')
+            conn.execute('''
+                INSERT INTO analyze_jobs (id, user_id, status, payload, payload_bytes, created)
+                VALUES (?, ?, 'queued', ?, ?, ?)
+            ''', (job_id, user_id, json.dumps(payload), payload_bytes, time.time()))
+        self._notify()
+        return job_id
+
+    def get(self, job_id):
+        """Current state of a job as a dict, or None if unknown/expired"""
+        row = self._connect().execute('''
+            SELECT id, user_id, status, result, http_status, error, attempts, created, finished
+            FROM analyze_jobs WHERE id = ?
+        ''', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'created_at': row['created'],
+            'finished_at': row['finished'],
+        }
+        if row['status'] in FINISHED_STATES:
+            job['http_status'] = row['http_status']
+            job['result'] = json.loads(row['result']) if row['result'] else None
+            job['error'] = row['error']
+        return job
+
+    def wait(self, job_id, timeout):
+        """Long-poll: return the job once finished or when timeout expires"""
+        deadline = time.time() + timeout
+        job = self.get(job_id)
+        while job and job['status'] not in FINISHED_STATES:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            # Woken immediately by workers in this process; other processes are caught by polling
+            with self._changed:
+                self._changed.wait(min(self.poll_interval, remaining))
+            job = self.get(job_id)
+        return job
+
+    def stats(self):
+        rows = self._connect().execute('SELECT status, COUNT(*) FROM analyze_jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    # -- workers ------------------------------------------------------------
+
+    def start(self):
+        """Start this process's worker threads (idempotent, fork-aware)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._recover_orphans()
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"analyze-job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _recover_orphans(self):
+        """Requeue jobs whose worker process is gone instead of waiting for the lease to expire"""
+        with self._transaction() as conn:
+            pids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT worker_pid FROM analyze_jobs WHERE status = 'running'").fetchall()]
+            for pid in pids:
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    conn.execute('''
+                        UPDATE analyze_jobs SET status = 'queued', lease_until = NULL
+                        WHERE status = 'running' AND worker_pid = ?
+                    ''', (pid,))
+                except (PermissionError, TypeError):
+                    pass
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _claim(self):
+        """Atomically lease the oldest runnable job"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('''
+                SELECT id, user_id, payload, payload_bytes, attempts FROM analyze_jobs
+                WHERE (status = 'queued' AND not_before <= ?)
+                   OR (status = 'running' AND lease_until < ?)
+                ORDER BY created
+                LIMIT 1
+            ''', (now, now)).fetchone()
+            if row is None:
+                return None
+            if row['attempts'] >= self.max_attempts:
+                conn.execute('''
+                    UPDATE analyze_jobs SET status = 'failed', error = ?, http_status = 500,
+                        payload = NULL, finished = ? WHERE id = ?
+                ''', ('Analysis was interrupted too many times', now, row['id']))
+                return None
+            conn.execute('''
+                UPDATE analyze_jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, worker_pid = ?
+                WHERE id = ?
+            ''', (now + self.lease_seconds, os.getpid(), row['id']))
+            return row
+
+    def _finish(self, job_id, status, http_status, result=None, error=None):
+        with self._transaction() as conn:
+            conn.execute('''
+                UPDATE analyze_jobs SET status = ?, http_status = ?, result = ?, error = ?,
+                    payload = NULL, lease_until = NULL, finished = ?
+                WHERE id = ?
+            ''', (status, http_status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+        self._notify()
+
+    def _requeue(self, job_id, delay, error=None, refund_attempt=False):
+        with self._transaction() as conn:
+            conn.execute('''
+                UPDATE analyze_jobs SET status = 'queued', lease_until = NULL, not_before = ?, error = ?,
+                    attempts = attempts - ?
+                WHERE id = ?
+            ''', (time.time() + delay, error, 1 if refund_attempt else 0, job_id))
+
+    def _purge(self):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM analyze_jobs WHERE finished IS NOT NULL AND finished < ?',
+                         (time.time() - self.result_ttl,))
+
+    def _worker(self):
+        last_purge = 0
+        while True:
+            try:
+                if time.time() - last_purge > 60:
+                    self._purge()
+                    last_purge = time.time()
+
+                job = self._claim()
+                if job is None:
+                    with self._changed:
+                        self._changed.wait(self.poll_interval * 4)
+                    continue
+                self._run(job)
+            except Exception as e:
+                print(f"💥 Analyze job worker error: {e}")
+                time.sleep(1)
+
+    def _run(self, job):
+        job_id = job['id']
+        print(f"🧵 Running analyze job {job_id} (attempt {job['attempts'] + 1})")
+        try:
+            body, status_code = self.runner(json.loads(job['payload']), job['user_id'], job['payload_bytes'])
+        except (AdmissionRejected, CircuitOpen) as e:
+            # Upstream is saturated or down: go back to the queue instead of failing the job
+            self._requeue(job_id, e.retry_after, refund_attempt=True)
+            return
+        except Exception as e:
+            print(f"💥 Analyze job {job_id} failed: {e}")
+            if job['attempts'] + 1 < self.max_attempts:
+                self._requeue(job_id, 2 ** job['attempts'], error=str(e))
+            else:
+                self._finish(job_id, 'failed', 502, error='Failed to connect to Claude API')
+            return
+
+        if status_code == 200:
+            self._finish(job_id, 'succeeded', status_code, result=body)
+        else:
+            self._finish(job_id, 'failed', status_code, result=body, error=f"Upstream returned HTTP {status_code}")
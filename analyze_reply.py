@@ -0,0 +1,86 @@
+"""
+Analyze replies relayed as bytes
+An upstream reply used to be decoded with response.json() and re-encoded by
+jsonify() on every request, and error bodies were parsed just to be
+re-emitted. AnalyzeReply keeps the body exactly as it arrived (from
+Anthropic or the analyze cache) and hands those bytes straight back to the
+client. It is only decoded when something actually needs the objects:
+
+  - a transform the client asked for (?transform=parse,trim), run as one
+    explicit pipeline by transform()
+  - an answer the server builds itself (saved meals, the nutrition
+    reference, a reused near-duplicate), which starts out as a dict and is
+    encoded once
+
+Token usage for the ledger and metrics is read from the bytes later, on the
+ledger's flusher thread (see UsageLedger.record's response_body).
+"""
+
+import json
+
+
+class AnalyzeReply:
+    """One analyze answer: raw JSON bytes, a result dict, or both once decoded"""
+
+    __slots__ = ('status', 'content_type', '_body', '_result')
+
+    def __init__(self, body=None, result=None, status=200, content_type='application/json'):
+        self.status = status
+        self.content_type = content_type
+        self._body = body
+        self._result = result
+
+    @classmethod
+    def upstream(cls, response):
+        """The reply of a requests.Response from the Messages API, without decoding it"""
+        body = response.content
+        content_type = response.headers.get('Content-Type') or 'application/json'
+        if response.status_code != 200 and (not body or 'json' not in content_type):
+            # An empty body or a proxy's HTML error page: wrap it the way the app reads errors
+            text = response.text[:500] if body else 'Unknown error'
+            return cls(result={'error': text}, status=response.status_code)
+        return cls(body=body, status=response.status_code, content_type=content_type)
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+    def json(self):
+        """The reply as Python objects (decoded at most once)"""
+        if self._result is None:
+            try:
+                self._result = json.loads(self._body)
+            except ValueError:
+                self._result = {'error': self._body[:500].decode('utf-8', 'replace')}
+        return self._result
+
+    def body(self):
+        """The reply as bytes: the received bytes unless a transform replaced the result"""
+        if self._body is None:
+            self._body = json.dumps(self._result, separators=(',', ':')).encode('utf-8')
+        return self._body
+
+    def transform(self, steps):
+        """Run each step (result -> result) over the decoded reply; the body is re-encoded once afterwards"""
+        if not steps:
+            return self
+        result = self.json()
+        for step in steps:
+            result = step(result)
+        self._result, self._body = result, None
+        self.content_type = 'application/json'
+        return self
+
+
+# Top-level fields the app reads from an analyze reply (src/services/api.js)
+APP_FIELDS = ('id', 'model', 'content', 'stop_reason', 'parsed',
+              'saved_meal_match', 'reference_estimate', 'reused_analysis', 'error')
+
+
+def trim(result):
+    """Only what the app reads: drops usage, role/type and any non-text content blocks"""
+    trimmed = {key: result[key] for key in APP_FIELDS if key in result}
+    if isinstance(trimmed.get('content'), list):
+        trimmed['content'] = [block for block in trimmed['content']
+                              if isinstance(block, dict) and block.get('type') == 'text']
+    return trimmed
@@ -0,0 +1,150 @@
+"""
+Resilient client for the Anthropic Messages API
+Retries overload/timeout failures server-side (capped exponential backoff
+with full jitter, honoring retry-after) inside a per-request deadline, so
+the phone doesn't have to re-upload megabytes of base64. Optionally hedges:
+if the first attempt is still running after the observed p95 latency, a
+second identical request is fired and whichever answers first wins.
+"""
+
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+# 529 = Anthropic "overloaded"
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504, 529}
+
+
+class AnthropicClient:
+    """POSTs Messages payloads with retries, deadline budget and optional hedging"""
+
+    def __init__(self, api_url, api_key, metrics, timeout=120, deadline=110,
+                 max_retries=3, base_delay=0.5, max_delay=8.0,
+                 hedge=False, hedge_min_samples=20, hedge_floor=2.0, breaker=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.metrics = metrics
+        self.timeout = timeout
+        # Total time budget for all attempts of one logical request (seconds)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        # Don't hedge until the latency window is meaningful, and never before hedge_floor seconds
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_floor = hedge_floor
+        # Once the circuit breaker trips, stop retrying and give the worker back
+        self.breaker = breaker
+        self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='anthropic-hedge') if hedge else None
+
+    def headers(self):
+        return {
+            'Content-Type': 'application/json',
+            'x-api-key': self.api_key,
+            'anthropic-version': '2023-06-01'
+        }
+
+    def send(self, data):
+        """Return the final requests.Response; raises requests exceptions if every attempt failed to connect"""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            response = error = None
+            started = time.monotonic()
+            try:
+                response = self._attempt(data, max(1.0, min(self.timeout, remaining)))
+                # How long this attempt alone took (the circuit breaker's latency, without earlier retries)
+                response.attempt_seconds = time.monotonic() - started
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                self.metrics.inc('upstream_errors_total')
+                print(f"⚠️ Upstream attempt {attempt + 1} failed: {e}")
+
+            if response is not None:
+                self.metrics.inc(f"upstream_status_{response.status_code}")
+                if response.status_code not in RETRYABLE_STATUSES:
+                    return response
+
+            if attempt >= self.max_retries:
+                break
+            if self.breaker is not None and self.breaker.is_open():
+                break
+
+            delay = self._backoff(attempt, response)
+            if time.monotonic() + delay >= deadline - 1.0:
+                # Not enough budget left for another useful attempt
+                self.metrics.inc('upstream_deadline_exhausted_total')
+                break
+
+            attempt += 1
+            self.metrics.inc('upstream_retries_total')
+            status = response.status_code if response is not None else type(error).__name__
+            print(f"🔁 Retrying upstream ({status}) in {delay:.2f}s (retry {attempt}/{self.max_retries})")
+            time.sleep(delay)
+
+        if response is not None:
+            return response
+        raise error
+
+    def _backoff(self, attempt, response):
+        """retry-after if the upstream sent one, otherwise capped exponential backoff with full jitter"""
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.max_delay * 4)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _post(self, data, timeout):
+        started = time.perf_counter()
+        response = requests.post(self.api_url, headers=self.headers(), json=data, timeout=timeout)
+        self.metrics.observe('upstream_latency_ms', (time.perf_counter() - started) * 1000)
+        return response
+
+    def _attempt(self, data, timeout):
+        self.metrics.inc('upstream_requests_total')
+        hedge_after = self._hedge_delay()
+        if hedge_after is None or hedge_after >= timeout:
+            return self._post(data, timeout)
+
+        primary = self._hedge_pool.submit(self._post, data, timeout)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        # Primary is slower than p95: race a second request against it
+        self.metrics.inc('upstream_hedges_total')
+        print(f"🏇 Hedging upstream request after {hedge_after:.1f}s")
+        hedged = self._hedge_pool.submit(self._post, data, max(1.0, timeout - hedge_after))
+        pending = {primary, hedged}
+        fallback = first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    first_error = first_error or e
+                    continue
+                if response.status_code == 200:
+                    if future is hedged:
+                        self.metrics.inc('upstream_hedge_wins_total')
+                    return response
+                fallback = fallback or response
+        if fallback is not None:
+            return fallback
+        raise first_error
+
+    def _hedge_delay(self):
+        if not self.hedge:
+            return None
+        p95 = self.metrics.percentile('upstream_latency_ms', 95, min_samples=self.hedge_min_samples)
+        if p95 is None:
+            return None
+        return max(self.hedge_floor, p95 / 1000)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Backfill the typed meal_date / logged_at columns of meals (see meal_dates.py)
+
+Usage:
+  python3 backfill_meal_dates.py                          # run (or resume) the backfill
+  python3 backfill_meal_dates.py --batch-rows 500 --max-duty 0.25
+  python3 backfill_meal_dates.py --status
+
+Works on PostgreSQL (partitioned or not) and SQLite while the app is
+serving. Stop it at any time; the next run resumes from the last committed
+batch. When it finishes, servers switch meal reads to the typed columns
+within a minute.
+"""
+
+import argparse
+import os
+import sys
+
+import meal_dates
+from storage import create_storage
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fill meals.meal_date and meals.logged_at in throttled batches")
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'), help="Defaults to $DATABASE_URL")
+    parser.add_argument('--batch-rows', type=int, default=1000, help="Meals per batch (one transaction each)")
+    parser.add_argument('--pause', type=float, default=0.0, help="Minimum seconds to sleep between batches")
+    parser.add_argument('--max-duty', type=float, default=0.5,
+                        help="Largest share of wall time spent running batches (0-1]")
+    parser.add_argument('--status', action='store_true', help="Show progress and exit")
+    return parser.parse_args()
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def print_progress(report):
+    print(f"  ⏳ {report['filled']:,} filled, {report['remaining']:,} left, "
+          f"{report['rows_per_second']:,} rows/s, ETA {format_seconds(report['eta_seconds'])} "
+          f"(at id {report['position']})")
+
+
+def print_status(result):
+    migration = result['migration']
+    if migration is None:
+        print(f"ℹ️ Not started; {result['remaining']:,} meals to fill")
+        return
+    print(f"📋 {migration['state']}: {migration['rows_done']:,} meals filled so far, "
+          f"{result['remaining']:,} left (last id {migration['position'] or '-'})")
+
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        print("❌ Set DATABASE_URL or pass --database-url")
+        return 1
+
+    storage = create_storage(args.database_url)
+    try:
+        # Adds the columns if no server has started on this version yet
+        storage.init_schema()
+        if args.status:
+            print_status(meal_dates.status(storage))
+            return 0
+        print(f"🗓️ Backfilling typed meal dates on {storage.name} "
+              f"({args.batch_rows} rows per batch, duty ≤ {args.max_duty:.0%})...")
+        try:
+            result = meal_dates.backfill(storage, args.batch_rows, args.pause, args.max_duty, print_progress)
+        except KeyboardInterrupt:
+            print("\n⏸️ Stopped; run again to resume")
+            return 130
+        print_status(result)
+        print("✅ Backfill complete; meal reads now use meal_date/logged_at")
+    finally:
+        storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
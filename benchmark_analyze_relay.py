@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Analyze Relay Benchmark - CPU and allocations per reply, decode/re-encode vs raw relay
+Replays analyze replies through the response handling of /api/analyze as it
+was (response.json(), parsed block, json.dumps for the cache, jsonify) and
+as it is now (AnalyzeReply: the upstream bytes relayed as-is, transforms
+only when asked for), in-process with no network, and reports per reply:
+
+  - CPU time (process time, µs)
+  - peak Python allocations (tracemalloc, KB)
+
+for a fresh upstream reply, an analyze-cache hit and an upstream error,
+plus the raw relay with ?transform=parse,trim. The usage the ledger now
+reads on its flusher thread is timed separately as background work.
+
+Replies come from --corpus (recorded with ANALYZE_RECORD_DIR) or the mock
+upstream's canned reply.
+
+Usage:
+  python3 benchmark_analyze_relay.py
+  python3 benchmark_analyze_relay.py --corpus recorded_analyses/ --iterations 20000
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+from flask import Flask, jsonify
+from requests.models import Response
+
+from analyze_reply import AnalyzeReply, trim
+from mock_anthropic_server import CANNED_TEXT
+from nutrition_data import parse_response
+
+# Configuration
+RESULTS_FOLDER = "performance_results"
+
+ERROR_BODY = b'{"type":"error","error":{"type":"overloaded_error","message":"Overloaded"}}'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure CPU and allocations of analyze reply handling")
+    parser.add_argument('--corpus', default=None, help="Folder of recorded Messages API replies (*.json)")
+    parser.add_argument('--iterations', type=int, default=5000, help="Replies handled per scenario")
+    parser.add_argument('--output', default=None, help="Where to write the JSON report")
+    return parser.parse_args()
+
+
+def load_bodies(folder):
+    if not folder:
+        return [json.dumps({
+            'id': 'msg_mock', 'type': 'message', 'role': 'assistant', 'model': 'claude-sonnet-4-5-20250929',
+            'content': [{'type': 'text', 'text': CANNED_TEXT}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+            'usage': {'input_tokens': 2400, 'output_tokens': 420,
+                      'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 2940},
+        }).encode('utf-8')]
+    bodies = []
+    for path in sorted(glob.glob(os.path.join(folder, '*.json'))):
+        with open(path, 'rb') as f:
+            bodies.append(f.read())
+    if not bodies:
+        raise FileNotFoundError(f"No *.json replies found in {folder}")
+    return bodies
+
+
+def upstream_response(body, status=200):
+    response = Response()
+    response.status_code = status
+    response._content = body
+    response.headers['Content-Type'] = 'application/json'
+    response.encoding = 'utf-8'
+    return response
+
+
+# -- before: decode, transform, re-encode ---------------------------------------
+
+def legacy_upstream(app, body):
+    response = upstream_response(body)
+    result = response.json()
+    result['parsed'] = parse_response(result)
+    result.get('usage')
+    cached = json.dumps(result)
+    return app.response_class(jsonify(result).get_data()), cached
+
+
+def legacy_cache_hit(app, cached):
+    result = json.loads(cached)
+    return jsonify(result).get_data()
+
+
+def legacy_error(app, body):
+    response = upstream_response(body, 529)
+    result = response.json() if response.text else {"error": "Unknown error"}
+    return jsonify(result).get_data()
+
+
+# -- after: AnalyzeReply ----------------------------------------------------------
+
+def relay(app, reply):
+    return app.response_class(reply.body(), status=reply.status, content_type=reply.content_type).get_data()
+
+
+def relay_upstream(app, body):
+    return relay(app, AnalyzeReply.upstream(upstream_response(body)))
+
+
+def relay_transformed(app, body):
+    reply = AnalyzeReply.upstream(upstream_response(body))
+
+    def parse(result):
+        result['parsed'] = parse_response(result)
+        return result
+    return relay(app, reply.transform([parse, trim]))
+
+
+def relay_cache_hit(app, cached):
+    return relay(app, AnalyzeReply(body=cached))
+
+
+def relay_error(app, body):
+    return relay(app, AnalyzeReply.upstream(upstream_response(body, 529)))
+
+
+def ledger_usage(app, body):
+    """What UsageLedger._resolve does per row on the flusher thread"""
+    return json.loads(body).get('usage')
+
+
+def measure(app, func, inputs, iterations):
+    for i in range(min(200, iterations)):
+        func(app, inputs[i % len(inputs)])
+
+    started = time.process_time()
+    for i in range(iterations):
+        func(app, inputs[i % len(inputs)])
+    cpu_us = (time.process_time() - started) / iterations * 1e6
+
+    peaks = []
+    tracemalloc.start()
+    for i in range(min(500, iterations)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        func(app, inputs[i % len(inputs)])
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    peaks.sort()
+    return {'cpu_us': round(cpu_us, 1), 'peak_alloc_kb': round(peaks[len(peaks) // 2] / 1024, 1)}
+
+
+def main():
+    args = parse_args()
+    bodies = load_bodies(args.corpus)
+    app = Flask('relay_benchmark')
+    cached = [json.dumps(dict(json.loads(b), parsed=parse_response(json.loads(b)))).encode('utf-8') for b in bodies]
+
+    print("🔬 Analyze Relay Benchmark")
+    print("=" * 70)
+    print(f"⏰ Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"📄 {len(bodies)} replies, avg {sum(map(len, bodies)) // len(bodies)} bytes, {args.iterations} iterations per scenario")
+
+    scenarios = {
+        'upstream': (legacy_upstream, relay_upstream, bodies, bodies),
+        'upstream_parse_trim': (legacy_upstream, relay_transformed, bodies, bodies),
+        'cache_hit': (legacy_cache_hit, relay_cache_hit, cached, bodies),
+        'upstream_error': (legacy_error, relay_error, [ERROR_BODY], [ERROR_BODY]),
+    }
+    results = {}
+    with app.app_context():
+        for name, (before_func, after_func, before_inputs, after_inputs) in scenarios.items():
+            before = measure(app, before_func, before_inputs, args.iterations)
+            after = measure(app, after_func, after_inputs, args.iterations)
+            results[name] = {'before': before, 'after': after,
+                             'cpu_reduction': round(1 - after['cpu_us'] / before['cpu_us'], 3) if before['cpu_us'] else None}
+            print(f"📊 {name:<20} CPU {before['cpu_us']:>7}µs → {after['cpu_us']:>7}µs   "
+                  f"peak alloc {before['peak_alloc_kb']:>6}KB → {after['peak_alloc_kb']:>6}KB")
+        background = measure(app, ledger_usage, bodies, args.iterations)
+    print(f"🧵 Usage read on the ledger thread: {background['cpu_us']}µs per reply (off the request path)")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {'replies': len(bodies), 'source': args.corpus or 'mock', 'iterations': args.iterations},
+        'results': results,
+        'background_ledger_usage': background,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_FOLDER, f"analyze_relay_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
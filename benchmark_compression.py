@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Compression Frontier Benchmark - Size / quality / latency sweep over photosamples
+Encodes every photo in the corpus at every max-width x JPEG quality x encoder
+option combination using a process pool across all cores, records encoded
+bytes, encode time, estimated Claude image tokens and fidelity (PSNR), and
+optionally analysis agreement against the mock upstream or a real server.
+Writes the Pareto-optimal settings plus a recommended server default to JSON.
+
+Usage:
+  python3 benchmark_compression.py
+  python3 benchmark_compression.py --widths 600,800,1200,1600 --qualities 30,50,70
+  python3 benchmark_compression.py --analyze-url http://127.0.0.1:5099/v1/messages --recordings recorded_analyses
+"""
+
+import argparse
+import base64
+import glob
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import requests
+from PIL import Image, ImageChops, ImageStat
+
+try:
+    # Optional: lets HEIC photos be decoded on any OS instead of shelling out to macOS `sips`
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORTED = True
+except ImportError:
+    HEIC_SUPPORTED = False
+
+# Configuration
+PHOTOS_FOLDER = "photosamples"
+RESULTS_FOLDER = "performance_results"
+PHOTO_EXTENSIONS = ['*.jpg', '*.jpeg', '*.png', '*.heic', '*.JPG', '*.JPEG', '*.PNG', '*.HEIC']
+
+DEFAULT_WIDTHS = "400,600,800,1024,1280,1568,1600"
+DEFAULT_QUALITIES = "20,30,40,50,60,70,80,90"
+
+# Encoder option presets (name -> PIL JPEG save kwargs)
+ENCODER_OPTIONS = {
+    'baseline': {'optimize': False, 'progressive': False, 'subsampling': 2},
+    'optimized': {'optimize': True, 'progressive': False, 'subsampling': 2},
+    'progressive': {'optimize': True, 'progressive': True, 'subsampling': 2},
+    'full_chroma': {'optimize': True, 'progressive': False, 'subsampling': 0},
+}
+
+# Claude downsizes images whose long edge exceeds 1568px; token cost is ~(w*h)/750
+CLAUDE_MAX_EDGE = 1568
+CLAUDE_MAX_PIXELS = 1_150_000
+PIXELS_PER_TOKEN = 750
+
+# Fidelity is measured at a fixed size so every width is judged against the same reference
+FIDELITY_EDGE = 512
+
+
+def get_photo_files(folder):
+    """Get all photo files from the corpus folder"""
+    photos = set()
+    for ext in PHOTO_EXTENSIONS:
+        photos.update(glob.glob(os.path.join(folder, ext)))
+
+    if not HEIC_SUPPORTED:
+        heic = {p for p in photos if p.lower().endswith('.heic')}
+        if heic:
+            print(f"⚠️  Skipping {len(heic)} HEIC photos (pip install pillow-heif to include them)")
+        photos -= heic
+
+    if not photos:
+        raise FileNotFoundError(f"No photos found in {folder} folder!")
+    return sorted(photos)
+
+
+def estimate_image_tokens(width, height):
+    """Estimate Claude input tokens for an image after upstream resizing"""
+    scale = min(1.0, CLAUDE_MAX_EDGE / max(width, height), math.sqrt(CLAUDE_MAX_PIXELS / (width * height)))
+    return math.ceil((width * scale) * (height * scale) / PIXELS_PER_TOKEN)
+
+
+def fidelity_thumbnail(img):
+    """Downscale to the fixed comparison size"""
+    ratio = FIDELITY_EDGE / max(img.width, img.height)
+    size = (max(1, round(img.width * ratio)), max(1, round(img.height * ratio)))
+    return img.resize(size, Image.Resampling.BILINEAR)
+
+
+def psnr(reference, candidate):
+    """Peak signal-to-noise ratio (dB) between two same-size RGB images"""
+    diff = ImageChops.difference(reference, candidate)
+    mse = sum(v * v for v in ImageStat.Stat(diff).rms) / 3
+    if mse == 0:
+        return 99.0
+    return 20 * math.log10(255.0 / math.sqrt(mse))
+
+
+def resize_to_width(img, max_width):
+    """Resize like the app does: only shrink, keep aspect ratio"""
+    if img.width <= max_width:
+        return img
+    ratio = max_width / img.width
+    return img.resize((max_width, int(img.height * ratio)), Image.Resampling.LANCZOS)
+
+
+def encode_photo_at_width(photo_path, max_width, qualities, encoders):
+    """Worker: decode + resize one photo once, then encode it at every quality/encoder combination"""
+    with Image.open(photo_path) as source:
+        original = source.convert('RGB')
+    reference = fidelity_thumbnail(original)
+
+    resize_start = time.perf_counter()
+    resized = resize_to_width(original, max_width)
+    resize_ms = (time.perf_counter() - resize_start) * 1000
+    tokens = estimate_image_tokens(resized.width, resized.height)
+
+    rows = []
+    for encoder in encoders:
+        for quality in qualities:
+            output = io.BytesIO()
+            start = time.perf_counter()
+            resized.save(output, format='JPEG', quality=quality, **ENCODER_OPTIONS[encoder])
+            encode_ms = (time.perf_counter() - start) * 1000
+
+            encoded = output.getvalue()
+            with Image.open(io.BytesIO(encoded)) as decoded:
+                candidate = fidelity_thumbnail(decoded.convert('RGB'))
+
+            rows.append({
+                'photo': os.path.basename(photo_path),
+                'max_width': max_width,
+                'quality': quality,
+                'encoder': encoder,
+                'width': resized.width,
+                'height': resized.height,
+                'bytes': len(encoded),
+                'base64_bytes': 4 * math.ceil(len(encoded) / 3),
+                'encode_ms': round(resize_ms + encode_ms, 3),
+                'image_tokens': tokens,
+                'psnr_db': round(psnr(reference, candidate), 3),
+            })
+    return rows
+
+
+def encode_jpeg(photo_path, max_width, quality, encoder):
+    """Encode one photo at one setting (used for analysis agreement)"""
+    with Image.open(photo_path) as source:
+        resized = resize_to_width(source.convert('RGB'), max_width)
+    output = io.BytesIO()
+    resized.save(output, format='JPEG', quality=quality, **ENCODER_OPTIONS[encoder])
+    return output.getvalue()
+
+
+def setting_key(row):
+    return (row['max_width'], row['quality'], row['encoder'])
+
+
+def summarize(rows):
+    """Aggregate per-photo rows into one record per setting"""
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(setting_key(row), []).append(row)
+
+    summary = []
+    for (max_width, quality, encoder), group in grouped.items():
+        encode_times = sorted(r['encode_ms'] for r in group)
+        summary.append({
+            'max_width': max_width,
+            'quality': quality,
+            'encoder': encoder,
+            'photos': len(group),
+            'mean_bytes': round(sum(r['bytes'] for r in group) / len(group)),
+            'mean_base64_kb': round(sum(r['base64_bytes'] for r in group) / len(group) / 1024, 1),
+            'p50_encode_ms': round(encode_times[len(encode_times) // 2], 2),
+            'mean_image_tokens': round(sum(r['image_tokens'] for r in group) / len(group)),
+            'mean_psnr_db': round(sum(r['psnr_db'] for r in group) / len(group), 2),
+        })
+    return sorted(summary, key=lambda s: (s['max_width'], s['quality'], s['encoder']))
+
+
+def dominates(a, b, objectives):
+    """True if a is at least as good as b on every objective and strictly better on one"""
+    better_or_equal = all((a[k] <= b[k]) if minimize else (a[k] >= b[k]) for k, minimize in objectives)
+    strictly_better = any((a[k] < b[k]) if minimize else (a[k] > b[k]) for k, minimize in objectives)
+    return better_or_equal and strictly_better
+
+
+def pareto_front(summary, objectives):
+    """Settings that no other setting dominates"""
+    return [s for s in summary if not any(dominates(o, s, objectives) for o in summary if o is not s)]
+
+
+# ---------------------------------------------------------------------------
+# Analysis agreement (stand-in upstream or recorded responses)
+# ---------------------------------------------------------------------------
+
+AGREEMENT_PROMPT = "Analyze this meal. End with **NUTRITION_DATA:** and a ```json block containing calories, protein, carbs and fat."
+
+
+def extract_calories(response_json):
+    """Pull the calories figure out of a Messages API response"""
+    try:
+        text = response_json['content'][0]['text']
+    except (KeyError, IndexError, TypeError):
+        return None
+    match = re.search(r'"calories"\s*:\s*([\d.]+)', text)
+    return float(match.group(1)) if match else None
+
+
+def analyze_image(jpeg_bytes, analyze_url, recordings):
+    """Analyze an encoded image, replaying a recorded response when one exists"""
+    digest = hashlib.sha256(jpeg_bytes).hexdigest()
+    recording = os.path.join(recordings, f"{digest}.json") if recordings else None
+    if recording and os.path.exists(recording):
+        with open(recording) as f:
+            return extract_calories(json.load(f))
+    if not analyze_url:
+        return None
+
+    payload = {
+        'model': 'claude-sonnet-4-5-20250929',
+        'max_tokens': 1000,
+        'messages': [{'role': 'user', 'content': [
+            {'type': 'image', 'source': {'type': 'base64', 'media_type': 'image/jpeg',
+                                         'data': base64.b64encode(jpeg_bytes).decode('ascii')}},
+            {'type': 'text', 'text': AGREEMENT_PROMPT},
+        ]}]
+    }
+    headers = {'Content-Type': 'application/json', 'anthropic-version': '2023-06-01'}
+    if os.environ.get('ANTHROPIC_API_KEY'):
+        headers['x-api-key'] = os.environ['ANTHROPIC_API_KEY']
+
+    response = requests.post(analyze_url, headers=headers, json=payload, timeout=120)
+    if response.status_code != 200:
+        print(f"    ❌ Analysis failed: HTTP {response.status_code}")
+        return None
+    result = response.json()
+    if recording:
+        os.makedirs(recordings, exist_ok=True)
+        with open(recording, 'w') as f:
+            json.dump(result, f)
+    return extract_calories(result)
+
+
+def measure_agreement(photos, candidates, reference, analyze_url, recordings):
+    """Mean calorie agreement (1 - mean abs. relative error) of each candidate vs the reference setting"""
+    reference_calories = {}
+    for photo in photos:
+        reference_calories[photo] = analyze_image(encode_jpeg(photo, *reference), analyze_url, recordings)
+
+    for candidate in candidates:
+        errors = []
+        for photo in photos:
+            expected = reference_calories[photo]
+            actual = analyze_image(encode_jpeg(photo, candidate['max_width'], candidate['quality'], candidate['encoder']),
+                                   analyze_url, recordings)
+            if expected and actual is not None:
+                errors.append(abs(actual - expected) / expected)
+        candidate['agreement'] = round(1 - sum(errors) / len(errors), 4) if errors else None
+        print(f"  🎯 {candidate['max_width']}px q{candidate['quality']} {candidate['encoder']}: agreement={candidate['agreement']}")
+
+
+def recommend(front, min_psnr, min_agreement):
+    """Smallest upload on the frontier that still meets the fidelity/agreement floor"""
+    eligible = [s for s in front if s['mean_psnr_db'] >= min_psnr
+                and (s.get('agreement') is None or s['agreement'] >= min_agreement)]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda s: (s['mean_bytes'], s['p50_encode_ms']))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep JPEG settings over the photo corpus and report the Pareto frontier")
+    parser.add_argument('--photos', default=PHOTOS_FOLDER, help="Photo corpus folder")
+    parser.add_argument('--widths', default=DEFAULT_WIDTHS, help="Comma-separated max widths")
+    parser.add_argument('--qualities', default=DEFAULT_QUALITIES, help="Comma-separated JPEG qualities (1-95)")
+    parser.add_argument('--encoders', default=','.join(ENCODER_OPTIONS), help="Comma-separated encoder presets")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Process pool size (default: all cores)")
+    parser.add_argument('--analyze-url', default=None, help="Messages endpoint for agreement checks (mock upstream or real)")
+    parser.add_argument('--recordings', default=None, help="Folder of recorded responses to replay/record")
+    parser.add_argument('--reference', default='1600,90,optimized', help="Reference setting for agreement: width,quality,encoder")
+    parser.add_argument('--min-psnr', type=float, default=32.0, help="Fidelity floor for the recommended setting")
+    parser.add_argument('--min-agreement', type=float, default=0.95, help="Agreement floor for the recommended setting")
+    parser.add_argument('--output', default=None, help="Where to write the JSON report")
+    return parser.parse_args()
+
+
+def run_compression_benchmark():
+    args = parse_args()
+    widths = [int(w) for w in args.widths.split(',')]
+    qualities = [int(q) for q in args.qualities.split(',')]
+    encoders = [e for e in args.encoders.split(',') if e in ENCODER_OPTIONS]
+
+    print("🔬 Compression Frontier Benchmark")
+    print("=" * 70)
+    print(f"⏰ Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    photos = get_photo_files(args.photos)
+    print(f"📸 Found {len(photos)} photos")
+    print(f"🧮 Grid: {len(widths)} widths x {len(qualities)} qualities x {len(encoders)} encoders "
+          f"= {len(widths) * len(qualities) * len(encoders)} settings on {args.workers} processes")
+
+    rows = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(encode_photo_at_width, photo, width, qualities, encoders): (photo, width)
+                   for photo in photos for width in widths}
+        for future in as_completed(futures):
+            photo, width = futures[future]
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                print(f"    ❌ {os.path.basename(photo)} @ {width}px failed: {e}")
+    print(f"✓ Encoded {len(rows)} images in {time.perf_counter() - start:.1f}s")
+
+    summary = summarize(rows)
+    objectives = [('mean_bytes', True), ('p50_encode_ms', True), ('mean_image_tokens', True), ('mean_psnr_db', False)]
+    front = pareto_front(summary, objectives)
+
+    if args.analyze_url or args.recordings:
+        print(f"\n🎯 Measuring analysis agreement for {len(front)} frontier settings")
+        ref_width, ref_quality, ref_encoder = args.reference.split(',')
+        measure_agreement(photos, front, (int(ref_width), int(ref_quality), ref_encoder),
+                          args.analyze_url, args.recordings)
+        if any(s.get('agreement') is not None for s in front):
+            front = pareto_front(front, objectives + [('agreement', False)])
+
+    best = recommend(front, args.min_psnr, args.min_agreement)
+
+    print(f"\n📊 PARETO FRONTIER ({len(front)} of {len(summary)} settings)")
+    print("=" * 70)
+    for s in sorted(front, key=lambda s: s['mean_bytes']):
+        agreement = f" agreement={s['agreement']}" if s.get('agreement') is not None else ""
+        print(f"  {s['max_width']:>5}px q{s['quality']:<3} {s['encoder']:<12} {s['mean_base64_kb']:>8.1f}KB "
+              f"{s['p50_encode_ms']:>7.1f}ms {s['mean_image_tokens']:>5} tok {s['mean_psnr_db']:>5.1f}dB{agreement}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'photos': len(photos),
+        'grid': {'widths': widths, 'qualities': qualities, 'encoders': encoders},
+        'settings': summary,
+        'pareto_front': front,
+        'recommended': best,
+        # Drop-in values for the server's image preprocessing configuration
+        'server_defaults': {
+            'IMAGE_MAX_WIDTH': best['max_width'],
+            'IMAGE_JPEG_QUALITY': best['quality'],
+            'IMAGE_JPEG_ENCODER': best['encoder'],
+        } if best else None,
+    }
+
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_FOLDER, f"compression_frontier_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if best:
+        print(f"\n🏆 RECOMMENDED: {best['max_width']}px q{best['quality']} {best['encoder']} "
+              f"({best['mean_base64_kb']:.1f}KB, {best['mean_psnr_db']:.1f}dB)")
+    else:
+        print(f"\n⚠️  No frontier setting meets PSNR >= {args.min_psnr}dB")
+    print(f"💾 Results saved to: {output}")
+    print("✅ Compression benchmark completed!")
+
+
+if __name__ == "__main__":
+    run_compression_benchmark()
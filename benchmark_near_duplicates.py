@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Benchmark - Perceptual-hash hit and false-match rates over photosamples
+Re-encodes every photo the way the app sends it, then derives re-shoot-like
+variants (recompressed, rescaled, cropped, shifted, brighter, slightly
+rotated) and measures, for every pHash radius with the dHash confirmation
+used by near_duplicates.py:
+
+  - hit rate: variants found within the radius of their own photo
+  - false-match rate: pairs of different corpus photos found within it
+  - hashing time per photo and multi-index vs linear-scan lookup time
+
+Every corpus photo is treated as a different meal, so photos of the same
+dish on different days count as false matches here; read the false-match
+rate as an upper bound. Writes the sweep and the largest radius that stays
+under --max-false-rate to JSON.
+
+Usage:
+  python3 benchmark_near_duplicates.py
+  python3 benchmark_near_duplicates.py --confirm-distance 12 --max-false-rate 0.001
+  python3 benchmark_near_duplicates.py --photos photosamples --index-size 2000
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import combinations
+
+from PIL import Image, ImageEnhance, ImageOps
+
+from near_duplicates import MultiIndexHash, hamming, image_hashes
+
+try:
+    # Optional: lets HEIC photos be decoded on any OS instead of shelling out to macOS `sips`
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORTED = True
+except ImportError:
+    HEIC_SUPPORTED = False
+
+# Configuration
+PHOTOS_FOLDER = "photosamples"
+RESULTS_FOLDER = "performance_results"
+PHOTO_EXTENSIONS = ['*.jpg', '*.jpeg', '*.png', '*.heic', '*.JPG', '*.JPEG', '*.PNG', '*.HEIC']
+
+# What the app uploads: long edge capped, JPEG
+APP_MAX_WIDTH = 1024
+APP_QUALITY = 70
+
+MAX_RADIUS = 16
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure perceptual-hash near-duplicate matching on a photo corpus")
+    parser.add_argument('--photos', default=PHOTOS_FOLDER, help="Corpus folder")
+    parser.add_argument('--confirm-distance', type=int, default=12, help="dHash distance a pHash match must also meet")
+    parser.add_argument('--max-false-rate', type=float, default=0.001, help="False-match rate the recommendation must stay under")
+    parser.add_argument('--index-size', type=int, default=500, help="Entries per simulated user index for lookup timing")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processes for decoding and hashing")
+    parser.add_argument('--output', default=None, help="Where to write the JSON report")
+    return parser.parse_args()
+
+
+def get_photo_files(folder):
+    photos = set()
+    for ext in PHOTO_EXTENSIONS:
+        photos.update(glob.glob(os.path.join(folder, ext)))
+    if not HEIC_SUPPORTED:
+        heic = {p for p in photos if p.lower().endswith('.heic')}
+        if heic:
+            print(f"⚠️  Skipping {len(heic)} HEIC photos (pip install pillow-heif to include them)")
+        photos -= heic
+    if not photos:
+        raise FileNotFoundError(f"No photos found in {folder} folder!")
+    return sorted(photos)
+
+
+def encode(img, quality=APP_QUALITY):
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def variants(img):
+    """Edits a second photo of the same plate (or a re-upload) typically differs by"""
+    width, height = img.size
+    crop = lambda fx, fy, fw, fh: img.crop((int(width * fx), int(height * fy), int(width * fw), int(height * fh)))
+    return {
+        'recompressed_q40': encode(img, 40),
+        'resized_600': encode(img.resize((600, max(1, int(height * 600 / width))), Image.Resampling.LANCZOS)),
+        'cropped_5pct': encode(crop(0.05, 0.05, 0.95, 0.95)),
+        'shifted_8pct': encode(crop(0.08, 0.0, 1.0, 0.92)),
+        'brighter_15pct': encode(ImageEnhance.Brightness(img).enhance(1.15)),
+        'rotated_3deg': encode(img.rotate(3, resample=Image.Resampling.BILINEAR, expand=False)),
+    }
+
+
+def process_photo(path):
+    """Worker: app-encode one photo, hash it and its variants"""
+    with Image.open(path) as source:
+        img = ImageOps.exif_transpose(source).convert('RGB')
+    if img.width > APP_MAX_WIDTH:
+        img = img.resize((APP_MAX_WIDTH, int(img.height * APP_MAX_WIDTH / img.width)), Image.Resampling.LANCZOS)
+    data = encode(img)
+    started = time.perf_counter()
+    hashes = image_hashes(data)
+    hash_ms = (time.perf_counter() - started) * 1000
+    return {
+        'photo': os.path.basename(path),
+        'bytes': len(data),
+        'hash_ms': hash_ms,
+        'hashes': hashes,
+        'variants': {name: image_hashes(variant) for name, variant in variants(img).items()},
+    }
+
+
+def matches(a, b, radius, confirm):
+    return hamming(a[0], b[0]) <= radius and hamming(a[1], b[1]) <= confirm
+
+
+def lookup_timing(photos, index_size, radius, rng):
+    """Mean µs per lookup in one user's index: multi-index hashing vs comparing against every entry"""
+    entries = [p['hashes'] for p in photos]
+    while len(entries) < index_size:
+        entries.append((rng.getrandbits(64), rng.getrandbits(64)))
+    entries = entries[:index_size]
+    index = MultiIndexHash()
+    for i, (phash_value, dhash_value) in enumerate(entries):
+        index.add(phash_value, (i, dhash_value))
+    queries = [v for p in photos for v in p['variants'].values()][:500]
+
+    started = time.perf_counter()
+    for query in queries:
+        index.search(query[0], radius)
+    index_us = (time.perf_counter() - started) / len(queries) * 1e6
+
+    started = time.perf_counter()
+    for query in queries:
+        [e for e in entries if hamming(query[0], e[0]) <= radius]
+    scan_us = (time.perf_counter() - started) / len(queries) * 1e6
+    return {'index_size': index_size, 'radius': radius,
+            'multi_index_us': round(index_us, 1), 'linear_scan_us': round(scan_us, 1)}
+
+
+def main():
+    args = parse_args()
+    photos_files = get_photo_files(args.photos)
+
+    print("🔬 Near-Duplicate Benchmark")
+    print("=" * 70)
+    print(f"⏰ Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"📸 {len(photos_files)} photos, dHash confirmation ≤ {args.confirm_distance}")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        photos = list(pool.map(process_photo, photos_files))
+
+    variant_names = list(photos[0]['variants'])
+    pairs = list(combinations(range(len(photos)), 2))
+    sweep = []
+    for radius in range(MAX_RADIUS + 1):
+        hits = {name: sum(matches(p['variants'][name], p['hashes'], radius, args.confirm_distance) for p in photos) / len(photos)
+                for name in variant_names}
+        false = sum(matches(photos[i]['hashes'], photos[j]['hashes'], radius, args.confirm_distance) for i, j in pairs)
+        sweep.append({
+            'phash_radius': radius,
+            'hit_rate': round(sum(hits.values()) / len(hits), 4),
+            'hit_rate_by_variant': {name: round(rate, 4) for name, rate in hits.items()},
+            'false_matches': false,
+            'false_match_rate': round(false / len(pairs), 6) if pairs else None,
+        })
+
+    print(f"\n{'radius':>6} {'hit rate':>9} {'false':>7} {'false rate':>11}")
+    for row in sweep:
+        print(f"{row['phash_radius']:>6} {row['hit_rate']:>9.1%} {row['false_matches']:>7} "
+              f"{(row['false_match_rate'] or 0):>11.4%}")
+
+    eligible = [row for row in sweep if row['false_match_rate'] is not None and row['false_match_rate'] <= args.max_false_rate]
+    recommended = max(eligible, key=lambda row: row['phash_radius']) if eligible else None
+    if recommended:
+        print(f"\n🎯 NEAR_DUPLICATE_MAX_DISTANCE={recommended['phash_radius']}: "
+              f"{recommended['hit_rate']:.1%} hits, {recommended['false_match_rate']:.4%} false matches")
+
+    hash_times = sorted(p['hash_ms'] for p in photos)
+    timing = {
+        'hash_ms_p50': round(hash_times[len(hash_times) // 2], 2),
+        'hash_ms_max': round(hash_times[-1], 2),
+        'lookup': lookup_timing(photos, args.index_size, recommended['phash_radius'] if recommended else 6,
+                                random.Random(42)),
+    }
+    print(f"⏱️  Hashing p50 {timing['hash_ms_p50']}ms; lookup in {args.index_size} entries: "
+          f"multi-index {timing['lookup']['multi_index_us']}µs vs scan {timing['lookup']['linear_scan_us']}µs")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {'photos': len(photos), 'pairs': len(pairs), 'confirm_distance': args.confirm_distance,
+                   'max_false_rate': args.max_false_rate, 'app_max_width': APP_MAX_WIDTH, 'app_quality': APP_QUALITY},
+        'sweep': sweep,
+        'recommended': recommended,
+        'timing': timing,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_FOLDER, f"near_duplicates_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Nutrition Parsing Benchmark - Server-side NUTRITION_DATA parsing over recorded replies
+Runs nutrition_data.parse_analysis() over a corpus of recorded analyze
+replies (Messages API JSON files, as written by the server with
+ANALYZE_RECORD_DIR set) and reports:
+
+  - parse time per reply (p50/p95/p99/max) and replies per second
+  - status counts: complete, partial (cut off), legacy, invalid, missing
+  - how many replies the app's own parser (a port of the regex +
+    JSON.parse path in src/services/api.js and its plain-text fallback)
+    would have read, and how many the server recovers on top of it
+
+Without a corpus (or with --synthetic) it builds one from the mock
+upstream's reply with the damage seen in practice: truncation at max_tokens,
+trailing commas, numbers written as text, the legacy plain-text format and
+replies with no nutrition data.
+
+Usage:
+  python3 benchmark_nutrition_parsing.py --corpus recorded_analyses/
+  python3 benchmark_nutrition_parsing.py --synthetic 5000
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime
+
+from mock_anthropic_server import CANNED_TEXT
+from nutrition_data import LEGACY_MACROS, parse_analysis, response_text
+
+# Configuration
+RESULTS_FOLDER = "performance_results"
+
+# src/services/api.js extractNutritionData()
+APP_PATTERN = re.compile(r'\*\*NUTRITION_DATA:\*\*\s*```(?:json)?\s*(\{[\s\S]*?\})\s*```', re.I)
+
+LEGACY_TEXT = """**Title:** Turkey Sandwich
+
+A turkey sandwich on wheat with cheese.
+
+**Macros:**
+- Calories: 1,020 kcal
+- Protein: 48g
+- Fat: 38g
+- Net Carbs: 112g
+
+**Processed Food:**
+- Processed calories: 600 kcal
+- Processed percent: 59%"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark server-side parsing of analysis replies")
+    parser.add_argument('--corpus', default=None, help="Folder of recorded Messages API replies (*.json)")
+    parser.add_argument('--synthetic', type=int, default=0, help="Generate this many replies instead of reading a corpus")
+    parser.add_argument('--repeat', type=int, default=3, help="Timing passes over the corpus")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Where to write the JSON report")
+    return parser.parse_args()
+
+
+def load_corpus(folder):
+    texts = []
+    for path in sorted(glob.glob(os.path.join(folder, '*.json'))):
+        with open(path) as f:
+            texts.append(response_text(json.load(f)))
+    return texts
+
+
+def synthetic_corpus(count, rng):
+    """Replies shaped like production ones, a share of them damaged"""
+    block_start = CANNED_TEXT.index('{')
+    texts = []
+    for _ in range(count):
+        roll = rng.random()
+        calories = rng.randint(150, 1400)
+        text = CANNED_TEXT.replace('"calories": 510', f'"calories": {calories}')
+        if roll < 0.70:
+            pass
+        elif roll < 0.80:
+            # max_tokens hit somewhere inside the JSON block
+            text = text[:rng.randint(block_start + 80, len(text) - 4)]
+        elif roll < 0.85:
+            text = text.replace('"certainty": 7', '"certainty": 7,')
+        elif roll < 0.90:
+            text = text.replace(f'"calories": {calories}', f'"calories": "{calories - 50}-{calories + 50} kcal"')
+        elif roll < 0.95:
+            text = LEGACY_TEXT
+        else:
+            text = "Which meal: oatmeal or granola?"
+        texts.append(text)
+    return texts
+
+
+def app_parse(text):
+    """True if the app would have read the macros (JSON block, else the legacy regexes)"""
+    match = APP_PATTERN.search(text)
+    if match:
+        try:
+            data = json.loads(match.group(1).strip())
+            if all(isinstance(data.get(field), (int, float)) and not isinstance(data.get(field), bool)
+                   for field in ('calories', 'protein', 'fat', 'carbs')):
+                return True
+        except ValueError:
+            pass
+    end = text[-1500:]
+    return all(pattern.search(end) for pattern in LEGACY_MACROS.values())
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    if args.corpus and not args.synthetic:
+        texts = load_corpus(args.corpus)
+        source = args.corpus
+        if not texts:
+            raise FileNotFoundError(f"No *.json replies found in {args.corpus}")
+    else:
+        texts = synthetic_corpus(args.synthetic or 2000, rng)
+        source = 'synthetic'
+
+    print("🔬 Nutrition Parsing Benchmark")
+    print("=" * 70)
+    print(f"⏰ Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"📄 {len(texts)} replies ({source})")
+
+    statuses = Counter()
+    app_ok = server_ok = recovered = 0
+    for text in texts:
+        parsed = parse_analysis(text)
+        statuses[parsed['status']] += 1
+        ok = parsed['macros'] is not None
+        app = app_parse(text)
+        server_ok += ok
+        app_ok += app
+        recovered += ok and not app
+
+    timings = []
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in texts:
+            t0 = time.perf_counter()
+            parse_analysis(text)
+            timings.append((time.perf_counter() - t0) * 1e6)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+
+    app_started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in texts:
+            app_parse(text)
+    app_us = (time.perf_counter() - app_started) / (len(texts) * args.repeat) * 1e6
+
+    timing = {
+        'parse_us_p50': round(percentile(timings, 50), 1),
+        'parse_us_p95': round(percentile(timings, 95), 1),
+        'parse_us_p99': round(percentile(timings, 99), 1),
+        'parse_us_max': round(timings[-1], 1),
+        'replies_per_second': round(len(timings) / elapsed),
+        'app_parser_us_mean': round(app_us, 1),
+    }
+    outcome = {
+        'statuses': dict(statuses),
+        'server_macros': server_ok,
+        'app_macros': app_ok,
+        'recovered_by_server': recovered,
+    }
+
+    print(f"\n📊 Statuses: {', '.join(f'{k} {v}' for k, v in statuses.most_common())}")
+    print(f"✅ Macros read: server {server_ok}/{len(texts)}, app {app_ok}/{len(texts)} "
+          f"({recovered} recovered server-side)")
+    print(f"⏱️  Parse p50 {timing['parse_us_p50']}µs, p99 {timing['parse_us_p99']}µs, "
+          f"{timing['replies_per_second']:,} replies/s (app parser {timing['app_parser_us_mean']}µs)")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {'source': source, 'replies': len(texts), 'repeat': args.repeat, 'seed': args.seed},
+        'outcome': outcome,
+        'timing': timing,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_FOLDER, f"nutrition_parsing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
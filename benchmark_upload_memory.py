@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Upload Memory Benchmark - Peak RSS per analyze request, base64 JSON vs multipart
+Launches server_cloud.py (one gunicorn worker, one thread) against the mock
+Anthropic upstream and sends the same templated analyze request as
+
+  - json: images base64-encoded inside the JSON body (the app's old format)
+  - multipart: raw image parts in multipart/form-data, spooled to temp files
+
+For every request the worker's peak RSS is reset (Linux /proc/<pid>/clear_refs)
+and read back afterwards (VmHWM), so each sample is the extra memory that one
+request needed on top of the resident baseline. Also reports upload bytes and
+latency. Images are random bytes behind a JPEG header: the server only sniffs
+the type and the mock upstream never decodes them, and random data can't be
+compressed away in transit.
+
+Usage:
+  python3 benchmark_upload_memory.py
+  python3 benchmark_upload_memory.py --images 3 --image-kb 1500 --requests 30
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+from benchmark_server import gunicorn_cmd, start_process, stop_process, wait_for_http
+
+# Configuration
+RESULTS_FOLDER = "performance_results"
+JPEG_HEADER = b'\xff\xd8\xff\xe0'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure per-request peak RSS of JSON vs multipart analyze uploads")
+    parser.add_argument('--images', type=int, default=3, help="Images per request")
+    parser.add_argument('--image-kb', type=int, default=1500, help="Size of each image")
+    parser.add_argument('--requests', type=int, default=20, help="Requests per format")
+    parser.add_argument('--port', type=int, default=5070)
+    parser.add_argument('--upstream-port', type=int, default=5071)
+    parser.add_argument('--output', default=None, help="Where to write the JSON report")
+    return parser.parse_args()
+
+
+def proc_status_kb(pid, field):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return None
+
+
+def reset_peak(pid):
+    """Reset the process's peak RSS to its current RSS; False where the kernel doesn't allow it"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def send(base_url, mode, images):
+    prompt = {'id': 'analyze', 'variables': {'description': 'lunch plate', 'multiple_dishes': True}}
+    if mode == 'json':
+        body = json.dumps({'prompt': prompt, 'images': [base64.b64encode(i).decode('ascii') for i in images]})
+        request = requests.Request('POST', f"{base_url}/api/analyze", data=body,
+                                   headers={'Content-Type': 'application/json'})
+    else:
+        request = requests.Request('POST', f"{base_url}/api/analyze", data={'prompt': json.dumps(prompt)},
+                                   files=[('image', (f"{n}.jpg", image, 'image/jpeg')) for n, image in enumerate(images)])
+    prepared = request.prepare()
+    started = time.perf_counter()
+    response = requests.Session().send(prepared, timeout=120)
+    latency_ms = (time.perf_counter() - started) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"{mode} analyze failed ({response.status_code}): {response.text[:300]}")
+    return len(prepared.body), latency_ms
+
+
+def run_mode(base_url, pid, mode, images, count):
+    samples, latencies = [], []
+    upload_bytes = None
+    peaks_reset = True
+    send(base_url, mode, images)  # warm-up: imports, first connection, allocator growth
+    for _ in range(count):
+        peaks_reset = reset_peak(pid) and peaks_reset
+        baseline = proc_status_kb(pid, 'VmRSS')
+        upload_bytes, latency_ms = send(base_url, mode, images)
+        samples.append(proc_status_kb(pid, 'VmHWM') - baseline)
+        latencies.append(latency_ms)
+    samples.sort()
+    return {
+        'upload_bytes': upload_bytes,
+        'peak_rss_growth_kb_p50': samples[len(samples) // 2],
+        'peak_rss_growth_kb_max': samples[-1],
+        'worker_rss_kb_after': proc_status_kb(pid, 'VmRSS'),
+        'latency_ms_p50': round(statistics.median(latencies), 1),
+        # Without clear_refs the high-water mark only ever grows, so growth reads 0 after the first request
+        'per_request_peaks': peaks_reset,
+    }
+
+
+def main():
+    args = parse_args()
+    images = [JPEG_HEADER + os.urandom(args.image_kb * 1024 - len(JPEG_HEADER)) for _ in range(args.images)]
+
+    print("🔬 Upload Memory Benchmark")
+    print("=" * 70)
+    print(f"⏰ Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"📸 {args.images} images x {args.image_kb} KB, {args.requests} requests per format")
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    scratch = tempfile.mkdtemp(prefix='fuell_upload_bench_')
+    upstream = server = None
+    results = {}
+    try:
+        upstream = start_process(gunicorn_cmd('mock_anthropic_server:app', args.upstream_port, 1, 8),
+                                 {'MOCK_LATENCY_MS': '5', 'MOCK_JITTER_MS': '0'}, "mock upstream")
+        wait_for_http(upstream_url + '/', upstream, "mock upstream")
+        server = start_process(gunicorn_cmd('server_cloud:app', args.port, 1, 1), {
+            'DATABASE_URL': f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+            'ANTHROPIC_API_KEY': 'benchmark-key',
+            'ANTHROPIC_API_URL': upstream_url + '/v1/messages',
+            'ANALYZE_RATE_PER_MINUTE': '1000000',
+            'ANALYZE_BURST': '1000000',
+            'ADMISSION_DB_PATH': os.path.join(scratch, 'admission.db'),
+            'CACHE_DB_PATH': os.path.join(scratch, 'cache.db'),
+            'METRICS_DIR': os.path.join(scratch, 'metrics'),
+            # Every request must take the full upload -> upstream path
+            'ANALYZE_CACHE_TTL_SECONDS': '0',
+            'ANALYZE_NEAR_DUPLICATES': 'off',
+            'MAX_REQUEST_BYTES': str(64 * 1024 * 1024),
+        }, "server_cloud.py")
+        wait_for_http(base_url + '/', server, "server_cloud.py")
+        pid = requests.get(f"{base_url}/api/health", timeout=5).json()['worker_pid']
+
+        for mode in ('json', 'multipart'):
+            results[mode] = result = run_mode(base_url, pid, mode, images, args.requests)
+            print(f"📊 {mode:<9} upload {result['upload_bytes'] / 1e6:6.2f} MB  "
+                  f"peak RSS +{result['peak_rss_growth_kb_p50'] / 1024:6.1f} MB (max +{result['peak_rss_growth_kb_max'] / 1024:.1f})  "
+                  f"p50 {result['latency_ms_p50']}ms")
+    finally:
+        stop_process(server, "server_cloud.py")
+        stop_process(upstream, "mock upstream")
+
+    if results.get('json') and results.get('multipart'):
+        saved = results['json']['peak_rss_growth_kb_p50'] - results['multipart']['peak_rss_growth_kb_p50']
+        print(f"\n🎯 Multipart: {1 - results['multipart']['upload_bytes'] / results['json']['upload_bytes']:.0%} fewer upload bytes, "
+              f"{saved / 1024:.1f} MB less peak RSS per request")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {'images': args.images, 'image_kb': args.image_kb, 'requests': args.requests},
+        'results': results,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_FOLDER, f"upload_memory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
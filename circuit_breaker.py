@@ -0,0 +1,150 @@
+"""
+Circuit breaker for the Anthropic upstream
+Tracks the outcome and latency of recent analyze calls in a rolling window.
+When too many fail (or are too slow) the circuit opens and calls fail fast
+with 503 instead of pinning a gunicorn worker for up to the 120 s timeout.
+After a cool-down a limited number of half-open trial calls probe the
+upstream: success closes the circuit, failure opens it again.
+
+State is per worker process; every worker sees the same upstream, so each
+one trips after a handful of its own failures.
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """Upstream is considered down; retry_after is a hint in seconds for the Retry-After header"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class CircuitBreaker:
+    """Rolling error-rate/slow-call breaker with half-open probing"""
+
+    def __init__(self, metrics=None, window_seconds=60, min_calls=10, error_threshold=0.5,
+                 slow_call_seconds=None, slow_threshold=0.5, open_seconds=30, half_open_probes=2):
+        self.metrics = metrics
+        self.window_seconds = window_seconds
+        # Don't judge the upstream on a handful of calls
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        # None: only the error rate opens the circuit
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_threshold = slow_threshold
+        self.open_seconds = open_seconds
+        # Trial calls let through (concurrently) while half-open; all must succeed to close
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._calls = deque()  # (finished_at, failed, slow)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._last_reason = None
+
+    # -- call lifecycle -----------------------------------------------------
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpen; returns True if the call is a half-open probe"""
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.time()
+                if remaining > 0:
+                    self._inc('circuit_rejected_total')
+                    raise CircuitOpen('Meal analysis is temporarily unavailable, please retry shortly', remaining)
+                self._transition(HALF_OPEN, 'cool-down elapsed')
+
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight + self._probe_successes >= self.half_open_probes:
+                    self._inc('circuit_rejected_total')
+                    raise CircuitOpen('Meal analysis is recovering, please retry shortly', 1)
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def record(self, failed, latency_seconds, probe=False):
+        """Report the outcome of an admitted call"""
+        slow = self.slow_call_seconds is not None and latency_seconds >= self.slow_call_seconds
+        now = time.time()
+        with self._lock:
+            if probe:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if self._state != HALF_OPEN:
+                    return
+                if failed or slow:
+                    self._open(now, 'half-open probe ' + ('failed' if failed else 'was slow'))
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._calls.clear()
+                    self._transition(CLOSED, 'half-open probes succeeded')
+                return
+
+            self._calls.append((now, failed, slow))
+            self._prune(now)
+            if self._state != CLOSED or len(self._calls) < self.min_calls:
+                return
+            total = len(self._calls)
+            error_rate = sum(1 for _, f, _ in self._calls if f) / total
+            slow_rate = sum(1 for _, _, s in self._calls if s) / total
+            if error_rate >= self.error_threshold:
+                self._open(now, f"error rate {error_rate:.0%} over last {total} calls")
+            elif slow_rate >= self.slow_threshold:
+                self._open(now, f"slow-call rate {slow_rate:.0%} over last {total} calls")
+
+    def cancel_probe(self):
+        """A half-open probe never reached the upstream (e.g. no slot); let another call try"""
+        with self._lock:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def is_open(self):
+        """True while calls are being refused (used to stop retrying mid-request)"""
+        with self._lock:
+            return self._state == OPEN
+
+    def state(self):
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            total = len(self._calls)
+            return {
+                'state': self._state,
+                'reason': self._last_reason,
+                'calls_in_window': total,
+                'error_rate': round(sum(1 for _, f, _ in self._calls if f) / total, 3) if total else None,
+                'slow_rate': round(sum(1 for _, _, s in self._calls if s) / total, 3) if total else None,
+                'retry_after': max(0, round(self._opened_at + self.open_seconds - now, 1)) if self._state == OPEN else None,
+                'window_seconds': self.window_seconds,
+            }
+
+    # -- internals ----------------------------------------------------------
+
+    def _prune(self, now):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _open(self, now, reason):
+        self._opened_at = now
+        self._inc('circuit_opened_total')
+        self._transition(OPEN, reason)
+
+    def _transition(self, state, reason):
+        print(f"⚡ Upstream circuit {self._state} -> {state} ({reason})")
+        self._state = state
+        self._last_reason = reason
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _inc(self, name):
+        if self.metrics is not None:
+            self.metrics.inc(name)
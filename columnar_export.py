@@ -0,0 +1,203 @@
+"""
+Columnar export of meals for analytics (Parquet or Arrow IPC)
+Meals are read in batches from storage.meal_batches() (a server-side cursor
+over one snapshot) and written as two typed tables:
+
+    meals         one row per meal; date and meal_date as date32,
+                  created_at and logged_at (UTC) as timestamps, every
+                  nutrient as float64
+    food_items    one row per entry of a meal's food_items JSON, keyed by
+                  meal_id/position, with the meal's user_id and date repeated
+                  so per-food trends need no join
+
+Each batch becomes one Parquet row group / Arrow record batch, so memory is
+bounded by batch_rows rather than by table size. pyarrow is an optional
+dependency: only exports need it, the server runs without it.
+"""
+
+import json
+import os
+import time
+from datetime import date, datetime
+
+from storage import MEAL_EXPORT_COLUMNS, MEAL_NUMERIC_COLUMNS, meal_logged_at, parse_meal_date
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+FOOD_ITEM_NUMBERS = ('weight', 'calories', 'protein', 'carbs', 'fat', 'confidence')
+
+def available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _schemas():
+    import pyarrow as pa
+
+    meals = pa.schema(
+        [('id', pa.string()), ('user_id', pa.string()), ('date', pa.date32()), ('name', pa.string())]
+        + [(column, pa.float64()) for column in MEAL_NUMERIC_COLUMNS]
+        + [('food_item_count', pa.int32()), ('image_url', pa.string()), ('created_at', pa.timestamp('us')),
+           ('meal_date', pa.date32()), ('logged_at', pa.timestamp('us', tz='UTC'))]
+    )
+    food_items = pa.schema(
+        [('meal_id', pa.string()), ('user_id', pa.string()), ('date', pa.date32()),
+         ('position', pa.int32()), ('name', pa.string())]
+        + [(column, pa.float64()) for column in FOOD_ITEM_NUMBERS]
+        + [('source', pa.string()), ('matched', pa.bool_())]
+    )
+    return meals, food_items
+
+
+def parse_timestamp(value):
+    # created_at is TIMESTAMP (no time zone) in both backends
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def to_float(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_food_items(text):
+    """food_items is stored as JSON text; older rows may be JSON-encoded twice"""
+    try:
+        items = json.loads(text) if text else []
+        if isinstance(items, str):
+            items = json.loads(items)
+    except (TypeError, ValueError):
+        return []
+    return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+
+class MealExportWriter:
+    """Writes meal batches to <directory>/meals.<ext> and <directory>/food_items.<ext>"""
+
+    def __init__(self, directory, fmt='parquet', compression='zstd'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.meals_schema, self.food_items_schema = _schemas()
+        self.paths = {
+            'meals': os.path.join(directory, 'meals' + FORMATS[fmt]),
+            'food_items': os.path.join(directory, 'food_items' + FORMATS[fmt]),
+        }
+        if fmt == 'parquet':
+            self._meals = pq.ParquetWriter(self.paths['meals'], self.meals_schema, compression=compression)
+            self._food_items = pq.ParquetWriter(self.paths['food_items'], self.food_items_schema, compression=compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression if compression in ('zstd', 'lz4') else None)
+            self._meals = pa.ipc.new_file(self.paths['meals'], self.meals_schema, options=options)
+            self._food_items = pa.ipc.new_file(self.paths['food_items'], self.food_items_schema, options=options)
+        self.meal_rows = 0
+        self.food_item_rows = 0
+        self.unparsed_dates = 0
+        self._dates = {}
+
+    def write(self, rows):
+        """Convert one batch of MEAL_EXPORT_COLUMNS tuples and append it to both tables"""
+        if not rows:
+            return
+        # Column-major view of the batch; numeric columns already arrive as floats
+        columns = dict(zip(MEAL_EXPORT_COLUMNS, zip(*rows)))
+        dates = [self._date(value) for value in columns['date']]
+        food_items = [parse_food_items(text) for text in columns['food_items']]
+        created_at = [parse_timestamp(value) for value in columns['created_at']]
+
+        meals = {
+            'id': columns['id'],
+            'user_id': columns['user_id'],
+            'date': dates,
+            'name': columns['name'],
+            'food_item_count': [len(items) for items in food_items],
+            'image_url': columns['image_url'],
+            'created_at': created_at,
+            # Rows meal_dates.py hasn't backfilled yet get the same values it would write
+            'meal_date': [stored if isinstance(stored, date) else parsed
+                          for stored, parsed in zip(columns['meal_date'], dates)],
+            'logged_at': [stored if isinstance(stored, datetime) else meal_logged_at(meal_id, created)
+                          for stored, meal_id, created in zip(columns['logged_at'], columns['id'], created_at)],
+        }
+        for column in MEAL_NUMERIC_COLUMNS:
+            meals[column] = columns[column]
+
+        item_rows = []
+        for meal_id, user_id, meal_date, meal_items in zip(columns['id'], columns['user_id'], dates, food_items):
+            for position, item in enumerate(meal_items):
+                get = item.get
+                item_rows.append((meal_id, user_id, meal_date, position, get('name'))
+                                 + tuple(get(column) for column in FOOD_ITEM_NUMBERS)
+                                 + (get('source'), get('matched')))
+
+        pa = self._pa
+        self._meals.write_table(pa.Table.from_pydict(meals, schema=self.meals_schema))
+        if item_rows:
+            arrays = [self._array(values, field) for values, field in zip(zip(*item_rows), self.food_items_schema)]
+            self._food_items.write_table(pa.Table.from_arrays(arrays, schema=self.food_items_schema))
+        self.meal_rows += len(rows)
+        self.food_item_rows += len(item_rows)
+
+    def _array(self, values, field):
+        # Item fields come from model output: convert the whole column natively and only
+        # clean values one by one when something (a "150g" weight, a numeric name) doesn't fit
+        pa = self._pa
+        try:
+            return pa.array(values, type=field.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+            if pa.types.is_floating(field.type):
+                values = [to_float(value) for value in values]
+            elif pa.types.is_boolean(field.type):
+                values = [value if isinstance(value, bool) else None for value in values]
+            else:
+                values = [None if value is None else str(value) for value in values]
+            return pa.array(values, type=field.type)
+
+    def _date(self, value):
+        # A user logs a handful of meals per day, so the same date strings repeat throughout a batch
+        if value in self._dates:
+            return self._dates[value]
+        parsed = parse_meal_date(value)
+        if parsed is None:
+            self.unparsed_dates += 1
+        elif len(self._dates) < 100000:
+            self._dates[value] = parsed
+        return parsed
+
+    def close(self):
+        self._meals.close()
+        self._food_items.close()
+
+
+def export_meals(storage, directory, fmt='parquet', batch_rows=10000, user_id=None, compression='zstd'):
+    """Export meals (optionally one user's) into directory; returns a summary dict"""
+    started = time.perf_counter()
+    writer = MealExportWriter(directory, fmt, compression)
+    try:
+        for rows in storage.meal_batches(batch_rows, user_id):
+            writer.write(rows)
+    finally:
+        writer.close()
+    return {
+        'format': fmt,
+        'files': {name: os.path.basename(path) for name, path in writer.paths.items()},
+        'bytes': {name: os.path.getsize(path) for name, path in writer.paths.items()},
+        'meals': writer.meal_rows,
+        'food_items': writer.food_item_rows,
+        'unparsed_dates': writer.unparsed_dates,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
@@ -0,0 +1,264 @@
+"""
+Conversation sessions for analyze follow-ups
+A follow-up ("actually it was two eggs") used to resend the conversation so
+far. With a session the first analyze keeps its turns on the server (the
+user turn with its photos, Claude's full reply) and follow-ups send only
+the new text; the server rebuilds the whole upstream request from the
+stored turns.
+
+Each session is a directory under root, shared by every worker on the host:
+
+    <root>/<session_id>/session.json    model, system, max_tokens, user_id and
+                                        the messages, images replaced by file names
+    <root>/<session_id>/0_0.jpg ...     the images as raw bytes (a quarter
+                                        smaller than their base64)
+
+Files are written to temp names and moved into place with os.replace(), so
+a reader never sees half a session. Each worker also keeps recently used
+sessions in memory (fully expanded, bounded by memory_bytes) and reloads
+one when another worker has changed it since. Sessions expire ttl seconds
+after their last turn, and the least recently continued are removed once
+the directory holds more than max_bytes.
+"""
+
+import base64
+import copy
+import json
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+_EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+
+
+def _payload_bytes(messages):
+    return sum(len(block['source'].get('data', '')) for message in messages
+               if isinstance(message.get('content'), list)
+               for block in message['content'] if isinstance(block, dict) and block.get('type') == 'image')
+
+
+class SessionStore:
+    """Analyze conversations kept on local disk with an in-memory LRU in front"""
+
+    def __init__(self, root, ttl=6 * 3600, max_bytes=512 * 1024 * 1024, memory_bytes=64 * 1024 * 1024,
+                 purge_interval=60):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.purge_interval = purge_interval
+        os.makedirs(root, exist_ok=True)
+        self._memory = OrderedDict()  # session_id -> (mtime_ns, session, size)
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.created = 0
+        self.continued = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _path(self, session_id):
+        return os.path.join(self.root, session_id)
+
+    def create(self, payload, assistant_content, user_id):
+        """Start a user's session from a first analyze payload and Claude's reply; returns its ID"""
+        if not user_id:
+            raise ValueError('A session needs the user it belongs to')
+        session_id = secrets.token_urlsafe(18)
+        session = {
+            'user_id': user_id,
+            'model': payload.get('model'),
+            'max_tokens': payload.get('max_tokens'),
+            'system': payload.get('system'),
+            'messages': list(payload.get('messages') or []) + [{'role': 'assistant', 'content': assistant_content}],
+            'created_at': time.time(),
+        }
+        self._save(session_id, session)
+        self.created += 1
+        return session_id
+
+    def get(self, session_id, user_id):
+        """The session (model, system, max_tokens, messages), or None if unknown, expired or not user_id's"""
+        if not user_id or not isinstance(session_id, str) or not _SESSION_ID.match(session_id):
+            self.misses += 1
+            return None
+        path = os.path.join(self._path(session_id), 'session.json')
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.misses += 1
+            return None
+        if time.time() - stat.st_mtime > self.ttl:
+            self._remove(session_id)
+            self.misses += 1
+            return None
+        with self._lock:
+            cached = self._memory.get(session_id)
+            if cached and cached[0] == stat.st_mtime_ns:
+                self._memory.move_to_end(session_id)
+                session = cached[1]
+            else:
+                session = None
+        if session is None:
+            session = self._load(session_id, path)
+            if session is None:
+                self.misses += 1
+                return None
+            self._remember(session_id, stat.st_mtime_ns, session)
+        # Sessions hold the user's photos and history: only their owner may read or continue one
+        if session.get('user_id') != user_id:
+            self.misses += 1
+            return None
+        return session
+
+    def append(self, session_id, session, user_turn, assistant_content):
+        """Add a follow-up exchange to a session returned by get()"""
+        session = dict(session, messages=session['messages'] + [
+            user_turn, {'role': 'assistant', 'content': assistant_content}])
+        self._save(session_id, session)
+        self.continued += 1
+
+    def follow_up_messages(self, session, user_turn):
+        """The stored turns plus the new one, with the stored part marked as a prompt-cache prefix"""
+        messages = session['messages'][:-1] + [copy.deepcopy(session['messages'][-1])]
+        last = messages[-1]
+        if isinstance(last.get('content'), str):
+            last['content'] = [{'type': 'text', 'text': last['content']}]
+        if last['content']:
+            last['content'][-1]['cache_control'] = {'type': 'ephemeral'}
+        return messages + [user_turn]
+
+    # -- disk --------------------------------------------------------------------
+
+    def _save(self, session_id, session):
+        directory = self._path(session_id)
+        os.makedirs(directory, exist_ok=True)
+        stored = dict(session, messages=[])
+        for m, message in enumerate(session['messages']):
+            content = message.get('content')
+            if isinstance(content, list):
+                blocks = []
+                for b, block in enumerate(content):
+                    source = block.get('source') if isinstance(block, dict) and block.get('type') == 'image' else None
+                    if source and source.get('type') == 'base64':
+                        # Turns are only ever appended, so an image keeps its file name for the session's lifetime
+                        name = f"{m}_{b}.{_EXTENSIONS.get(source.get('media_type'), 'bin')}"
+                        path = os.path.join(directory, name)
+                        if not os.path.exists(path):
+                            self._write(path, base64.b64decode(source['data']))
+                        block = {'type': 'image', 'source': {'type': 'file', 'media_type': source.get('media_type'), 'file': name}}
+                    blocks.append(block)
+                message = dict(message, content=blocks)
+            stored['messages'].append(message)
+        path = os.path.join(directory, 'session.json')
+        self._write(path, json.dumps(stored).encode('utf-8'))
+        self._remember(session_id, os.stat(path).st_mtime_ns, session)
+        self._maybe_purge()
+
+    @staticmethod
+    def _write(path, data):
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    def _load(self, session_id, path):
+        try:
+            with open(path, 'rb') as f:
+                session = json.loads(f.read())
+            directory = self._path(session_id)
+            for message in session['messages']:
+                if not isinstance(message.get('content'), list):
+                    continue
+                for block in message['content']:
+                    source = block.get('source') if isinstance(block, dict) else None
+                    if source and source.get('type') == 'file':
+                        with open(os.path.join(directory, os.path.basename(source['file'])), 'rb') as f:
+                            data = base64.b64encode(f.read()).decode('ascii')
+                        block['source'] = {'type': 'base64', 'media_type': source['media_type'], 'data': data}
+            return session
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Could not load session {session_id}: {e}")
+            return None
+
+    def _remove(self, session_id):
+        shutil.rmtree(self._path(session_id), ignore_errors=True)
+        with self._lock:
+            cached = self._memory.pop(session_id, None)
+            if cached:
+                self._memory_size -= cached[2]
+
+    # -- memory ------------------------------------------------------------------
+
+    def _remember(self, session_id, mtime_ns, session):
+        size = _payload_bytes(session['messages']) + 1024
+        with self._lock:
+            previous = self._memory.pop(session_id, None)
+            if previous:
+                self._memory_size -= previous[2]
+            if size > self.memory_bytes // 4:
+                return  # one huge session shouldn't push out every other one
+            self._memory[session_id] = (mtime_ns, session, size)
+            self._memory_size += size
+            while self._memory_size > self.memory_bytes:
+                _, (_, _, evicted) = self._memory.popitem(last=False)
+                self._memory_size -= evicted
+
+    # -- expiry and size bound ---------------------------------------------------
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        self.purge()
+
+    def purge(self):
+        """Remove expired sessions, then the least recently used until the store fits max_bytes"""
+        now = time.time()
+        sessions = []
+        for session_id in os.listdir(self.root):
+            directory = self._path(session_id)
+            try:
+                files = [os.path.join(directory, name) for name in os.listdir(directory)]
+                used = os.stat(os.path.join(directory, 'session.json')).st_mtime
+                size = sum(os.path.getsize(path) for path in files)
+            except OSError:
+                # Half-created or being removed by another worker; expire it by directory age
+                try:
+                    used, size = os.stat(directory).st_mtime, 0
+                except OSError:
+                    continue
+            if now - used > self.ttl:
+                self._remove(session_id)
+                self.evicted += 1
+            else:
+                sessions.append((used, session_id, size))
+        total = sum(size for _, _, size in sessions)
+        for _, session_id, size in sorted(sessions):
+            if total <= self.max_bytes:
+                break
+            self._remove(session_id)
+            self.evicted += 1
+            total -= size
+        return total
+
+    def stats(self):
+        return {
+            'created': self.created,
+            'continued': self.continued,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'memory_sessions': len(self._memory),
+            'memory_bytes': self._memory_size,
+        }
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Export meals as Parquet or Arrow for offline analytics
+Writes meals.<ext> and food_items.<ext> (food_items flattened into one row
+per item) into an output directory, streaming from the database in batches.
+Requires pyarrow (pip install pyarrow).
+
+Usage:
+  DATABASE_URL=postgresql://... python3 export_meals.py
+  python3 export_meals.py --database-url sqlite:///fuell_server.db --format arrow --output exports/
+  python3 export_meals.py --user-id user_123 --batch-rows 50000
+
+Load it back with e.g. pandas.read_parquet('exports/meals.parquet') or
+duckdb: SELECT date_trunc('week', date), avg(processed_percent) FROM 'exports/meals.parquet' GROUP BY 1
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import columnar_export
+from storage import create_storage
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export meals as Parquet/Arrow")
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'), help="Defaults to $DATABASE_URL")
+    parser.add_argument('--format', choices=sorted(columnar_export.FORMATS), default='parquet')
+    parser.add_argument('--output', default=None, help="Output directory (default exports/meals_<timestamp>)")
+    parser.add_argument('--user-id', default=None, help="Only export this user's meals")
+    parser.add_argument('--batch-rows', type=int, default=10000, help="Rows per cursor fetch / row group")
+    parser.add_argument('--compression', default='zstd', help="Parquet codec (zstd, snappy, gzip, none)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        print("❌ Set DATABASE_URL or pass --database-url")
+        return 1
+    if not columnar_export.available():
+        print("❌ pyarrow is not installed (pip install pyarrow)")
+        return 1
+
+    output = args.output or os.path.join('exports', f"meals_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(output, exist_ok=True)
+
+    print(f"📦 Exporting meals as {args.format} to {output}")
+    storage = create_storage(args.database_url)
+    try:
+        summary = columnar_export.export_meals(
+            storage, output, args.format, batch_rows=args.batch_rows,
+            user_id=args.user_id, compression=args.compression
+        )
+    finally:
+        storage.close()
+
+    print(json.dumps(summary, indent=2))
+    if summary['unparsed_dates']:
+        print(f"⚠️ {summary['unparsed_dates']} meals had a date that couldn't be parsed (exported as null)")
+    print(f"✅ Exported {summary['meals']} meals and {summary['food_items']} food items in {summary['seconds']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Group commit for meal writes
+Request threads hand their write (a cursor-level storage op) to a single
+committer thread per worker process and block. The committer takes
+everything that queued up while its previous commit was in flight (plus an
+optional collection window), runs the whole batch in one
+transaction via storage.run_batch() and wakes every request only after that
+shared COMMIT returns, so a request is never acknowledged before its row is
+as durable as it would have been on its own. One fsync then covers a burst
+of quick-logged meals instead of one per request.
+"""
+
+import os
+import queue
+import threading
+import time
+
+
+class _Pending:
+    __slots__ = ('op', 'args', 'done', 'result', 'error')
+
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """Batches concurrent storage writes into shared transactions"""
+
+    def __init__(self, storage, max_batch=64, window_ms=0.0):
+        self.storage = storage
+        self.max_batch = max_batch
+        # Extra wait for more writes once the first arrives; 0 relies on writes queueing behind
+        # the in-flight commit, which batches under load without delaying a lone write
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.batches = 0
+        self.ops = 0
+        self.largest_batch = 0
+        self.failed_commits = 0
+
+    def submit(self, op, *args):
+        """Run op(cursor, *args) in the next group commit; returns its result or raises its error"""
+        self._ensure_thread()
+        pending = _Pending(op, args)
+        self._queue.put(pending)
+        # No timeout: giving up early would leave the caller unsure whether the write committed
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'ops': self.ops,
+            'avg_batch': round(self.ops / self.batches, 2) if self.batches else None,
+            'largest_batch': self.largest_batch,
+            'failed_commits': self.failed_commits,
+            'queued': self._queue.qsize(),
+        }
+
+    def _ensure_thread(self):
+        # gunicorn forks after import, so each worker process needs its own committer
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='group-commit', daemon=True).start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                # Anything already queued (arrived during the previous commit) is taken at once
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                outcomes = self.storage.run_batch([(p.op, p.args) for p in batch])
+            except Exception as e:
+                # The commit failed, so none of the batch is durable: every caller gets the error
+                print(f"⚠️ Group commit of {len(batch)} writes failed: {e}")
+                self.failed_commits += 1
+                outcomes = [(None, e)] * len(batch)
+
+            self.batches += 1
+            self.ops += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for pending, (result, error) in zip(batch, outcomes):
+                pending.result = result
+                pending.error = error
+                pending.done.set()
@@ -0,0 +1,184 @@
+"""
+Content-addressed store for meal photos
+An uploaded image is stored once under the sha256 of its bytes, sharded by
+the first hex digits so no directory grows huge:
+
+    <root>/originals/ab/cd/abcd...ef.jpg
+    <root>/thumbs/256/ab/cd/abcd...ef.jpg
+
+Identical uploads (the same photo from a retry or a second device) map to
+the same file and are stored once. Files never change after they are
+written, so they can be served with immutable cache headers and the sha256
+as a strong ETag. Uploads are streamed to a temp file in the store while
+hashing and moved into place with os.replace(), so readers never see a
+partial file.
+
+Thumbnails are decoded and resized by Pillow in a small process pool, off
+the request threads and outside the GIL. They are started right after an
+upload and built on demand if a request arrives first.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Magic bytes -> (extension, mimetype); only formats Pillow can thumbnail without plugins
+IMAGE_TYPES = (
+    (b'\xff\xd8\xff', 'jpg', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (b'RIFF', 'webp', 'image/webp'),
+)
+MIMETYPES = {ext: mimetype for _, ext, mimetype in IMAGE_TYPES}
+
+COPY_CHUNK_BYTES = 64 * 1024
+
+
+class ImageRejected(Exception):
+    """Not a supported image, or too large"""
+
+    def __init__(self, message, status=415):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff(head):
+    """(extension, mimetype) for the first bytes of a file, or None"""
+    for magic, ext, mimetype in IMAGE_TYPES:
+        if head.startswith(magic) and (ext != 'webp' or head[8:12] == b'WEBP'):
+            return ext, mimetype
+    return None
+
+
+def make_thumbnail(source, target, size, quality=80):
+    """Runs in a pool process: write a JPEG of at most size x size pixels to target"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # For JPEGs, let the decoder downscale while decoding (far less work than a full decode)
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, 'JPEG', quality=quality, optimize=True)
+            os.replace(temp, target)
+        except BaseException:
+            os.unlink(temp)
+            raise
+    return target
+
+
+class ImageStore:
+    """On-disk image store shared by every worker on this host"""
+
+    def __init__(self, root, max_bytes=15 * 1024 * 1024, thumbnail_sizes=(256,), workers=2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumbnail_sizes = tuple(thumbnail_sizes)
+        self.workers = workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+    @staticmethod
+    def _shard(digest):
+        return os.path.join(digest[:2], digest[2:4])
+
+    def original_path(self, digest, ext):
+        return os.path.join(self.root, 'originals', self._shard(digest), f'{digest}.{ext}')
+
+    def thumbnail_path(self, digest, size):
+        return os.path.join(self.root, 'thumbs', str(size), self._shard(digest), f'{digest}.jpg')
+
+    def put(self, stream):
+        """Store a file-like upload; returns (digest, ext, size, created)
+
+        Raises ImageRejected if it isn't a supported image or is larger than max_bytes.
+        """
+        sha = hashlib.sha256()
+        size = 0
+        detected = None
+        fd, temp = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'), suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    if detected is None:
+                        detected = sniff(chunk)
+                        if detected is None:
+                            raise ImageRejected("Unsupported image type (JPEG, PNG or WebP only)")
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ImageRejected(f"Image larger than {self.max_bytes} bytes", status=413)
+                    sha.update(chunk)
+                    f.write(chunk)
+                if detected is None:
+                    raise ImageRejected("Empty upload", status=400)
+                f.flush()
+                os.fsync(f.fileno())
+
+            digest, ext = sha.hexdigest(), detected[0]
+            path = self.original_path(digest, ext)
+            if os.path.exists(path):
+                # Already stored: same bytes, nothing to do
+                os.unlink(temp)
+                return digest, ext, size, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.unlink(temp)
+            raise
+        for thumbnail_size in self.thumbnail_sizes:
+            self._submit(digest, ext, thumbnail_size)
+        return digest, ext, size, True
+
+    def find(self, digest, ext):
+        """Path of a stored original, or None"""
+        path = self.original_path(digest, ext)
+        return path if os.path.exists(path) else None
+
+    def thumbnail(self, digest, ext, size, timeout=10.0):
+        """Path of the size thumbnail, building it first if needed; None if the original is missing"""
+        path = self.thumbnail_path(digest, size)
+        if os.path.exists(path):
+            return path
+        if not self.find(digest, ext):
+            return None
+        # Another worker may be building it too; both write a temp file and replace, so either wins
+        return self._submit(digest, ext, size).result(timeout=timeout)
+
+    def _submit(self, digest, ext, size):
+        target = self.thumbnail_path(digest, size)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        future = self._get_pool().submit(make_thumbnail, self.original_path(digest, ext), target, size)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"⚠️ Thumbnail failed: {future.exception()}")
+
+    def _get_pool(self):
+        # gunicorn forks after import: each worker starts its own pool on first use. Pool
+        # processes are spawned, not forked, since forking a threaded worker isn't safe
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    import multiprocessing
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pid = os.getpid()
+        return self._pool
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Manage monthly partitions of the PostgreSQL meals table (see meal_partitions.py)
+
+Usage:
+  python3 manage_partitions.py migrate               # one-off: rebuild meals as a partitioned table
+  python3 manage_partitions.py drop-old              # then drop the pre-migration copy once checked
+  python3 manage_partitions.py ensure --months-ahead 6
+  python3 manage_partitions.py list
+  python3 manage_partitions.py archive --before 2025-01 --output backups/meals_archive --drop
+
+Run `ensure` from a daily cron as well: the server only tops partitions up
+when a worker starts. `migrate` blocks meal writes (not reads) while rows are
+copied and keeps the old table as meals_unpartitioned (left out of database
+dumps); run `drop-old` once the new table has been checked. meals is partitioned by meal_date, so run
+backfill_meal_dates.py to completion before `migrate`.
+"""
+
+import argparse
+import os
+import sys
+
+import meal_partitions
+from storage import create_storage
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the meals table")
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'), help="Defaults to $DATABASE_URL")
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help="Convert meals to a partitioned table")
+    migrate.add_argument('--months-ahead', type=int, default=3)
+    sub.add_parser('drop-old', help="Drop meals_unpartitioned, the copy kept by migrate")
+    ensure = sub.add_parser('ensure', help="Create upcoming monthly partitions")
+    ensure.add_argument('--months-ahead', type=int, default=3)
+    sub.add_parser('list', help="Show partitions with estimated rows and size")
+    archive = sub.add_parser('archive', help="Detach (and optionally export and drop) old partitions")
+    archive.add_argument('--before', required=True, type=meal_partitions.parse_month,
+                         help="YYYY-MM: archive every meal month before this one")
+    archive.add_argument('--output', default=None, help="Directory for gzipped CSV copies of the detached months")
+    archive.add_argument('--drop', action='store_true', help="Drop detached partitions once exported (needs --output)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.database_url or not args.database_url.startswith(('postgres://', 'postgresql://')):
+        print("❌ Partitioning needs a PostgreSQL DATABASE_URL (--database-url)")
+        return 1
+
+    storage = create_storage(args.database_url)
+    try:
+        if args.command == 'migrate':
+            print("🗂️ Migrating meals to monthly partitions (meal writes wait until this finishes)...")
+            try:
+                migrated = meal_partitions.migrate(storage, args.months_ahead)
+            except ValueError as e:
+                print(f"❌ {e}")
+                return 1
+            if migrated:
+                print("✅ meals is now partitioned; the old table was kept as meals_unpartitioned (drop-old removes it)")
+            else:
+                print("ℹ️ meals is already partitioned")
+        elif args.command == 'drop-old':
+            try:
+                dropped = meal_partitions.drop_unpartitioned(storage)
+            except ValueError as e:
+                print(f"❌ {e}")
+                return 1
+            print("✅ Dropped meals_unpartitioned" if dropped else "ℹ️ meals_unpartitioned was already dropped")
+        elif args.command == 'ensure':
+            created = meal_partitions.ensure_partitions(storage, args.months_ahead)
+            print(f"✅ Created {', '.join(created)}" if created else "✅ Partitions already in place")
+        elif args.command == 'list':
+            partitions = meal_partitions.list_partitions(storage)
+            if not partitions:
+                print("ℹ️ meals is not partitioned")
+            for p in partitions:
+                print(f"  {p['name']:<20} {p['estimated_rows']:>12,} rows  {p['bytes'] / 1024 / 1024:>9.1f} MB  {p['bounds']}")
+        elif args.command == 'archive':
+            if args.drop and not args.output:
+                print("❌ --drop needs --output so the rows are kept somewhere")
+                return 1
+            done = meal_partitions.archive_partitions(storage, args.before, args.output, args.drop)
+            for name, path, dropped in done:
+                print(f"  📦 {name} detached" + (f", saved to {path}" if path else "") + (", dropped" if dropped else ""))
+            print(f"✅ Archived {len(done)} partition(s)")
+    finally:
+        storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Typed meal dates: online backfill of meals.meal_date and meals.logged_at
+meals.date holds whatever string the app sent (ISO "2025-10-20", sometimes
+with a time part, or Date.toDateString() "Mon Oct 20 2025"), so ordering and
+date ranges on it compare strings and mixed formats sort wrong. Two typed
+columns sit next to it:
+
+    meal_date   DATE          the calendar day parsed from date (NULL if unreadable)
+    logged_at   TIMESTAMPTZ   when the meal was logged: the app's meal id is the
+                              epoch milliseconds it was logged at, otherwise created_at
+
+init_schema() adds them as a catalog-only change and every meal write fills
+them. backfill() fills the rows written before that, in short keyset-paged
+batches (by id) that each commit on their own together with the position
+reached, so it runs against the live table without holding long locks, can
+be throttled, and picks up where it stopped after a crash or Ctrl-C. Once no
+row is left it builds idx_meals_user_meal_date without blocking writes
+(CONCURRENTLY, partition by partition when meals is partitioned) and marks
+the migration complete; storage.list_meals() then orders and filters on the
+typed columns.
+
+Run it only after every server runs a version that writes the new columns:
+a meal edited by an older server afterwards would keep a stale meal_date.
+"""
+
+import time
+
+from storage import MEAL_DATES_MIGRATION, meal_logged_at, parse_meal_date
+
+INDEX = 'idx_meals_user_meal_date'
+
+# Rows inserted while a pass runs (or skipped because their date changed mid-batch) get another pass
+MAX_PASSES = 3
+
+
+def _start(storage):
+    with storage.transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO schema_migrations (name, state, position)
+            VALUES (%s, 'running', '')
+            ON CONFLICT (name) DO NOTHING
+        ''', (MEAL_DATES_MIGRATION,))
+    return storage.migration_state(MEAL_DATES_MIGRATION)
+
+
+def remaining_rows(storage):
+    with storage.reader() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM meals WHERE logged_at IS NULL')
+        return cursor.fetchone()[0]
+
+
+def status(storage):
+    """The migration's schema_migrations row (None if never started) plus rows still to fill"""
+    state = storage.migration_state(MEAL_DATES_MIGRATION)
+    return {'migration': state, 'remaining': remaining_rows(storage)}
+
+
+def _batch(storage, position, batch_rows):
+    """Fill the next batch_rows untyped meals after position; returns (rows seen, rows filled, last id)"""
+    with storage.transaction() as cursor:
+        cursor.execute('''
+            SELECT id, date, created_at FROM meals
+            WHERE id > %s AND logged_at IS NULL
+            ORDER BY id LIMIT %s
+        ''', (position, batch_rows))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0, 0, position
+        # The guards skip rows a server wrote in the meantime; those are already typed or get the next pass
+        cursor.executemany('''
+            UPDATE meals SET meal_date = %s, logged_at = %s
+            WHERE id = %s AND date = %s AND logged_at IS NULL
+        ''', [(parse_meal_date(date), meal_logged_at(meal_id, created_at), meal_id, date)
+              for meal_id, date, created_at in rows])
+        filled = cursor.rowcount
+        last = rows[-1][0]
+        cursor.execute('''
+            UPDATE schema_migrations
+            SET position = %s, rows_done = rows_done + %s, updated_at = CURRENT_TIMESTAMP
+            WHERE name = %s
+        ''', (last, filled, MEAL_DATES_MIGRATION))
+    return len(rows), filled, last
+
+
+def backfill(storage, batch_rows=1000, pause=0.0, max_duty=0.5, progress=None, progress_seconds=5.0):
+    """Fill meal_date/logged_at for every meal, then index them and mark the migration complete
+
+    Each batch is followed by a sleep of at least `pause` seconds and long
+    enough that batches take no more than max_duty of the wall time, so the
+    database keeps headroom for the app however slow batches get under load.
+    progress(dict) is called every progress_seconds. Safe to re-run at any
+    point; returns status() at the end.
+    """
+    if not 0 < max_duty <= 1:
+        raise ValueError("max_duty must be in (0, 1]")
+    state = _start(storage)
+    if state['state'] == 'complete':
+        return status(storage)
+
+    remaining = remaining_rows(storage)
+    position = state['position'] or ''
+    started = last_report = time.monotonic()
+    filled_total = 0
+    passes = 0
+    while True:
+        batch_started = time.monotonic()
+        seen, filled, position = _batch(storage, position, batch_rows)
+        filled_total += filled
+        now = time.monotonic()
+        if progress and (now - last_report >= progress_seconds or not seen):
+            last_report = now
+            rate = filled_total / (now - started) if now > started else 0
+            left = max(remaining - filled_total, 0)
+            progress({'filled': filled_total, 'remaining': left, 'position': position,
+                      'rows_per_second': round(rate), 'eta_seconds': round(left / rate) if rate else None})
+        if not seen:
+            passes += 1
+            remaining = remaining_rows(storage)
+            if not remaining:
+                break
+            if passes >= MAX_PASSES:
+                raise RuntimeError(f"{remaining} meals are still untyped after {passes} passes; "
+                                   "is an older server version still writing meals?")
+            position = ''
+            filled_total = 0
+            started = time.monotonic()
+            continue
+        elapsed = time.monotonic() - batch_started
+        time.sleep(max(pause, elapsed * (1 - max_duty) / max_duty))
+
+    build_index(storage)
+    with storage.transaction() as cursor:
+        cursor.execute('''
+            UPDATE schema_migrations
+            SET state = 'complete', completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE name = %s
+        ''', (MEAL_DATES_MIGRATION,))
+    return status(storage)
+
+
+def build_index(storage):
+    """Create idx_meals_user_meal_date; on PostgreSQL without blocking meal writes"""
+    if not hasattr(storage, 'connection'):
+        # SQLite has no concurrent index build; it holds the write lock for the (single-node sized) build
+        with storage.transaction() as cursor:
+            cursor.execute(storage.meal_dates_index_statement())
+        return
+
+    from meal_partitions import _partitions, is_partitioned
+
+    with storage.connection() as conn:
+        partitioned = is_partitioned(conn)
+        partitions = [row['name'] for row in _partitions(conn)] if partitioned else []
+        conn.commit()
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+        conn.autocommit = True
+        try:
+            if not partitioned:
+                _drop_invalid(conn, INDEX)
+                conn.execute(storage.meal_dates_index_statement(concurrently=True))
+                return
+            if _index_valid(conn, INDEX):
+                return
+            # The parent index starts out invalid and becomes valid once every partition's index is attached
+            conn.execute(storage.meal_dates_index_statement(only=True))
+            for partition in partitions:
+                if _has_attached_index(conn, partition):
+                    continue
+                name = f'{partition}_user_meal_date_idx'
+                _drop_invalid(conn, name)
+                conn.execute(storage.meal_dates_index_statement(table=partition, name=name, concurrently=True))
+                conn.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION {name}')
+        finally:
+            conn.autocommit = False
+
+
+def _index_valid(conn, name):
+    row = conn.execute('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)', (name,)).fetchone()
+    return bool(row and row[0])
+
+
+def _drop_invalid(conn, name):
+    # An interrupted CONCURRENTLY build leaves an invalid index that IF NOT EXISTS would keep forever
+    row = conn.execute('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)', (name,)).fetchone()
+    if row and not row[0]:
+        conn.execute(f'DROP INDEX CONCURRENTLY {name}')
+
+
+def _has_attached_index(conn, partition):
+    row = conn.execute('''
+        SELECT 1 FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s) AND x.indrelid = to_regclass(%s)
+    ''', (INDEX, partition)).fetchone()
+    return row is not None
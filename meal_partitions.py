@@ -0,0 +1,271 @@
+"""
+Monthly range partitioning of the PostgreSQL meals table
+meals only grows, so one heap means vacuum, index bloat and backups keep
+getting slower with total history. Partitioned, meals becomes one table per
+month of meal_date, the typed meal day (meals_p2025_10, ...):
+
+    - queries filtered on meal_date (GET /api/user/meals?from=&to=, the
+      per-user export) only touch the partitions in range (partition pruning)
+    - each month's indexes and vacuum work stay small, and months that are
+      no longer written to stop changing
+    - old months are detached in a metadata-only step, archived with COPY
+      and dropped, instead of a huge DELETE followed by vacuum
+
+meal_date is the partition key because that is what the date-range reads
+filter on. It comes with trade-offs:
+
+    - ?since= filters on created_at and no longer prunes (it scans every
+      month of that user through the user index)
+    - a meal logged for an earlier day lands in that day's (older) month,
+      and editing a meal's date moves its row to the other partition
+    - meals whose date couldn't be parsed (meal_date NULL) live in the
+      DEFAULT partition, as do days outside the created months
+    - archiving detaches by the month meals were eaten in, not logged in
+
+So meal_date must be filled for every row first: migrate() refuses to run
+before meal_dates.py has completed. meal_date is nullable, so it can't be
+part of a primary key; meals keeps an index on id and a trigger keeps meal
+ids unique across partitions, so a duplicate id is still rejected as
+before. ensure_partitions() creates months ahead of time and moves rows for
+them out of the DEFAULT partition.
+
+SQLite deployments have no partitioning; these helpers need PostgresStorage.
+"""
+
+from datetime import date, datetime
+
+PARENT = 'meals'
+DEFAULT_PARTITION = 'meals_default'
+# The old heap migrate() keeps for rollback (left out of dumps, see storage.TABLE_NAMES_QUERY)
+UNPARTITIONED = 'meals_unpartitioned'
+
+UNIQUE_ID_TRIGGER = '''
+CREATE OR REPLACE FUNCTION meals_unique_id() RETURNS trigger AS $$
+BEGIN
+    -- No primary key spans the partitions, so serialize inserts per id and check by hand
+    PERFORM pg_advisory_xact_lock(hashtextextended(NEW.id, 0));
+    IF EXISTS (SELECT 1 FROM meals WHERE id = NEW.id) THEN
+        RAISE EXCEPTION 'duplicate key value violates unique constraint "meals_pkey"'
+            USING ERRCODE = 'unique_violation', DETAIL = format('Key (id)=(%s) already exists.', NEW.id);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+
+def partition_name(month):
+    return f"{PARENT}_p{month.year:04d}_{month.month:02d}"
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(text):
+    """'2025-10' -> date(2025, 10, 1)"""
+    return datetime.strptime(text, '%Y-%m').date()
+
+
+def _check(storage):
+    if not hasattr(storage, 'connection'):
+        raise ValueError(f"Partitioning needs PostgreSQL, not {storage.name}")
+
+
+def is_partitioned(conn):
+    row = conn.execute('''
+        SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = %s AND c.relnamespace = 'public'::regnamespace
+    ''', (PARENT,)).fetchone()
+    return row is not None
+
+
+def _create_partition(conn, month):
+    name = partition_name(month)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT}
+        FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+    ''')
+    return name
+
+
+def migrate(storage, months_ahead=3):
+    """Rebuild meals as a partitioned table (one-off; writes wait, reads continue)
+
+    Rows are copied with one INSERT ... SELECT under an EXCLUSIVE lock:
+    readers keep working, meal writes queue until the swap commits. The old
+    heap is kept as meals_unpartitioned for rollback; drop_unpartitioned()
+    removes it once the new table has been checked. Returns False if meals is already
+    partitioned; raises ValueError while the meal_dates backfill is pending.
+    """
+    _check(storage)
+    if not storage.meal_dates_ready():
+        raise ValueError("meal_date isn't filled for every meal yet: run backfill_meal_dates.py first")
+    with storage.connection() as conn:
+        if is_partitioned(conn):
+            return False
+        # End the implicit read transaction so the block below is a real transaction, not a savepoint
+        conn.commit()
+        with conn.transaction():
+            conn.execute(f'LOCK TABLE {PARENT} IN EXCLUSIVE MODE')
+            columns = [row[0] for row in conn.execute('''
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position
+            ''', (PARENT,)).fetchall()]
+            first, last = conn.execute(f'SELECT MIN(meal_date), MAX(meal_date) FROM {PARENT}').fetchone()
+
+            # Index names are schema-wide: move the old ones out of the way first
+            for index in ('meals_pkey', 'idx_meals_user_date', 'idx_meals_user_meal_date'):
+                conn.execute(f'ALTER INDEX IF EXISTS {index} RENAME TO {index.replace(PARENT, UNPARTITIONED, 1)}')
+            conn.execute(f'ALTER TABLE {PARENT} RENAME TO {UNPARTITIONED}')
+
+            conn.execute(f'''
+                CREATE TABLE {PARENT} (LIKE {UNPARTITIONED} INCLUDING DEFAULTS)
+                PARTITION BY RANGE (meal_date)
+            ''')
+            conn.execute(f'ALTER TABLE {PARENT} ADD FOREIGN KEY (user_id) REFERENCES users(user_id)')
+            conn.execute(f'CREATE INDEX idx_meals_user_date ON {PARENT} (user_id, date DESC, created_at DESC)')
+            conn.execute(f'CREATE INDEX idx_meals_id ON {PARENT} (id)')
+            conn.execute(storage.meal_dates_index_statement())
+            conn.execute(UNIQUE_ID_TRIGGER)
+            conn.execute(f'''
+                CREATE TRIGGER meals_unique_id BEFORE INSERT ON {PARENT}
+                FOR EACH ROW EXECUTE FUNCTION meals_unique_id()
+            ''')
+
+            # Every month with meals gets its own partition, even days logged far ahead
+            month = month_start(first or datetime.now())
+            last = max(month_start(last or datetime.now()), add_months(month_start(datetime.now()), months_ahead))
+            while month <= last:
+                _create_partition(conn, month)
+                month = add_months(month, 1)
+            conn.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT')
+
+            # The trigger would re-check every copied id; the old primary key already guarantees uniqueness
+            conn.execute(f'ALTER TABLE {PARENT} DISABLE TRIGGER meals_unique_id')
+            conn.execute(f"INSERT INTO {PARENT} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {UNPARTITIONED}")
+            conn.execute(f'ALTER TABLE {PARENT} ENABLE TRIGGER meals_unique_id')
+        conn.execute(f'ANALYZE {PARENT}')
+    return True
+
+
+def drop_unpartitioned(storage):
+    """Drop the copy migrate() kept for rollback; returns False if there is none"""
+    _check(storage)
+    with storage.connection() as conn:
+        if not is_partitioned(conn):
+            raise ValueError("meals isn't partitioned: meals_unpartitioned may be the only copy")
+        exists, = conn.execute('SELECT to_regclass(%s) IS NOT NULL', (UNPARTITIONED,)).fetchone()
+        if exists:
+            conn.execute(f'DROP TABLE {UNPARTITIONED}')
+        conn.commit()
+    return exists
+
+
+def ensure_partitions(storage, months_ahead=3):
+    """Create partitions through months_ahead; returns the names created (no-op if not partitioned)
+
+    Rows that already landed in the DEFAULT partition for one of those months
+    are moved into the new partition in the same transaction.
+    """
+    _check(storage)
+    created = []
+    with storage.connection() as conn:
+        if not is_partitioned(conn):
+            return created
+        existing = {row['name'] for row in _partitions(conn)}
+        conn.commit()
+        month = month_start(datetime.now())
+        for _ in range(months_ahead + 1):
+            name = partition_name(month)
+            if name not in existing:
+                with conn.transaction():
+                    upper = add_months(month, 1)
+                    stray, = conn.execute(
+                        f'SELECT COUNT(*) FROM {DEFAULT_PARTITION} WHERE meal_date >= %s AND meal_date < %s',
+                        (month, upper)).fetchone()
+                    if stray:
+                        # A partition can't be created while DEFAULT holds rows for its range
+                        conn.execute(f'CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)')
+                        conn.execute(f'''
+                            WITH moved AS (
+                                DELETE FROM {DEFAULT_PARTITION} WHERE meal_date >= %s AND meal_date < %s RETURNING *
+                            )
+                            INSERT INTO {name} SELECT * FROM moved
+                        ''', (month, upper))
+                        conn.execute(f'''
+                            ALTER TABLE {PARENT} ATTACH PARTITION {name}
+                            FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')
+                        ''')
+                    else:
+                        _create_partition(conn, month)
+                created.append(name)
+            month = add_months(month, 1)
+    return created
+
+
+def _partitions(conn):
+    rows = conn.execute('''
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s AND p.relnamespace = 'public'::regnamespace
+        ORDER BY c.relname
+    ''', (PARENT,)).fetchall()
+    return [{'name': name, 'bounds': bounds, 'estimated_rows': max(estimate, 0), 'bytes': size}
+            for name, bounds, estimate, size in rows]
+
+
+def list_partitions(storage):
+    _check(storage)
+    with storage.connection() as conn:
+        return _partitions(conn) if is_partitioned(conn) else []
+
+
+def archive_partitions(storage, before, output_dir=None, drop=False):
+    """Detach every monthly partition that ends on or before `before` (a month start)
+
+    Detaching only touches the catalog (no row is rewritten or deleted), so
+    it takes a brief lock instead of a long DELETE plus vacuum. With
+    output_dir each detached month is first written there as a gzipped CSV
+    via COPY; with drop the detached table is then dropped. Returns
+    [(partition, archive_path or None, dropped)].
+    """
+    import gzip
+    import os
+
+    _check(storage)
+    if drop and not output_dir:
+        raise ValueError("Refusing to drop partitions that weren't archived (pass output_dir)")
+    done = []
+    with storage.connection() as conn:
+        if not is_partitioned(conn):
+            return done
+        names = [row['name'] for row in _partitions(conn) if row['name'] != DEFAULT_PARTITION]
+        conn.commit()
+        for name in names:
+            month = parse_month(name[len(PARENT) + 2:].replace('_', '-'))
+            if add_months(month, 1) > before:
+                continue
+            with conn.transaction():
+                conn.execute(f'ALTER TABLE {PARENT} DETACH PARTITION {name}')
+            path = None
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                path = os.path.join(output_dir, f'{name}.csv.gz')
+                with conn.transaction():
+                    with gzip.open(path, 'wb') as f, conn.cursor().copy(
+                            f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)') as copy:
+                        for data in copy:
+                            f.write(data)
+            if drop:
+                with conn.transaction():
+                    conn.execute(f'DROP TABLE {name}')
+            done.append((name, path, drop))
+    return done
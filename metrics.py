@@ -0,0 +1,170 @@
+"""
+Lightweight in-process metrics
+Counters and latency summaries kept in memory per worker process. Each
+process periodically writes its snapshot to a shared directory so
+/api/metrics can report totals across all gunicorn workers on the host.
+"""
+
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+
+class Summary:
+    """Count/sum/max plus a sliding window of recent values for percentiles"""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.total, 'max': self.max, 'recent': list(self.recent)}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100.0 * len(ordered))) - 1]
+
+
+class Metrics:
+    """Per-process counters/summaries with cross-process aggregation via snapshot files"""
+
+    def __init__(self, shared_dir=None, flush_interval=5.0):
+        self.shared_dir = shared_dir or os.path.join(tempfile.gettempdir(), 'fuell_metrics')
+        self.flush_interval = flush_interval
+        self.counters = {}
+        self.summaries = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        os.makedirs(self.shared_dir, exist_ok=True)
+
+    def inc(self, name, amount=1):
+        self._ensure_thread()
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        self._ensure_thread()
+        with self._lock:
+            summary = self.summaries.get(name)
+            if summary is None:
+                summary = self.summaries[name] = Summary()
+            summary.observe(value)
+
+    def percentile(self, name, pct, min_samples=1):
+        """Percentile of recent local observations, or None if there aren't enough yet"""
+        with self._lock:
+            summary = self.summaries.get(name)
+            values = list(summary.recent) if summary else []
+        if len(values) < min_samples:
+            return None
+        return percentile(values, pct)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'timestamp': time.time(),
+                'counters': dict(self.counters),
+                'summaries': {name: s.to_dict() for name, s in self.summaries.items()},
+            }
+
+    def collect(self):
+        """Merge this process's live numbers with the latest snapshots of the other workers"""
+        self.flush()
+        snapshots = []
+        for filename in os.listdir(self.shared_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.shared_dir, filename)
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not self._alive(snapshot.get('pid')):
+                # Keep a dead worker's counts out of the totals and tidy up after it
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            snapshots.append(snapshot)
+
+        counters = {}
+        merged = {}
+        for snapshot in snapshots:
+            for name, value in snapshot['counters'].items():
+                counters[name] = counters.get(name, 0) + value
+            for name, s in snapshot['summaries'].items():
+                m = merged.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0, 'recent': []})
+                m['count'] += s['count']
+                m['sum'] += s['sum']
+                m['max'] = max(m['max'], s['max'])
+                m['recent'].extend(s['recent'])
+
+        summaries = {}
+        for name, m in merged.items():
+            summaries[name] = {
+                'count': m['count'],
+                'mean': round(m['sum'] / m['count'], 2) if m['count'] else None,
+                'max': round(m['max'], 2),
+                'p50': percentile(m['recent'], 50),
+                'p95': percentile(m['recent'], 95),
+                'p99': percentile(m['recent'], 99),
+            }
+        return {'workers': len(snapshots), 'counters': counters, 'summaries': summaries}
+
+    def flush(self):
+        snapshot = self.snapshot()
+        path = os.path.join(self.shared_dir, f"{snapshot['pid']}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except (PermissionError, TypeError):
+            return True
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked child: don't report the parent's numbers as our own
+                self.counters = {}
+                self.summaries = {}
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='metrics-flusher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️ Metrics flush failed: {e}")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Anthropic Messages API used by the benchmark suite
+Returns a canned nutrition analysis after a configurable delay so
+server_cloud.py can be load-tested without calling (or paying for) Claude
+"""
+
+from flask import Flask, request, jsonify
+import os
+import random
+import time
+
+app = Flask(__name__)
+
+# Simulated upstream latency (milliseconds) and +/- jitter
+LATENCY_MS = float(os.environ.get('MOCK_LATENCY_MS', '200'))
+JITTER_MS = float(os.environ.get('MOCK_JITTER_MS', '50'))
+
+# Fault injection: fraction of requests answered with MOCK_ERROR_STATUS (529 = overloaded)
+ERROR_RATE = float(os.environ.get('MOCK_ERROR_RATE', '0'))
+ERROR_STATUS = int(os.environ.get('MOCK_ERROR_STATUS', '529'))
+
+CANNED_TEXT = """Grilled chicken with rice and broccoli, roughly 510 calories.
+
+**NUTRITION_DATA:**
+```json
+{
+  "title": "Chicken Bowl",
+  "calories": 510,
+  "protein": 52,
+  "carbs": 58,
+  "fat": 7,
+  "processed": {"calories": 0, "percent": 0},
+  "ultraProcessed": {"calories": 0, "percent": 0},
+  "fiber": 4,
+  "caffeine": 0,
+  "freshProduce": 90,
+  "certainty": 7
+}
+```"""
+
+
+def count_images(data):
+    """Count image blocks across all messages in a Messages API payload"""
+    count = 0
+    for message in data.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, list):
+            count += sum(1 for block in content if block.get('type') == 'image')
+    return count
+
+
+# Prompt-cache stand-in: system prompts marked cache_control seen before are "read from cache"
+_cached_prefixes = set()
+
+
+def cached_prompt_tokens(data):
+    """(cache_creation, cache_read) tokens for the payload's cache_control system blocks"""
+    system = data.get('system')
+    if not isinstance(system, list):
+        return 0, 0
+    text = ''.join(block.get('text', '') for block in system if block.get('cache_control'))
+    if not text:
+        return 0, 0
+    tokens = len(text) // 4
+    if text in _cached_prefixes:
+        return 0, tokens
+    _cached_prefixes.add(text)
+    return tokens, 0
+
+
+@app.route('/', methods=['GET'])
+def home():
+    return "✅ Mock Anthropic upstream is running!"
+
+
+@app.route('/v1/messages', methods=['POST'])
+def messages():
+    data = request.get_json() or {}
+
+    delay = max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000
+    time.sleep(delay)
+
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        response = jsonify({'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}})
+        response.headers['retry-after'] = '1'
+        return response, ERROR_STATUS
+
+    # Rough token estimate: ~4 bytes of text per token, ~1600 tokens per image
+    images = count_images(data)
+    input_tokens = (request.content_length or 0) // 4 if not images else 1500 + images * 1600
+    cache_creation, cache_read = cached_prompt_tokens(data)
+    input_tokens = max(0, input_tokens - cache_creation - cache_read)
+
+    return jsonify({
+        'id': f"msg_mock_{int(time.time() * 1000)}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': data.get('model', 'claude-sonnet-4-5-20250929'),
+        'content': [{'type': 'text', 'text': CANNED_TEXT}],
+        'stop_reason': 'end_turn',
+        'stop_sequence': None,
+        'usage': {
+            'input_tokens': input_tokens,
+            'output_tokens': 120,
+            'cache_creation_input_tokens': cache_creation,
+            'cache_read_input_tokens': cache_read
+        }
+    })
+
+
+if __name__ == '__main__':
+    app.run(host='127.0.0.1', port=int(os.environ.get('PORT', 5099)), debug=False, threaded=True)
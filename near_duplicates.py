@@ -0,0 +1,314 @@
+"""
+Near-duplicate photo lookup for analyze
+People photograph the same breakfast or coffee most days. Every successful
+single-photo analysis is fingerprinted with two 64-bit perceptual hashes of
+the photo:
+
+    pHash   sign pattern of the low-frequency DCT of a 32x32 grayscale copy
+            (robust to rescaling, recompression and small lighting changes)
+    dHash   brightness gradients of a 9x8 grayscale copy (cheap, catches a
+            different set of edits; used to confirm pHash matches)
+
+and stored with the result in a local SQLite file shared by all workers on
+the host. Each worker mirrors the hashes into per-user multi-index hash
+tables keyed on pHash, so finding earlier photos within a Hamming distance
+probes a few buckets instead of comparing against every photo. A match must also have been analyzed with
+the same prompt (everything in the payload except the image bytes), so a
+different instruction or model never reuses an answer.
+
+lookup() returns the closest earlier analysis. The server either offers it to
+the app as a hint (POST /api/analyze/similar) or, with reuse enabled,
+answers analyze with it directly.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+Fingerprint = namedtuple('Fingerprint', 'prompt_key phash dhash')
+
+DCT_SIZE = 32
+HASH_SIDE = 8
+
+# cos((2x + 1) * u * pi / 2N) for the HASH_SIDE lowest frequencies u, computed once
+_COSINES = [[math.cos((2 * x + 1) * u * math.pi / (2 * DCT_SIZE)) for x in range(DCT_SIZE)]
+            for u in range(HASH_SIDE)]
+
+
+def _bits(flags):
+    value = 0
+    for flag in flags:
+        value = (value << 1) | flag
+    return value
+
+
+def phash(image):
+    """64-bit DCT hash of a PIL image"""
+    from PIL import Image
+
+    # Mode 'L' is one byte per pixel, row by row (getdata() is deprecated)
+    pixels = list(image.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.Resampling.LANCZOS).tobytes())
+    rows = [pixels[i:i + DCT_SIZE] for i in range(0, DCT_SIZE * DCT_SIZE, DCT_SIZE)]
+    # Separable 2D DCT, only the low frequencies: rows first, then columns
+    row_freqs = [[sum(c * p for c, p in zip(cosines, row)) for cosines in _COSINES] for row in rows]
+    coefficients = [sum(_COSINES[u][y] * row_freqs[y][v] for y in range(DCT_SIZE))
+                    for u in range(HASH_SIDE) for v in range(HASH_SIDE)]
+    # The DC term only measures overall brightness; leave it out of the median
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    return _bits(c > median for c in coefficients)
+
+
+def dhash(image):
+    """64-bit gradient hash of a PIL image"""
+    from PIL import Image
+
+    pixels = list(image.convert('L').resize((HASH_SIDE + 1, HASH_SIDE), Image.Resampling.LANCZOS).tobytes())
+    width = HASH_SIDE + 1
+    return _bits(pixels[y * width + x] > pixels[y * width + x + 1] for y in range(HASH_SIDE) for x in range(HASH_SIDE))
+
+
+def image_hashes(data):
+    """(phash, dhash) of encoded image bytes"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs decode straight to a small grayscale copy; plenty for 32x32 hashes
+        image.draft('L', (DCT_SIZE * 2, DCT_SIZE * 2))
+        image = ImageOps.exif_transpose(image)
+        return phash(image), dhash(image)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class MultiIndexHash:
+    """Multi-index hashing over 64-bit hashes under Hamming distance
+
+    Every hash is filed under each of its 8 bytes. Two hashes less than 8
+    bits apart agree exactly on at least one byte (pigeonhole), so a search
+    only reads the 8 buckets of the query's bytes and checks those
+    candidates in full. Larger radii would need to probe every 1-bit
+    variant of each byte, which costs more than checking every entry, so
+    they just scan.
+    """
+
+    CHUNKS = 8
+    CHUNK_BITS = 8
+
+    __slots__ = ('_tables', '_entries')
+
+    def __init__(self):
+        self._tables = [{} for _ in range(self.CHUNKS)]
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _chunks(self, value):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, value, item):
+        entry = (value, item)
+        self._entries.append(entry)
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(entry)
+
+    def search(self, value, radius):
+        """[(distance, item)] for every item within radius, nearest first"""
+        if radius >= self.CHUNKS:
+            candidates = self._entries
+        else:
+            # An entry can sit in several of the query's buckets; dict keys dedupe by identity
+            candidates = {id(entry): entry for table, chunk in zip(self._tables, self._chunks(value))
+                          for entry in table.get(chunk, ())}.values()
+        matches = [(distance, item) for entry_value, item in candidates
+                   if (distance := hamming(value, entry_value)) <= radius]
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+def request_image(data):
+    """The base64 image of a single-photo Messages payload as bytes, or None"""
+    images = []
+    for message in (data or {}).get('messages', []):
+        content = message.get('content')
+        if isinstance(content, list):
+            images.extend(block for block in content if isinstance(block, dict) and block.get('type') == 'image')
+    if len(images) != 1:
+        return None
+    source = images[0].get('source') or {}
+    if source.get('type') != 'base64' or not source.get('data'):
+        return None
+    try:
+        return base64.b64decode(source['data'])
+    except ValueError:
+        return None
+
+
+def prompt_key(data):
+    """Hash of the payload with the image bytes blanked out"""
+    def strip(value):
+        if isinstance(value, dict):
+            if value.get('type') == 'base64' and 'data' in value:
+                return {**value, 'data': None}
+            return {k: strip(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        return value
+
+    return hashlib.sha256(json.dumps(strip(data), sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class NearDuplicateIndex:
+    """Perceptual-hash index of earlier analyses, per user, shared by every worker on this host"""
+
+    def __init__(self, path=None, max_distance=6, confirm_distance=12, per_user=500, ttl=90 * 86400,
+                 rebuild_seconds=3600):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'fuell_image_hashes.db')
+        # pHash radius for candidates, then a dHash check to weed out look-alikes
+        self.max_distance = max_distance
+        self.confirm_distance = confirm_distance
+        self.per_user = per_user
+        self.ttl = ttl
+        # Rows deleted by another worker stay in this worker's indexes until the next rebuild
+        self.rebuild_seconds = rebuild_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._last_id = 0
+        self._built_at = 0.0
+        self._pid = None
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_ms_total = 0.0
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS image_analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                prompt_key TEXT NOT NULL,
+                phash INTEGER NOT NULL,
+                dhash INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_image_analyses_user ON image_analyses (user_id, id)')
+
+    def fingerprint(self, data):
+        """Fingerprint of a single-photo analyze payload, or None if it doesn't qualify"""
+        image = request_image(data)
+        if image is None:
+            return None
+        try:
+            hashes = image_hashes(image)
+        except Exception as e:
+            print(f"⚠️ Could not hash analyze image: {e}")
+            return None
+        return Fingerprint(prompt_key(data), *hashes)
+
+    def _sync(self):
+        """Bring this worker's indexes up to date with rows other workers added (caller holds _lock)"""
+        now = time.time()
+        if self._pid != os.getpid() or now - self._built_at > self.rebuild_seconds:
+            self._indexes = {}
+            self._last_id = 0
+            self._built_at = now
+            self._pid = os.getpid()
+        rows = self._connect().execute('''
+            SELECT id, user_id, prompt_key, phash, dhash FROM image_analyses
+            WHERE id > ? AND created_at > ? ORDER BY id
+        ''', (self._last_id, now - self.ttl)).fetchall()
+        for row_id, user_id, key, phash_value, dhash_value in rows:
+            index = self._indexes.get((user_id, key))
+            if index is None:
+                index = self._indexes[(user_id, key)] = MultiIndexHash()
+            index.add(_unsigned(phash_value), (row_id, _unsigned(dhash_value)))
+            self._last_id = row_id
+
+    def lookup(self, user_id, fingerprint):
+        """The closest earlier analysis for this user and prompt: {'distance', 'analyzed_at', 'result'} or None"""
+        started = time.perf_counter()
+        with self._lock:
+            self._sync()
+            index = self._indexes.get((user_id, fingerprint.prompt_key))
+            candidates = index.search(fingerprint.phash, self.max_distance) if index else []
+        match = None
+        conn = self._connect()
+        for distance, (row_id, dhash_value) in candidates:
+            if hamming(fingerprint.dhash, dhash_value) > self.confirm_distance:
+                continue
+            row = conn.execute('SELECT result, created_at FROM image_analyses WHERE id = ? AND created_at > ?',
+                               (row_id, time.time() - self.ttl)).fetchone()
+            if row is None:
+                # Trimmed or expired since this worker loaded it
+                continue
+            match = {'distance': distance, 'analyzed_at': row[1], 'result': json.loads(row[0])}
+            break
+        self.lookups += 1
+        self.hits += match is not None
+        self.lookup_ms_total += (time.perf_counter() - started) * 1000
+        return match
+
+    def record(self, user_id, fingerprint, result):
+        """Remember a successful analysis (a dict or its JSON bytes); keeps the newest per_user entries per user"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                INSERT INTO image_analyses (user_id, prompt_key, phash, dhash, result, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, fingerprint.prompt_key, _signed(fingerprint.phash), _signed(fingerprint.dhash),
+                  result.decode('utf-8') if isinstance(result, bytes) else json.dumps(result), now))
+            conn.execute('''
+                DELETE FROM image_analyses WHERE user_id = ? AND id NOT IN (
+                    SELECT id FROM image_analyses WHERE user_id = ? ORDER BY id DESC LIMIT ?
+                )
+            ''', (user_id, user_id, self.per_user))
+            conn.execute('DELETE FROM image_analyses WHERE created_at <= ?', (now - self.ttl,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 3) if self.lookups else None,
+            'avg_lookup_ms': round(self.lookup_ms_total / self.lookups, 3) if self.lookups else None,
+            'indexed': sum(len(index) for index in self._indexes.values()),
+        }
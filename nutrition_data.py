@@ -0,0 +1,294 @@
+"""
+The app's NUTRITION_DATA analysis format
+Every analysis reply ends with a fenced JSON block that the app extracts with
+
+    /\\*\\*NUTRITION_DATA:\\*\\*\\s*```(?:json)?\\s*(\\{[\\s\\S]*?\\})\\s*```/i
+
+Analyses the server answers itself (saved meals, the nutrition reference)
+are built in that exact shape. parse_analysis() goes the other way: it
+extracts and validates the block from Claude's text once on the server, so
+analyze responses carry a typed `parsed` object (cached along with them) and
+the app doesn't have to run its regexes. It also copes with what the app's
+parser can't: a block cut off by max_tokens, trailing commas, numbers
+written as text and the old plain-text macros format.
+"""
+
+import json
+import re
+
+# The description the app embeds in a text-only analyze prompt (src/services/api.js)
+TEXT_ONLY_DESCRIPTION = re.compile(
+    r'NO IMAGES PROVIDED - User text description only: "(.*?)"\s*\n\s*\n\*\*RESTAURANT DETECTION', re.S)
+# The meal_preparation fragment of the analyze prompt (prompts/analyze.v1.txt)
+MEAL_PREPARATION = re.compile(r'The user indicated this meal was: \*\*([A-Z]+)\*\*')
+# Per-100g home values and saved meals don't describe restaurant or packaged portions
+LOCAL_PREPARATIONS = ('HOMEMADE',)
+
+
+def text_only_description(data):
+    """The user's food description from a first-turn, text-only analyze payload, or None
+
+    None as well for restaurant and prepackaged meals: their portions and
+    cooking are what Claude is asked to account for.
+    """
+    messages = (data or {}).get('messages') or []
+    if len(messages) != 1:
+        # Follow-ups carry earlier answers and corrections; leave those to Claude
+        return None
+    content = messages[0].get('content')
+    if isinstance(content, str):
+        content = [{'type': 'text', 'text': content}]
+    if not isinstance(content, list) or any(
+            not isinstance(block, dict) or block.get('type') != 'text' for block in content):
+        return None
+    for block in content:
+        preparation = MEAL_PREPARATION.search(block.get('text') or '')
+        if preparation and preparation.group(1) not in LOCAL_PREPARATIONS:
+            return None
+    for block in content:
+        match = TEXT_ONLY_DESCRIPTION.search(block.get('text') or '')
+        if match:
+            return match.group(1).strip() or None
+    return None
+
+
+def nutrition_text(summary, nutrition):
+    """A short analysis followed by the NUTRITION_DATA block"""
+    return f"{summary}\n\n**NUTRITION_DATA:**\n```json\n{json.dumps(nutrition, indent=2)}\n```"
+
+
+def local_response(response_id, summary, nutrition, model=None, **marks):
+    """A Messages-shaped analyze response produced without calling Claude
+
+    marks are extra top-level keys (e.g. saved_meal_match) that let the app
+    label the result and offer a fresh analysis instead.
+    """
+    return {
+        'id': response_id,
+        'type': 'message',
+        'role': 'assistant',
+        'model': model,
+        'content': [{'type': 'text', 'text': nutrition_text(summary, nutrition)}],
+        'stop_reason': 'end_turn',
+        'usage': {'input_tokens': 0, 'output_tokens': 0},
+        **marks,
+    }
+
+
+# -- parsing Claude's replies ---------------------------------------------------
+
+MARKER = re.compile(r'\*\*NUTRITION_DATA:?\*\*:?', re.I)
+FENCED = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.S | re.I)
+NUMBER = re.compile(r'-?\d[\d,]*(?:\.\d+)?')
+REQUIRED = ('calories', 'protein', 'carbs', 'fat')
+
+# Limits from src/utils/macroParser.js validateMacros()
+LIMITS = {'calories': 10000, 'protein': 1000, 'carbs': 2000, 'fat': 1000}
+
+# The app drops titles that are really instructions or hedges
+INVALID_TITLE_PHRASES = ('analyzing', 'images together', 'calculation', 'estimate',
+                         'based on', 'looks like', 'appears to be', 'seems to be')
+MAX_TITLE_LENGTH = 30
+
+# Plain-text fallback used before the JSON block existed ("- Calories: 510 kcal")
+LEGACY_MACROS = {
+    'calories': re.compile(r'Calories:\s*([\d,]+(?:\.\d+)?)\s*kcal', re.I),
+    'protein': re.compile(r'Protein:\s*([\d,]+(?:\.\d+)?)\s*g(?!\s*x)', re.I),
+    'fat': re.compile(r'Fat:\s*([\d,]+(?:\.\d+)?)\s*g(?!\s*x)', re.I),
+    'carbs': re.compile(r'(?:Net\s+)?Carbs:\s*([\d,]+(?:\.\d+)?)\s*g(?!\s*x)', re.I),
+}
+LEGACY_TITLE = re.compile(r'\*\*Title:\*\*\s*([^\n]+)', re.I)
+
+
+def response_text(result):
+    """The concatenated text blocks of a Messages response"""
+    content = (result or {}).get('content')
+    if not isinstance(content, list):
+        return ''
+    return ''.join(block.get('text') or '' for block in content
+                   if isinstance(block, dict) and block.get('type') == 'text')
+
+
+def _loads_lenient(text):
+    """json.loads, then again without trailing commas (a common model slip)"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(re.sub(r',\s*([}\]])', r'\1', text))
+
+
+def _repair_truncated(text):
+    """Best parse of a JSON object cut off mid-way (max_tokens): close it after the last complete member"""
+    stack, in_string, escaped = [], False, False
+    # Places a member or element just ended: (cut position, closers needed there)
+    cuts = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if not stack:
+                break
+            stack.pop()
+            cuts.append((i + 1, ''.join(reversed(stack))))
+            if not stack:
+                return _loads_lenient(text[:i + 1])
+        elif char == ',':
+            cuts.append((i, ''.join(reversed(stack))))
+    for position, closers in reversed(cuts):
+        try:
+            value = _loads_lenient(text[:position] + closers)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    raise ValueError("no complete member to keep")
+
+
+def _number(value, field, warnings):
+    """A JSON value as a number: numbers as-is, strings like "510 kcal" or "450-550" (midpoint)"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, str):
+        # A hyphen between numbers is a range, not a sign
+        numbers = [abs(float(n.replace(',', ''))) for n in NUMBER.findall(value.replace(' - ', '-'))][:2]
+        if not numbers:
+            return None
+        warnings.append(f"{field} given as text {value!r}")
+        value = sum(numbers) / len(numbers)
+    if not isinstance(value, (int, float)) or value != value:
+        return None
+    return int(value) if float(value).is_integer() else value
+
+
+def _extract(text):
+    """(json object, status) from a reply: fenced block after the marker, a cut-off block, any fenced block"""
+    marker = None
+    for marker in MARKER.finditer(text):
+        pass
+    if marker:
+        tail = text[marker.end():]
+        fenced = FENCED.match(tail.lstrip())
+        if fenced:
+            return _loads_lenient(fenced.group(1)), 'complete'
+        start = tail.find('{')
+        if start != -1:
+            return _repair_truncated(tail[start:]), 'partial'
+    for block in reversed(FENCED.findall(text)):
+        try:
+            value = _loads_lenient(block)
+        except ValueError:
+            continue
+        if isinstance(value, dict) and 'calories' in value:
+            return value, 'complete'
+    return None, 'missing'
+
+
+def _title(value, warnings):
+    title = value.strip().strip('*[]').strip() if isinstance(value, str) else None
+    if title and (len(title) > MAX_TITLE_LENGTH or any(p in title.lower() for p in INVALID_TITLE_PHRASES)):
+        warnings.append(f"ignored title {title!r}")
+        return None
+    return title or None
+
+
+def _legacy(text, warnings):
+    """Macros from the plain-text format, or None"""
+    end = text[-1500:]
+    macros = {}
+    for field, pattern in LEGACY_MACROS.items():
+        match = pattern.search(end)
+        if not match:
+            return None
+        macros[field] = _number(match.group(1), field, [])
+    title = LEGACY_TITLE.search(text[:500])
+    return {'title': _title(title.group(1), warnings) if title else None, **macros}
+
+
+def parse_analysis(text):
+    """Structured nutrition from an analysis reply, shaped like the app's extractNutritionData()
+
+    Returns a dict with status ('complete', 'partial' for a block cut off
+    mid-way, 'legacy' for the old plain-text format, 'invalid' when the
+    required macros are missing or out of range, 'missing' when there is no
+    nutrition data at all), the parsed fields (None where absent) and a list
+    of warnings about anything repaired or dropped.
+    """
+    warnings = []
+    try:
+        data, status = _extract(text or '')
+    except ValueError as e:
+        data, status = None, 'missing'
+        warnings.append(f"unreadable NUTRITION_DATA block: {e}")
+    if data is not None and not isinstance(data, dict):
+        data, status = None, 'missing'
+    if data is None:
+        data = _legacy(text or '', warnings)
+        if data is None:
+            return {'status': status, 'macros': None, 'extendedMetrics': None, 'title': None, 'certainty': None,
+                    'foodItems': None, 'atwaterCheck': None, 'activeQuery': None, 'warnings': warnings}
+        status = 'legacy'
+
+    macros = {field: _number(data.get(field), field, warnings) for field in REQUIRED}
+    missing = [field for field, value in macros.items() if value is None]
+    out_of_range = [field for field, value in macros.items()
+                    if value is not None and not 0 <= value <= LIMITS[field]]
+    if missing or out_of_range:
+        warnings.extend([f"missing {field}" for field in missing] + [f"{field} out of range" for field in out_of_range])
+        status = 'invalid'
+        macros = None
+
+    def group(key):
+        value = data.get(key)
+        if not isinstance(value, dict):
+            return None, None
+        return _number(value.get('calories'), f'{key}.calories', warnings), _number(value.get('percent'), f'{key}.percent', warnings)
+
+    processed_calories, processed_percent = group('processed')
+    ultra_calories, ultra_percent = group('ultraProcessed')
+    # Ultra-processed is a subset of processed
+    if processed_percent is not None and ultra_percent is not None and processed_percent < ultra_percent:
+        warnings.append("processed percent raised to ultra-processed percent")
+        processed_percent = ultra_percent
+    if processed_calories is not None and ultra_calories is not None and processed_calories < ultra_calories:
+        warnings.append("processed calories raised to ultra-processed calories")
+        processed_calories = ultra_calories
+    extended = {
+        'processedCalories': processed_calories,
+        'processedPercent': processed_percent,
+        'ultraProcessedCalories': ultra_calories,
+        'ultraProcessedPercent': ultra_percent,
+        'fiber': _number(data.get('fiber'), 'fiber', warnings),
+        'caffeine': _number(data.get('caffeine'), 'caffeine', warnings),
+        'freshProduce': _number(data.get('freshProduce'), 'freshProduce', warnings),
+    }
+
+    certainty = _number(data.get('certainty'), 'certainty', warnings)
+    atwater = data.get('atwaterCheck')
+    active_query = data.get('activeQuery')
+    return {
+        'status': status,
+        'macros': macros,
+        'extendedMetrics': extended if any(v is not None for v in extended.values()) else None,
+        'title': _title(data.get('title'), warnings),
+        'certainty': certainty if certainty is not None and 0 <= certainty <= 10 else None,
+        'foodItems': [item for item in data['foodItems'] if isinstance(item, dict)]
+                     if isinstance(data.get('foodItems'), list) else None,
+        'atwaterCheck': atwater if isinstance(atwater, dict) and isinstance(atwater.get('passed'), bool) else None,
+        'activeQuery': active_query.strip() if isinstance(active_query, str) and active_query.strip() else None,
+        'warnings': warnings,
+    }
+
+
+def parse_response(result):
+    """parse_analysis() of a Messages response's text"""
+    return parse_analysis(response_text(result))
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Local nutrition reference for text-only analyze
+Text like "100g chicken breast and a cup of rice" needs no model: it names
+common foods with explicit amounts. nutrition_reference.csv lists per-100g
+values (USDA FoodData Central, rounded) for everyday foods plus their NOVA
+group, typical piece weight and grams per cup. It is compiled into a small
+binary file that every worker maps read-only:
+
+    header   magic, food count, key count, section offsets
+    foods    fixed-size records: per-100g kcal, protein, carbs, fat, fiber,
+             caffeine, grams per piece, grams per cup, NOVA group, produce
+             flag and the display name's offset into the string table
+    keys     sorted (string offset, length, food index) for every name and
+             alias, so a lookup is a binary search over the mapping
+    strings  UTF-8 names
+
+Nothing is parsed or copied into Python objects at startup, memory is the
+size of the file (shared between workers through the page cache), and
+lookups touch a handful of pages.
+
+estimate() splits a description into items ("2 eggs, 1 slice toast and a
+banana"), parses each into quantity, unit and food, and returns totals only
+when every item resolves to a known food with a usable amount. Anything
+else (no amount, unknown food, a volume for a food without a cup weight, a
+count of pieces with a size word like "2 large eggs" or "a whole pizza") is
+left to Claude.
+
+Usage:
+  python3 nutrition_reference.py                     # compile nutrition_reference.bin
+  python3 nutrition_reference.py "2 eggs and 1 slice toast"
+"""
+
+import csv
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nutrition_reference.csv')
+
+MAGIC = b'FUELNR01'
+HEADER = struct.Struct('<8sIIIII')  # magic, foods, keys, foods offset, keys offset, strings offset
+FOOD = struct.Struct('<8fBBHI')  # kcal, protein, carbs, fat, fiber, caffeine, each g, cup g; nova, produce, name len, name offset
+KEY = struct.Struct('<IHH')  # string offset, length, food index
+NUTRIENTS = ('kcal', 'protein', 'carbs', 'fat', 'fiber', 'caffeine_mg')
+# CSV columns stored as floats, in FOOD order (blank piece/cup weights become NaN)
+NUMBERS_IN_ROW = NUTRIENTS + ('grams_each', 'grams_per_cup')
+
+# Share of a food's calories counted as processed, by NOVA group (the app prompt's weights)
+PROCESSED_SHARE = {1: 0.0, 2: 1.0, 3: 0.7, 4: 1.0}
+
+# unit -> (kind, grams or millilitres per unit)
+UNITS = {name: (kind, amount) for names, kind, amount in (
+    (('g', 'gram', 'grams', 'gr'), 'mass', 1.0),
+    (('kg', 'kilogram', 'kilograms'), 'mass', 1000.0),
+    (('oz', 'ounce', 'ounces'), 'mass', 28.35),
+    (('lb', 'lbs', 'pound', 'pounds'), 'mass', 453.6),
+    (('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'), 'volume', 1.0),
+    (('l', 'liter', 'liters', 'litre', 'litres'), 'volume', 1000.0),
+    (('fl oz', 'fluid ounce', 'fluid ounces'), 'volume', 29.57),
+    (('cup', 'cups', 'glass', 'glasses', 'mug', 'mugs'), 'volume', 240.0),
+    (('tbsp', 'tablespoon', 'tablespoons'), 'volume', 15.0),
+    (('tsp', 'teaspoon', 'teaspoons'), 'volume', 5.0),
+    (('piece', 'pieces', 'slice', 'slices', 'strip', 'strips', 'can', 'cans', 'bottle', 'bottles',
+      'scoop', 'scoops', 'shot', 'shots', 'link', 'links'), 'count', 1.0),
+) for name in names}
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'dozen': 12,
+    'half': 0.5, 'half a': 0.5, 'half an': 0.5, 'a half': 0.5, 'quarter': 0.25, 'a quarter': 0.25,
+}
+FRACTIONS = {'½': ' 1/2', '⅓': ' 1/3', '⅔': ' 2/3', '¼': ' 1/4', '¾': ' 3/4'}
+
+# Words that describe preparation but not which food (or how much of it); dropped before lookup
+MODIFIERS = frozenset((
+    'grilled', 'cooked', 'boiled', 'hard', 'soft', 'baked', 'roasted', 'steamed', 'raw', 'fresh',
+    'plain', 'poached', 'scrambled', 'organic', 'skinless', 'boneless', 'unsweetened', 'sliced',
+    'chopped', 'diced', 'regular', 'of',
+))
+# Words that change how much one piece weighs: fine next to grams or cups, ambiguous next to a count
+SIZE_WORDS = frozenset(('small', 'medium', 'large', 'big', 'whole'))
+SLICE_UNITS = ('slice', 'slices')
+
+_NUMBER = r'\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+'
+_QUANTITY = rf'(?:{_NUMBER}|(?:{"|".join(sorted((re.escape(w) for w in NUMBER_WORDS), key=len, reverse=True))})\b)'
+_UNIT = '|'.join(sorted((re.escape(u) for u in UNITS), key=len, reverse=True))
+# "100g chicken", "a cup of rice", "2 eggs", "chicken breast 150 g"
+LEADING = re.compile(rf'^(?P<qty>{_QUANTITY})\s*(?:(?P<unit>{_UNIT})\b\.?\s*)?(?:of\s+)?(?P<food>.+)$')
+TRAILING = re.compile(rf'^(?P<food>.+?)\s*,?\s+(?P<qty>{_NUMBER})\s*(?P<unit>{_UNIT})\b\.?$')
+SEPARATORS = re.compile(r'\s*(?:,|;|\+|&|\n|\band\b|\bwith\b|\bplus\b)\s*')
+MAX_ITEMS = 12
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'[a-z]+', text.lower()))
+
+
+def compile_reference(source=SOURCE, target=None):
+    """Compile the CSV into the binary lookup file; returns its path"""
+    target = target or os.path.splitext(source)[0] + '.bin'
+    foods, names, keys, strings = [], [], {}, bytearray()
+
+    def string(text):
+        offset = len(strings)
+        strings.extend(text.encode('utf-8'))
+        return offset, len(strings) - offset
+
+    with open(source, newline='') as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            name_offset, name_length = string(row['name'])
+            values = [float(row[n]) if row[n] else math.nan for n in NUMBERS_IN_ROW]
+            names.append(row['name'])
+            foods.append(FOOD.pack(*values, int(row['nova']), int(row['produce']), name_length, name_offset))
+            for key in [row['name']] + [a for a in row['aliases'].split(';') if a]:
+                key = normalize(key)
+                if key in keys:
+                    raise ValueError(f"{key!r} names both {names[keys[key]]} and {row['name']}")
+                keys[key] = index
+
+    key_records = []
+    for key in sorted(keys):
+        offset, length = string(key)
+        key_records.append(KEY.pack(offset, length, keys[key]))
+    foods_offset = HEADER.size
+    keys_offset = foods_offset + len(foods) * FOOD.size
+    strings_offset = keys_offset + len(key_records) * KEY.size
+
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, len(foods), len(key_records), foods_offset, keys_offset, strings_offset))
+            out.write(b''.join(foods))
+            out.write(b''.join(key_records))
+            out.write(strings)
+        # Workers may be mapping the old file; replacing it leaves their mapping intact
+        os.replace(temp, target)
+    except BaseException:
+        os.unlink(temp)
+        raise
+    return target
+
+
+def parse_quantity(text):
+    text = text.strip()
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    whole, _, fraction = text.rpartition(' ') if ' ' in text else ('', '', text)
+    if '/' in fraction:
+        numerator, denominator = fraction.split('/')
+        if float(denominator) == 0:
+            return None
+        return (float(whole) if whole else 0.0) + float(numerator) / float(denominator)
+    return float(text)
+
+
+class NutritionReference:
+    """Read-only, memory-mapped view of the compiled reference"""
+
+    def __init__(self, path=None, source=SOURCE):
+        self.path = path or os.path.splitext(source)[0] + '.bin'
+        if os.path.exists(source) and (not os.path.exists(self.path)
+                                       or os.path.getmtime(self.path) < os.path.getmtime(source)):
+            compile_reference(source, self.path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.food_count, self.key_count, self._foods, self._keys, self._strings = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a compiled nutrition reference")
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_ms_total = 0.0
+
+    def _key(self, position):
+        offset, length, food = KEY.unpack_from(self._map, self._keys + position * KEY.size)
+        start = self._strings + offset
+        return self._map[start:start + length], food
+
+    def _find(self, key):
+        """Food index for an exact normalized key, or None"""
+        wanted = key.encode('utf-8')
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            found, food = self._key(middle)
+            if found < wanted:
+                low = middle + 1
+            elif found > wanted:
+                high = middle
+            else:
+                return food
+        return None
+
+    def food(self, index):
+        values = FOOD.unpack_from(self._map, self._foods + index * FOOD.size)
+        *numbers, nova, produce, name_length, name_offset = values
+        start = self._strings + name_offset
+        food = dict(zip(NUMBERS_IN_ROW, numbers))
+        food.update(name=self._map[start:start + name_length].decode('utf-8'), nova=nova, produce=bool(produce))
+        return food
+
+    def find(self, name, sized=True):
+        """The reference food a name refers to, or None
+
+        Size words that aren't part of a food's name ("whole milk") are only
+        skipped when sized is true, i.e. when the amount doesn't depend on them.
+        """
+        words = [w for w in normalize(name).split() if w not in MODIFIERS]
+        food = self._lookup(words)
+        if food is None and sized:
+            food = self._lookup([w for w in words if w not in SIZE_WORDS])
+        return food
+
+    def _lookup(self, words):
+        if not words:
+            return None
+        phrase = ' '.join(words)
+        candidates = [phrase]
+        # Plurals not listed as aliases: "peaches" -> "peach", "berries" -> "berry"
+        for suffix, replacement in (('ies', 'y'), ('es', ''), ('s', '')):
+            if phrase.endswith(suffix):
+                candidates.append(phrase[:-len(suffix)] + replacement)
+        for candidate in candidates:
+            index = self._find(candidate)
+            if index is not None:
+                return self.food(index)
+        return None
+
+    def parse_item(self, text):
+        """{'food', 'grams', 'quantity', 'unit'} for one "amount food" phrase, or None"""
+        text = ' '.join(text.lower().split())
+        for pattern in (LEADING, TRAILING):
+            match = pattern.match(text)
+            if match:
+                break
+        else:
+            return None
+        unit = match.group('unit')
+        kind, amount = UNITS[unit] if unit else ('count', 1.0)
+        # "a large pizza" or "2 big eggs": the piece weight doesn't say how much that is
+        food = self.find(match.group('food'), sized=kind != 'count')
+        if unit in SLICE_UNITS:
+            # "2 slices of pizza": some foods only have a per-piece weight as slices
+            food = self.find(match.group('food') + ' slice', sized=False) or food
+        quantity = parse_quantity(match.group('qty'))
+        if food is None or not quantity or quantity <= 0:
+            return None
+        if kind == 'mass':
+            grams = quantity * amount
+        elif kind == 'volume':
+            grams = quantity * amount / 240.0 * food['grams_per_cup']
+        else:
+            grams = quantity * food['grams_each']
+        if math.isnan(grams):
+            # No piece or cup weight for this food: the amount is ambiguous
+            return None
+        return {'food': food, 'grams': grams, 'quantity': quantity, 'unit': unit}
+
+    def estimate(self, description):
+        """Nutrition totals and items for a description made only of known foods and amounts, else None"""
+        started = time.perf_counter()
+        parts = [p for p in SEPARATORS.split(description.replace('\u00a0', ' ')) if p.strip()]
+        for symbol, replacement in FRACTIONS.items():
+            parts = [p.replace(symbol, replacement) for p in parts]
+        items = [self.parse_item(p) for p in parts] if 0 < len(parts) <= MAX_ITEMS else [None]
+        result = _totals(items) if all(items) else None
+        self.lookups += 1
+        self.hits += result is not None
+        self.lookup_ms_total += (time.perf_counter() - started) * 1000
+        return result
+
+    def stats(self):
+        return {
+            'foods': self.food_count,
+            'keys': self.key_count,
+            'bytes': len(self._map),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 3) if self.lookups else None,
+            'avg_lookup_ms': round(self.lookup_ms_total / self.lookups, 3) if self.lookups else None,
+        }
+
+    def close(self):
+        self._map.close()
+
+
+def _totals(items):
+    totals = dict.fromkeys(('calories', 'protein', 'carbs', 'fat', 'fiber', 'caffeine', 'fresh_produce',
+                            'processed_calories', 'ultra_processed_calories'), 0.0)
+    rows = []
+    for item in items:
+        food, scale = item['food'], item['grams'] / 100.0
+        calories = food['kcal'] * scale
+        row = {'name': food['name'], 'weight': round(item['grams']), 'calories': round(calories),
+               'protein': round(food['protein'] * scale, 1), 'carbs': round(food['carbs'] * scale, 1),
+               'fat': round(food['fat'] * scale, 1)}
+        rows.append(row)
+        totals['calories'] += calories
+        totals['protein'] += food['protein'] * scale
+        totals['carbs'] += food['carbs'] * scale
+        totals['fat'] += food['fat'] * scale
+        totals['fiber'] += food['fiber'] * scale
+        totals['caffeine'] += food['caffeine_mg'] * scale
+        totals['fresh_produce'] += item['grams'] if food['produce'] else 0.0
+        totals['processed_calories'] += calories * PROCESSED_SHARE[food['nova']]
+        totals['ultra_processed_calories'] += calories if food['nova'] == 4 else 0.0
+    return {'totals': totals, 'items': rows}
+
+
+def nutrition(estimate):
+    """The estimate as the app's NUTRITION_DATA object"""
+    totals = estimate['totals']
+    calories = totals['calories']
+
+    def percent(part):
+        return round(part / calories * 100) if calories else 0
+
+    names = [item['name'] for item in estimate['items']]
+    # The app wants a two-word title: the first food, padded with the second one's main word
+    title = names[0].split()[:2]
+    if len(title) < 2 and len(names) > 1:
+        title.append(names[1].split()[-1])
+    atwater = 4 * totals['protein'] + 4 * totals['carbs'] + 9 * totals['fat']
+    return {
+        'title': ' '.join(w.capitalize() for w in title),
+        'certainty': 8,
+        'calories': round(calories),
+        'protein': round(totals['protein']),
+        'fat': round(totals['fat']),
+        'carbs': round(totals['carbs']),
+        'fiber': round(totals['fiber']),
+        'caffeine': 5 * round(totals['caffeine'] / 5),
+        'freshProduce': 10 * round(totals['fresh_produce'] / 10),
+        'processed': {'percent': percent(totals['processed_calories']), 'calories': round(totals['processed_calories'])},
+        'ultraProcessed': {'percent': percent(totals['ultra_processed_calories']),
+                           'calories': round(totals['ultra_processed_calories'])},
+        'foodItems': [dict(item, confidence=0.9, source=f"Reference: {item['name']} (100g)", matched=True)
+                      for item in estimate['items']],
+        'atwaterCheck': {
+            # Reference kcal already account for fiber and alcohol, so 4/4/9 only agrees roughly
+            'passed': abs(calories - atwater) <= max(0.15 * calories, 20),
+            'calculatedCalories': round(atwater),
+            'difference': round(calories - atwater),
+        },
+        'activeQuery': None,
+    }
+
+
+def main():
+    if len(sys.argv) > 1:
+        reference = NutritionReference()
+        started = time.perf_counter()
+        estimate = reference.estimate(' '.join(sys.argv[1:]))
+        elapsed = (time.perf_counter() - started) * 1000
+        if estimate is None:
+            print(f"❓ Not answerable from the reference ({elapsed:.2f}ms); would go to Claude")
+            return 1
+        import json
+        print(json.dumps(nutrition(estimate), indent=2))
+        print(f"⏱️ {elapsed:.2f}ms")
+        return 0
+    target = compile_reference()
+    print(f"✅ Compiled {target} ({os.path.getsize(target):,} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
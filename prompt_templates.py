@@ -0,0 +1,206 @@
+"""
+Versioned analyze prompt templates held on the server
+The app used to build the whole nutrition prompt itself and upload it with
+every analyze request. Templates live in prompts/<id>.v<version>.txt and
+the app only names one, so the request is assembled here:
+
+    {"prompt": {"id": "analyze", "version": 1,
+                "variables": {"description": "...", "multiple_dishes": false,
+                              "meal_preparation": "restaurant"}},
+     "images": ["<base64 jpeg>", {"media_type": "image/png", "data": "..."}],
+     "messages": [...earlier turns, for follow-ups...]}
+
+A template file starts with `key: value` settings (model, max_tokens) and
+`#` comments, followed by sections:
+
+    === system                       static instructions, sent as the system
+                                     prompt and marked for Anthropic prompt
+                                     caching, so repeat requests read it from
+                                     the upstream cache instead of paying for it
+    === user                         the new user turn (optional); ${name}
+                                     placeholders are fragments or variables
+    === items when multiple_dishes=yes
+                                     a fragment: fills ${items} when every
+                                     key=value condition holds, else ''
+
+Variables are strings (true/false become yes/no, null becomes none). Three
+are derived from the request: image_count, several (yes with more than one
+image) and input (images, images_and_text or text_only).
+"""
+
+import os
+import re
+import string
+
+_FILENAME = re.compile(r'^([a-z0-9_-]+)\.v(\d+)\.txt$')
+_SECTION = re.compile(r'^=== (\w+)(?: when (.+))?$')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+DEFAULT_MEDIA_TYPE = 'image/jpeg'
+MEDIA_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+
+
+class PromptError(ValueError):
+    """A templated analyze request that can't be assembled (unknown template, bad variables)"""
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    if value is None:
+        return 'none'
+    if isinstance(value, (int, float, str)):
+        return str(value)
+    raise PromptError(f"variables must be strings, numbers or booleans, not {type(value).__name__}")
+
+
+class PromptTemplate:
+    """One parsed prompts/<id>.v<version>.txt file"""
+
+    def __init__(self, prompt_id, version, text):
+        self.id = prompt_id
+        self.version = version
+        self.settings = {}
+        self.description = None
+        self.system = None
+        self.user = None
+        self.fragments = {}
+
+        name, conditions, body = None, None, []
+        for line in text.split('\n') + ['=== end']:
+            section = _SECTION.match(line)
+            if not section:
+                if name is not None:
+                    body.append(line)
+                elif line.startswith('#'):
+                    self.description = self.description or line.lstrip('# ').strip()
+                elif line.strip():
+                    key, _, value = line.partition(':')
+                    self.settings[key.strip()] = value.strip()
+                continue
+            if name is not None:
+                self._add(name, conditions, '\n'.join(body).rstrip('\n'))
+            name, body = section.group(1), []
+            conditions = dict(pair.split('=', 1) for pair in section.group(2).split()) if section.group(2) else None
+        if not self.system:
+            raise ValueError(f"{self.id} v{self.version}: no === system section")
+        self.model = self.settings.get('model')
+        self.max_tokens = int(self.settings.get('max_tokens', 3000))
+
+    def _add(self, name, conditions, body):
+        if name == 'system' and conditions is None:
+            self.system = body
+        elif name == 'user' and conditions is None:
+            self.user = string.Template(body)
+        else:
+            self.fragments.setdefault(name, []).append((conditions or {}, string.Template(body)))
+
+    def _fragment(self, name, variables):
+        for conditions, body in self.fragments.get(name, ()):
+            if all(variables.get(key) == value for key, value in conditions.items()):
+                return self._substitute(body, variables)
+        return ''
+
+    def _substitute(self, template, variables):
+        try:
+            return template.substitute(variables)
+        except KeyError as e:
+            raise PromptError(f"{self.id} v{self.version} needs variable {e.args[0]}")
+        except ValueError as e:
+            raise PromptError(f"{self.id} v{self.version}: {e}")
+
+    def render_user(self, variables):
+        """The user turn text; fragments first fill their placeholders, then variables"""
+        values = dict(variables, **{name: self._fragment(name, variables) for name in self.fragments})
+        return _BLANK_LINES.sub('\n\n', self._substitute(self.user, values)).strip()
+
+    def info(self):
+        return {'version': self.version, 'description': self.description, 'model': self.model,
+                'max_tokens': self.max_tokens, 'user_turn': self.user is not None}
+
+
+def image_block(image):
+    if isinstance(image, str):
+        media_type, data = DEFAULT_MEDIA_TYPE, image
+    elif isinstance(image, dict):
+        media_type, data = image.get('media_type') or DEFAULT_MEDIA_TYPE, image.get('data')
+    else:
+        media_type, data = None, None
+    if not isinstance(data, str) or not data or media_type not in MEDIA_TYPES:
+        raise PromptError("images must be base64 strings or {media_type, data} objects")
+    return {'type': 'image', 'source': {'type': 'base64', 'media_type': media_type, 'data': data}}
+
+
+class PromptTemplates:
+    """Every template under root, loaded once at startup"""
+
+    def __init__(self, root):
+        self.root = root
+        self.templates = {}
+        for filename in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            match = _FILENAME.match(filename)
+            if not match:
+                continue
+            with open(os.path.join(root, filename), encoding='utf-8') as f:
+                template = PromptTemplate(match.group(1), int(match.group(2)), f.read())
+            self.templates.setdefault(template.id, {})[template.version] = template
+
+    def get(self, prompt_id, version=None):
+        versions = self.templates.get(prompt_id)
+        if not versions:
+            raise PromptError(f"Unknown prompt template: {prompt_id}")
+        if version is None:
+            return versions[max(versions)]
+        try:
+            return versions[int(version)]
+        except (KeyError, TypeError, ValueError):
+            raise PromptError(f"Unknown version {version} of prompt template {prompt_id} "
+                              f"(available: {', '.join(str(v) for v in sorted(versions))})")
+
+    def build(self, body):
+        """The Messages API payload for a templated request body ({"prompt": {...}, "images", "messages"})"""
+        ref = body.get('prompt')
+        if isinstance(ref, str):
+            ref = {'id': ref}
+        if not isinstance(ref, dict) or not ref.get('id'):
+            raise PromptError("prompt must be a template id or {id, version, variables}")
+        template = self.get(ref['id'], ref.get('version'))
+
+        variables = ref.get('variables') or {}
+        if not isinstance(variables, dict):
+            raise PromptError("prompt.variables must be an object")
+        description = variables.get('description') or ''
+        if not isinstance(description, str):
+            raise PromptError("prompt.variables.description must be a string")
+        variables = {key: _value(value) for key, value in variables.items()}
+        images = [image_block(image) for image in body.get('images') or []]
+        description = variables['description'] = description.strip()
+        variables['image_count'] = str(len(images))
+        variables['several'] = 'yes' if len(images) > 1 else 'no'
+        variables['input'] = ('images_and_text' if description else 'images') if images else 'text_only'
+
+        messages = body.get('messages') or []
+        if not isinstance(messages, list):
+            raise PromptError("messages must be a list")
+        messages = list(messages)
+        if template.user is not None:
+            if not images and not description:
+                raise PromptError("images or a description required")
+            messages.append({'role': 'user', 'content': images + [
+                {'type': 'text', 'text': template.render_user(variables)}]})
+        elif images:
+            raise PromptError(f"prompt template {template.id} takes no images; send them in messages")
+        if not messages:
+            raise PromptError("messages required")
+
+        return {
+            'model': template.model,
+            'max_tokens': template.max_tokens,
+            # Identical for every request on this template version, so it's the cached prefix
+            'system': [{'type': 'text', 'text': template.system, 'cache_control': {'type': 'ephemeral'}}],
+            'messages': messages,
+        }
+
+    def stats(self):
+        return {prompt_id: {'latest': max(versions), 'versions': [versions[v].info() for v in sorted(versions)]}
+                for prompt_id, versions in self.templates.items()}
@@ -0,0 +1,196 @@
+"""
+Saved-meal matching for text-only analyze
+Many text-only analyses are a user typing the name of a meal they already
+saved ("usual oatmeal", "Chipotle bowl"). The saved template already holds
+the macros they accepted, so a confident match is answered from it
+instantly instead of asking Claude again.
+
+Each worker keeps a per-user index of saved meal names: the character
+trigrams of every normalized name, plus an inverted trigram -> meals map so
+scoring a description only touches meals that share a trigram with it.
+Similarity is the Dice coefficient of the two trigram sets. Numbers must
+agree exactly ("2 eggs" never matches a saved "eggs"), since the quantity
+is what the macros depend on.
+
+The save/delete endpoints apply their own change to this worker's index.
+Other workers notice through the user_cache generation of the user's saved
+meals (bumped by every write) and rebuild that user's index on the next
+lookup.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from nutrition_data import local_response
+
+_WORD = re.compile(r'[a-z0-9]+')
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+
+def normalize(text):
+    return ' '.join(_WORD.findall((text or '').lower()))
+
+
+def trigrams(text):
+    """Character trigrams of normalized text, padded so short words still count"""
+    padded = f'  {normalize(text)} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def numbers(text):
+    return frozenset(float(n) for n in _NUMBER.findall(text or ''))
+
+
+class _UserIndex:
+    __slots__ = ('version', 'built_at', 'meals', 'grams', 'postings')
+
+    def __init__(self, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.meals = {}
+        self.grams = {}
+        self.postings = {}
+
+    def add(self, meal):
+        self.remove(meal['id'])
+        grams = trigrams(meal.get('name'))
+        if not grams:
+            return
+        self.meals[meal['id']] = meal
+        self.grams[meal['id']] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(meal['id'])
+
+    def remove(self, meal_id):
+        self.meals.pop(meal_id, None)
+        for gram in self.grams.pop(meal_id, ()):
+            ids = self.postings[gram]
+            ids.discard(meal_id)
+            if not ids:
+                del self.postings[gram]
+
+    def best(self, description):
+        """(score, meal) of the closest saved name, or (0.0, None)"""
+        query = trigrams(description)
+        shared = {}
+        for gram in query:
+            for meal_id in self.postings.get(gram, ()):
+                shared[meal_id] = shared.get(meal_id, 0) + 1
+        best = (0.0, None)
+        for meal_id, count in shared.items():
+            score = 2 * count / (len(query) + len(self.grams[meal_id]))
+            if score > best[0]:
+                best = (score, self.meals[meal_id])
+        return best
+
+
+class SavedMealMatcher:
+    """Per-user saved-meal name index; load(user_id) lists templates, version(user_id) detects writes"""
+
+    def __init__(self, load, version, min_score=0.85, max_users=1000, max_age=600):
+        self.load = load
+        self.version = version
+        self.min_score = min_score
+        self.max_users = max_users
+        # Bounds how long a write racing one of ours (same generation check) can go unseen
+        self.max_age = max_age
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.rebuilds = 0
+        self.lookup_ms_total = 0.0
+
+    def _index(self, user_id):
+        """This user's index, rebuilt if another worker changed their saved meals (caller holds _lock)"""
+        version = self.version(user_id)
+        index = self._users.get(user_id)
+        if index is None or index.version != version or time.monotonic() - index.built_at > self.max_age:
+            index = _UserIndex(version)
+            for meal in self.load(user_id):
+                index.add(meal)
+            self._users[user_id] = index
+            self.rebuilds += 1
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return index
+
+    def match(self, user_id, description):
+        """{'score', 'meal'} for a confident match of description to a saved meal, else None"""
+        started = time.perf_counter()
+        with self._lock:
+            score, meal = self._index(user_id).best(description)
+        if meal is not None and (score < self.min_score or numbers(description) != numbers(meal.get('name'))):
+            meal = None
+        self.lookups += 1
+        self.hits += meal is not None
+        self.lookup_ms_total += (time.perf_counter() - started) * 1000
+        return {'score': round(score, 3), 'meal': meal} if meal else None
+
+    def saved(self, user_id, meal, previous_version):
+        """Apply a save by this worker; previous_version is version(user_id) read before invalidating"""
+        self._apply(user_id, previous_version, lambda index: index.add(meal))
+
+    def deleted(self, user_id, meal_id, previous_version):
+        self._apply(user_id, previous_version, lambda index: index.remove(meal_id))
+
+    def _apply(self, user_id, previous_version, change):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                return
+            if index.version != previous_version:
+                # Already stale: another worker wrote too, so rebuild from the database next time
+                del self._users[user_id]
+                return
+            change(index)
+            index.version = self.version(user_id)
+
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 3) if self.lookups else None,
+            'avg_lookup_ms': round(self.lookup_ms_total / self.lookups, 3) if self.lookups else None,
+            'rebuilds': self.rebuilds,
+            'users': len(self._users),
+        }
+
+
+def nutrition_response(meal, score, model=None):
+    """A Messages-shaped analyze response carrying the saved meal's macros in the app's NUTRITION_DATA block"""
+    def number(key):
+        # PostgreSQL hands DECIMAL columns back as Decimal
+        value = float(meal.get(key) or 0)
+        return int(value) if value.is_integer() else round(value, 1)
+
+    nutrition = {
+        'title': meal['name'],
+        'certainty': 9,
+        'calories': number('calories'),
+        'protein': number('protein'),
+        'fat': number('fat'),
+        'carbs': number('carbs'),
+        'fiber': number('fiber'),
+        'caffeine': number('caffeine'),
+        'freshProduce': number('fresh_produce'),
+        'processed': {'percent': number('processed_percent'), 'calories': number('processed_calories')},
+        'ultraProcessed': {'percent': number('ultra_processed_percent'),
+                           'calories': number('ultra_processed_calories')},
+        'foodItems': [{
+            'name': meal['name'], 'calories': number('calories'), 'protein': number('protein'),
+            'carbs': number('carbs'), 'fat': number('fat'), 'confidence': 1.0,
+            'source': f"Saved meal: {meal['name']}", 'matched': True
+        }],
+        'atwaterCheck': None,
+        'activeQuery': None,
+    }
+    return local_response(
+        f"saved_meal_{meal['id']}",
+        f"This matches your saved meal \"{meal['name']}\", so these are the values you saved for it.",
+        nutrition, model,
+        saved_meal_match={'id': meal['id'], 'name': meal['name'], 'score': score}
+    )
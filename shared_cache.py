@@ -0,0 +1,264 @@
+"""
+Cache backends shared by the server's caches
+Both backends expose the same small interface:
+
+    get(namespace, key) -> bytes or None
+    generation(namespace) -> int
+    set(namespace, key, value, ttl=None, generation=None)
+    delete(namespace, key)
+    invalidate(namespace)      # bump the namespace generation
+    stats()
+
+SQLiteCache keeps entries in a local SQLite file (WAL mode) so every
+gunicorn worker on the host sees one copy: sets are atomic, entries expire
+after their TTL and the least recently used ones are evicted once the total
+size passes max_bytes or there are more than max_entries of them. Invalidation bumps a per-namespace generation; entries
+written under an older generation are never returned again, in any process.
+Read-through callers take generation() before loading from the database
+and pass it to set(), so a load that raced with an invalidation is dropped
+instead of cached. MemoryCache is the per-process equivalent for
+single-worker/dev setups.
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class SQLiteCache:
+    """Cross-process cache in a local SQLite WAL file"""
+
+    def __init__(self, path=None, max_bytes=64 * 1024 * 1024, default_ttl=3600, touch_interval=30, max_entries=10000):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'fuell_cache.db')
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        # LRU recency is only refreshed this often per entry so hits stay (mostly) read-only
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._init_schema()
+
+    # -- storage ----------------------------------------------------------
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed)')
+        conn.execute('CREATE TABLE IF NOT EXISTS generations (namespace TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                bytes INTEGER NOT NULL,
+                entries INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        with self._transaction() as conn:
+            if 'entries' not in {row[1] for row in conn.execute('PRAGMA table_info(totals)')}:
+                # Cache file from before the entry cap: start the counter from what's there
+                conn.execute('ALTER TABLE totals ADD COLUMN entries INTEGER NOT NULL DEFAULT 0')
+                conn.execute('UPDATE totals SET entries = (SELECT COUNT(*) FROM entries) WHERE id = 1')
+            conn.execute('INSERT OR IGNORE INTO totals (id, bytes, entries) VALUES (1, 0, 0)')
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so read-modify-write is atomic across processes
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _generation(conn, namespace):
+        row = conn.execute('SELECT generation FROM generations WHERE namespace = ?', (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    # -- interface ----------------------------------------------------------
+
+    def get(self, namespace, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('''
+            SELECT e.value, e.accessed FROM entries e
+            WHERE e.namespace = ? AND e.key = ? AND e.expires > ?
+              AND e.generation = COALESCE((SELECT generation FROM generations WHERE namespace = e.namespace), 0)
+        ''', (namespace, key, now)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.touch_interval:
+            conn.execute('UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?', (now, namespace, key))
+        return bytes(row[0])
+
+    def generation(self, namespace):
+        return self._generation(self._connect(), namespace)
+
+    def set(self, namespace, key, value, ttl=None, generation=None):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        size = len(value)
+        if size > self.max_bytes // 8:
+            # One huge value shouldn't flush everything else
+            return
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._transaction() as conn:
+            current = self._generation(conn, namespace)
+            if generation is not None and generation != current:
+                # Invalidated while the caller was loading: the value may already be stale
+                return
+            old = conn.execute('SELECT size FROM entries WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+            conn.execute('''
+                INSERT OR REPLACE INTO entries (namespace, key, generation, value, size, expires, accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (namespace, key, current, value, size, now + ttl, now))
+            conn.execute('UPDATE totals SET bytes = bytes + ?, entries = entries + ? WHERE id = 1',
+                         (size - (old[0] if old else 0), 0 if old else 1))
+            if random.random() < 0.01:
+                self._delete_where(conn, 'expires <= ?', (now,))
+            self._evict(conn)
+
+    def delete(self, namespace, key):
+        with self._transaction() as conn:
+            self._delete_where(conn, 'namespace = ? AND key = ?', (namespace, key))
+
+    def invalidate(self, namespace):
+        """Make every entry in the namespace stale for all processes"""
+        with self._transaction() as conn:
+            # Timestamps rather than +1 so a wiped file can't recreate an old generation number
+            conn.execute('''
+                INSERT INTO generations (namespace, generation) VALUES (?, ?)
+                ON CONFLICT (namespace) DO UPDATE SET generation = MAX(excluded.generation, generation + 1)
+            ''', (namespace, time.time_ns()))
+            # Stale entries are dead weight; drop them now rather than waiting for LRU
+            self._delete_where(conn, 'namespace = ?', (namespace,))
+
+    def stats(self):
+        conn = self._connect()
+        total, entries = conn.execute('SELECT bytes, entries FROM totals WHERE id = 1').fetchone()
+        return {'backend': 'sqlite', 'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries}
+
+    # -- internals ----------------------------------------------------------
+
+    def _delete_where(self, conn, where, params):
+        count, freed = conn.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE {where}', params).fetchone()
+        if count:
+            conn.execute(f'DELETE FROM entries WHERE {where}', params)
+            conn.execute('UPDATE totals SET bytes = bytes - ?, entries = entries - ? WHERE id = 1', (freed, count))
+
+    def _evict(self, conn):
+        total, entries = conn.execute('SELECT bytes, entries FROM totals WHERE id = 1').fetchone()
+        if total <= self.max_bytes and entries <= self.max_entries:
+            return
+        # Drop least recently used entries until we're 10% under whichever cap was passed
+        excess = total - int(self.max_bytes * 0.9) if total > self.max_bytes else 0
+        extra = entries - int(self.max_entries * 0.9) if entries > self.max_entries else 0
+        freed = 0
+        victims = []
+        for namespace, key, size in conn.execute('SELECT namespace, key, size FROM entries ORDER BY accessed'):
+            victims.append((namespace, key))
+            freed += size
+            if freed >= excess and len(victims) >= extra:
+                break
+        conn.executemany('DELETE FROM entries WHERE namespace = ? AND key = ?', victims)
+        conn.execute('UPDATE totals SET bytes = bytes - ?, entries = entries - ? WHERE id = 1', (freed, len(victims)))
+
+
+class MemoryCache:
+    """Per-process LRU with the same interface (not shared between workers)"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, default_ttl=3600, max_entries=10000):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (namespace, key) -> (generation, value, expires)
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[0] != self._generations.get(namespace, 0) or entry[2] <= time.time():
+                self._pop((namespace, key))
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry[1]
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def set(self, namespace, key, value, ttl=None, generation=None):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        if len(value) > self.max_bytes // 8:
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            current = self._generations.get(namespace, 0)
+            if generation is not None and generation != current:
+                return
+            self._pop((namespace, key))
+            self._entries[(namespace, key)] = (current, value, time.time() + ttl)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._pop((namespace, key))
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'max_entries': self.max_entries}
+
+    def _pop(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+
+def create_cache(backend='sqlite', path=None, max_bytes=64 * 1024 * 1024, default_ttl=3600, max_entries=10000):
+    """Build the configured backend ('sqlite' shares across workers, 'memory' is per-process)"""
+    if backend == 'memory':
+        return MemoryCache(max_bytes=max_bytes, default_ttl=default_ttl, max_entries=max_entries)
+    if backend == 'sqlite':
+        return SQLiteCache(path=path, max_bytes=max_bytes, default_ttl=default_ttl, max_entries=max_entries)
+    raise ValueError(f"Unknown cache backend: {backend}")
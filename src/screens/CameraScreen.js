@@ -31,6 +31,7 @@ const CameraScreen = ({ navigation, route }) => {
   const [currentMacros, setCurrentMacros] = useState(null);
   const [currentExtendedMetrics, setCurrentExtendedMetrics] = useState(null);
   const extendedMetricsRef = useRef(null);
+  const analysisSessionRef = useRef(null); // server-side conversation: follow-ups send only their text
   const [showInput, setShowInput] = useState(false);
   const [userInput, setUserInput] = useState('');
   const [isRefining, setIsRefining] = useState(false);
@@ -260,6 +261,7 @@ const CameraScreen = ({ navigation, route }) => {
       }
 
       const result = await claudeAPI.analyzeMealImage(base64Image, foodDescription, base64AdditionalImages, isMultipleDishes, mealPreparation);
+      analysisSessionRef.current = result.sessionId || null;
       
       // Store macros, extended metrics, and title FIRST (before cleaning)
       // Only update if macros were successfully parsed
@@ -448,7 +450,7 @@ const CameraScreen = ({ navigation, route }) => {
         content: msg.content
       }));
 
-      const result = await claudeAPI.refineAnalysis(conversationHistory);
+      const result = await claudeAPI.refineAnalysis(conversationHistory, analysisSessionRef.current);
       
       // Store macros, extended metrics, and title FIRST (before cleaning)
       // Only update if macros were successfully parsed, otherwise keep previous values
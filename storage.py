@@ -0,0 +1,890 @@
+"""
+Storage backends for users, meals, targets and saved meals
+server_cloud.py talks to one SQLStorage interface; the backend is chosen
+from DATABASE_URL:
+
+    postgresql://...        PostgresStorage (psycopg 3 + connection pool)
+    sqlite:///path/to.db    SQLiteStorage (embedded, WAL mode)
+
+Queries are written once with %s placeholders; the SQLite backend rewrites
+them to ? and fills in the few dialect differences (identity columns,
+views, date arithmetic). SQLite gives single-node deployments and
+benchmarks a zero-network-hop database shared by all gunicorn workers.
+"""
+
+import csv
+import io
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+MEAL_COLUMNS = (
+    'date', 'name', 'food_items', 'calories', 'protein', 'carbs', 'fat',
+    'processed_calories', 'processed_percent', 'ultra_processed_calories', 'ultra_processed_percent',
+    'fiber', 'caffeine', 'fresh_produce', 'image_url'
+)
+
+SAVED_MEAL_COLUMNS = (
+    'name', 'calories', 'protein', 'carbs', 'fat',
+    'processed_calories', 'processed_percent', 'ultra_processed_calories', 'ultra_processed_percent',
+    'fiber', 'caffeine', 'fresh_produce'
+)
+
+# Column order of meal_batches() rows; the numeric columns come back as floats
+MEAL_EXPORT_COLUMNS = ('id', 'user_id') + MEAL_COLUMNS + ('created_at', 'meal_date', 'logged_at')
+MEAL_NUMERIC_COLUMNS = tuple(c for c in MEAL_COLUMNS if c not in ('date', 'name', 'food_items', 'image_url'))
+
+# Typed copies of meals.date / the logging time, filled on every write and by meal_dates.py for old rows
+MEAL_DATE_COLUMNS = (('meal_date', 'DATE'), ('logged_at', 'TIMESTAMPTZ'))
+MEAL_DATES_MIGRATION = 'meal_dates'
+
+# Besides ISO dates the app has sent Date.toDateString() ("Mon Oct 20 2025")
+MEAL_DATE_FORMATS = ('%a %b %d %Y',)
+
+TARGET_COLUMNS = (
+    'calories', 'protein', 'carbs', 'fat',
+    'processed_percent', 'fiber', 'caffeine', 'fresh_produce'
+)
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id VARCHAR PRIMARY KEY,
+        email VARCHAR UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS meals (
+        id VARCHAR PRIMARY KEY,
+        user_id VARCHAR NOT NULL,
+        date VARCHAR NOT NULL,
+        name VARCHAR NOT NULL DEFAULT 'Meal',
+        food_items TEXT NOT NULL,
+        -- Main macros
+        calories DECIMAL,
+        protein DECIMAL,
+        carbs DECIMAL,
+        fat DECIMAL,
+        -- Extended metrics (from app)
+        processed_calories DECIMAL,
+        processed_percent DECIMAL,
+        ultra_processed_calories DECIMAL,
+        ultra_processed_percent DECIMAL,
+        fiber DECIMAL,
+        caffeine DECIMAL,
+        fresh_produce DECIMAL,
+        image_url VARCHAR,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        meal_date DATE,
+        logged_at TIMESTAMPTZ,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS targets (
+        user_id VARCHAR PRIMARY KEY,
+        -- Main macro targets
+        calories INTEGER,
+        protein INTEGER,
+        carbs INTEGER,
+        fat INTEGER,
+        -- Extended metric targets (from app)
+        processed_percent INTEGER,
+        fiber INTEGER,
+        caffeine INTEGER,
+        fresh_produce INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS saved_meals (
+        id VARCHAR PRIMARY KEY,
+        user_id VARCHAR NOT NULL,
+        name VARCHAR NOT NULL,
+        calories DECIMAL,
+        protein DECIMAL,
+        carbs DECIMAL,
+        fat DECIMAL,
+        processed_calories DECIMAL,
+        processed_percent DECIMAL,
+        ultra_processed_calories DECIMAL,
+        ultra_processed_percent DECIMAL,
+        fiber DECIMAL,
+        caffeine DECIMAL,
+        fresh_produce DECIMAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''',
+    # One row per upstream analyze call ({identity} differs per dialect)
+    '''
+    CREATE TABLE IF NOT EXISTS usage_ledger (
+        id {identity},
+        user_id VARCHAR,
+        model VARCHAR,
+        status INTEGER,
+        input_tokens INTEGER,
+        output_tokens INTEGER,
+        cache_creation_input_tokens INTEGER,
+        cache_read_input_tokens INTEGER,
+        image_count INTEGER,
+        payload_bytes INTEGER,
+        latency_ms INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_usage_ledger_created_at ON usage_ledger (created_at)',
+    # Serves the per-user meal list in its sort order
+    'CREATE INDEX IF NOT EXISTS idx_meals_user_date ON meals (user_id, date DESC, created_at DESC)',
+    # Progress of online data migrations (see meal_dates.py)
+    '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        name VARCHAR PRIMARY KEY,
+        state VARCHAR NOT NULL,
+        position VARCHAR,
+        rows_done BIGINT NOT NULL DEFAULT 0,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP
+    )
+    ''',
+]
+
+# Aggregated usage views for capacity planning ({p95} differs per dialect)
+USAGE_VIEWS = {
+    'usage_daily_by_user': '''
+        SELECT
+            user_id,
+            DATE(created_at) AS day,
+            COUNT(*) AS requests,
+            COUNT(*) FILTER (WHERE status <> 200) AS failed_requests,
+            COALESCE(SUM(input_tokens), 0) AS input_tokens,
+            COALESCE(SUM(output_tokens), 0) AS output_tokens,
+            COALESCE(SUM(cache_read_input_tokens), 0) AS cache_read_input_tokens,
+            COALESCE(SUM(image_count), 0) AS images,
+            COALESCE(SUM(payload_bytes), 0) AS payload_bytes,
+            ROUND(AVG(latency_ms)) AS avg_latency_ms,
+            {p95} AS p95_latency_ms
+        FROM usage_ledger
+        GROUP BY user_id, DATE(created_at)
+    ''',
+    'usage_daily': '''
+        SELECT
+            DATE(created_at) AS day,
+            model,
+            COUNT(*) AS requests,
+            COUNT(DISTINCT user_id) AS users,
+            COALESCE(SUM(input_tokens), 0) AS input_tokens,
+            COALESCE(SUM(output_tokens), 0) AS output_tokens,
+            COALESCE(SUM(image_count), 0) AS images,
+            ROUND(AVG(latency_ms)) AS avg_latency_ms,
+            {p95} AS p95_latency_ms
+        FROM usage_ledger
+        GROUP BY DATE(created_at), model
+    ''',
+}
+
+
+def parse_meal_date(value):
+    """The calendar day of a meals.date value, or None if it can't be read"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date) or value is None:
+        return value
+    text = str(value).strip()
+    try:
+        # ISO values may carry a time part ("2025-10-20T08:00:00.000Z")
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        pass
+    for fmt in MEAL_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def meal_logged_at(meal_id, created_at=None):
+    """When a meal was logged, as an aware UTC datetime
+
+    The app uses the logging time in epoch milliseconds as the meal id; other
+    ids fall back to created_at, a naive CURRENT_TIMESTAMP taken as UTC (the
+    server time zone on both backends), or to now for a meal being written.
+    """
+    try:
+        millis = int(meal_id)
+    except (TypeError, ValueError):
+        millis = None
+    # 13 digits: 2001-09-09 through 2286
+    if millis is not None and 10 ** 12 <= millis < 10 ** 13:
+        return datetime.fromtimestamp(millis / 1000, timezone.utc)
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            created_at = None
+    if created_at is None:
+        return datetime.now(timezone.utc)
+    return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+
+
+def rows_to_dicts(cursor):
+    columns = [desc[0] for desc in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class SQLStorage:
+    """Domain queries shared by both backends; subclasses supply connections and dialect bits"""
+
+    name = None
+    identity_column = None
+    p95_expression = None
+    days_ago_expression = None
+    # Per-user meal order on the typed columns (meals with an unreadable date last)
+    meal_date_order = None
+
+    # Set once schema_migrations says the typed meal columns are complete; never unset
+    _meal_dates_ready = False
+    _meal_dates_checked = float('-inf')
+
+    # -- connections (backend specific) ----------------------------------------
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor inside a write transaction (commit on success, rollback on error)"""
+        raise NotImplementedError
+
+    @contextmanager
+    def reader(self):
+        """Yield a cursor for read-only queries"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def run(self, op, *args):
+        """Run one cursor-level op in its own transaction"""
+        with self.transaction() as cursor:
+            return op(cursor, *args)
+
+    def run_batch(self, ops):
+        """Run [(op, args)] in one transaction with a single commit
+
+        Each op gets its own savepoint, so one failing op (e.g. a duplicate id)
+        is rolled back alone. Returns [(result, error)] in order; if the commit
+        itself fails the exception propagates and nothing was written.
+        """
+        if len(ops) == 1:
+            # Nothing to isolate from: skip the savepoint round trips
+            op, args = ops[0]
+            try:
+                return [(self.run(op, *args), None)]
+            except Exception as e:
+                return [(None, e)]
+
+        outcomes = []
+        with self.transaction() as cursor:
+            for op, args in ops:
+                cursor.execute('SAVEPOINT group_op')
+                try:
+                    outcomes.append((op(cursor, *args), None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO SAVEPOINT group_op')
+                    outcomes.append((None, e))
+                cursor.execute('RELEASE SAVEPOINT group_op')
+        return outcomes
+
+    # -- schema ---------------------------------------------------------------
+
+    def schema_statements(self):
+        """SCHEMA with this backend's dialect filled in"""
+        return [statement.replace('{identity}', self.identity_column) for statement in SCHEMA]
+
+    def init_schema(self):
+        with self.transaction() as cursor:
+            for statement in self.schema_statements():
+                cursor.execute(statement)
+            existing = self._column_names(cursor, 'meals')
+            for column, column_type in MEAL_DATE_COLUMNS:
+                if column not in existing:
+                    # Nullable and without a default: only the catalog changes, no table rewrite
+                    self._add_column(cursor, 'meals', column, column_type)
+            self._init_meal_dates(cursor)
+            for name, body in USAGE_VIEWS.items():
+                self._create_view(cursor, name, body.replace('{p95}', self.p95_expression))
+
+    def _column_names(self, cursor, table):
+        raise NotImplementedError
+
+    def _add_column(self, cursor, table, column, column_type):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    def meal_dates_index_statement(self, table='meals', name='idx_meals_user_meal_date', only=False, concurrently=False):
+        """Serves list_meals() once it orders on the typed columns"""
+        return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+                f"ON {'ONLY ' if only else ''}{table} (user_id, {self.meal_date_order})")
+
+    def _init_meal_dates(self, cursor):
+        cursor.execute('SELECT state FROM schema_migrations WHERE name = %s', (MEAL_DATES_MIGRATION,))
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute('SELECT 1 FROM meals WHERE logged_at IS NULL LIMIT 1')
+        if cursor.fetchone() is None:
+            # New (or empty) database: nothing to backfill, so the typed columns are live from the start
+            cursor.execute(self.meal_dates_index_statement())
+            cursor.execute('''
+                INSERT INTO schema_migrations (name, state, completed_at)
+                VALUES (%s, 'complete', CURRENT_TIMESTAMP)
+                ON CONFLICT (name) DO NOTHING
+            ''', (MEAL_DATES_MIGRATION,))
+
+    def migration_state(self, name):
+        with self.reader() as cursor:
+            cursor.execute('SELECT * FROM schema_migrations WHERE name = %s', (name,))
+            rows = rows_to_dicts(cursor)
+            return rows[0] if rows else None
+
+    def meal_dates_ready(self):
+        """True once meal_date/logged_at are filled for every meal (see meal_dates.py)"""
+        if self._meal_dates_ready:
+            return True
+        # Until it flips, look at most once a minute per process
+        now = time.monotonic()
+        if now - self._meal_dates_checked < 60:
+            return False
+        self._meal_dates_checked = now
+        state = self.migration_state(MEAL_DATES_MIGRATION)
+        self._meal_dates_ready = state is not None and state['state'] == 'complete'
+        return self._meal_dates_ready
+
+    def _create_view(self, cursor, name, body):
+        cursor.execute(f"CREATE OR REPLACE VIEW {name} AS {body}")
+
+    # -- users ----------------------------------------------------------------
+
+    def user_exists(self, user_id):
+        with self.reader() as cursor:
+            cursor.execute('SELECT user_id FROM users WHERE user_id = %s', (user_id,))
+            return cursor.fetchone() is not None
+
+    def create_user(self, user_id, email=None):
+        """Insert the user; returns False if they already existed"""
+        with self.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO users (user_id, email, created_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO NOTHING
+            ''', (user_id, email))
+            return cursor.rowcount == 1
+
+    def ensure_user(self, user_id, email=None):
+        if not self.user_exists(user_id):
+            self.create_user(user_id, email)
+
+    # -- meals ----------------------------------------------------------------
+
+    def list_meals(self, user_id, since=None, start=None, end=None):
+        """A user's meals, newest day first
+
+        since keeps only meals logged (created) at or after that datetime;
+        start/end keep only meal days in that inclusive date range.
+        """
+        typed = self.meal_dates_ready()
+        where, params = '', [user_id]
+        if since:
+            where += ' AND created_at >= %s'
+            params.append(since)
+        # meal_date bounds let a partitioned meals table skip the months outside the range
+        if typed and start:
+            where += ' AND meal_date >= %s'
+            params.append(start)
+        if typed and end:
+            where += ' AND meal_date <= %s'
+            params.append(end)
+        # Until the backfill completes, order on the stored strings as before
+        order = self.meal_date_order if typed else 'date DESC, created_at DESC'
+        with self.reader() as cursor:
+            cursor.execute(f'''
+                SELECT * FROM meals
+                WHERE user_id = %s {where}
+                ORDER BY {order}
+            ''', params)
+            meals = rows_to_dicts(cursor)
+        if not typed and (start or end):
+            # String comparison can't range over mixed date formats: parse each row instead
+            meals = [meal for meal in meals if (day := parse_meal_date(meal['date'])) is not None
+                     and (not start or day >= start) and (not end or day <= end)]
+        return meals
+
+    # Meal writes are cursor-level ops so they can run alone (run()) or batched with
+    # other requests' writes in one transaction (run_batch(), see group_commit.py)
+
+    @staticmethod
+    def create_meal(cursor, meal_id, user_id, meal, email=None):
+        """Insert a meal, creating its user first if needed"""
+        cursor.execute('''
+            INSERT INTO users (user_id, email, created_at)
+            VALUES (%s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT DO NOTHING
+        ''', (user_id, email))
+        cursor.execute(f'''
+            INSERT INTO meals (id, user_id, {', '.join(MEAL_COLUMNS)}, meal_date, logged_at)
+            VALUES ({', '.join(['%s'] * (len(MEAL_COLUMNS) + 4))})
+        ''', (meal_id, user_id) + tuple(meal[c] for c in MEAL_COLUMNS)
+            + (parse_meal_date(meal['date']), meal_logged_at(meal_id)))
+
+    @staticmethod
+    def update_meal(cursor, meal_id, user_id, meal):
+        """Returns False if the meal doesn't exist or belongs to someone else"""
+        # logged_at is left alone: an edit doesn't change when the meal was logged
+        cursor.execute(f'''
+            UPDATE meals SET {', '.join(f'{c} = %s' for c in MEAL_COLUMNS)}, meal_date = %s
+            WHERE id = %s AND user_id = %s
+        ''', tuple(meal[c] for c in MEAL_COLUMNS) + (parse_meal_date(meal['date']), meal_id, user_id))
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def delete_meal(cursor, meal_id, user_id):
+        cursor.execute('DELETE FROM meals WHERE id = %s AND user_id = %s', (meal_id, user_id))
+        return cursor.rowcount > 0
+
+    def all_meals(self):
+        with self.reader() as cursor:
+            cursor.execute('SELECT * FROM meals ORDER BY created_at DESC')
+            return rows_to_dicts(cursor)
+
+    def meal_stats(self):
+        """(per-user rows, (total_meals, unique_users))"""
+        with self.reader() as cursor:
+            cursor.execute('''
+                SELECT
+                    user_id,
+                    COUNT(*) as meal_count,
+                    MIN(created_at) as first_meal,
+                    MAX(created_at) as last_meal,
+                    SUM(calories) as total_calories,
+                    AVG(calories) as avg_calories_per_meal
+                FROM meals
+                GROUP BY user_id
+                ORDER BY meal_count DESC
+            ''')
+            users = [tuple(row) for row in cursor.fetchall()]
+            cursor.execute('SELECT COUNT(*) as total_meals, COUNT(DISTINCT user_id) as unique_users FROM meals')
+            return users, tuple(cursor.fetchone())
+
+    # -- saved meals -----------------------------------------------------------
+
+    def list_saved_meals(self, user_id):
+        with self.reader() as cursor:
+            cursor.execute('SELECT * FROM saved_meals WHERE user_id = %s ORDER BY created_at DESC', (user_id,))
+            return rows_to_dicts(cursor)
+
+    def upsert_saved_meal(self, meal_id, user_id, meal):
+        with self.transaction() as cursor:
+            cursor.execute(f'''
+                INSERT INTO saved_meals (id, user_id, {', '.join(SAVED_MEAL_COLUMNS)})
+                VALUES ({', '.join(['%s'] * (len(SAVED_MEAL_COLUMNS) + 2))})
+                ON CONFLICT (id) DO UPDATE SET
+                    {', '.join(f'{c} = EXCLUDED.{c}' for c in SAVED_MEAL_COLUMNS)}
+            ''', (meal_id, user_id) + tuple(meal.get(c) for c in SAVED_MEAL_COLUMNS))
+
+    def delete_saved_meal(self, meal_id, user_id):
+        with self.transaction() as cursor:
+            cursor.execute('DELETE FROM saved_meals WHERE id = %s AND user_id = %s', (meal_id, user_id))
+            return cursor.rowcount > 0
+
+    # -- targets --------------------------------------------------------------
+
+    def get_targets(self, user_id):
+        with self.reader() as cursor:
+            cursor.execute('SELECT * FROM targets WHERE user_id = %s', (user_id,))
+            rows = rows_to_dicts(cursor)
+            return rows[0] if rows else None
+
+    def upsert_targets(self, user_id, targets):
+        with self.transaction() as cursor:
+            cursor.execute(f'''
+                INSERT INTO targets (user_id, {', '.join(TARGET_COLUMNS)})
+                VALUES ({', '.join(['%s'] * (len(TARGET_COLUMNS) + 1))})
+                ON CONFLICT (user_id) DO UPDATE SET
+                    {', '.join(f'{c} = EXCLUDED.{c}' for c in TARGET_COLUMNS)},
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (user_id,) + tuple(targets.get(c) for c in TARGET_COLUMNS))
+
+    # -- usage ledger ----------------------------------------------------------
+
+    def insert_usage(self, columns, rows):
+        with self.transaction() as cursor:
+            cursor.executemany(f'''
+                INSERT INTO usage_ledger ({', '.join(columns)})
+                VALUES ({', '.join(['%s'] * len(columns))})
+            ''', rows)
+
+    def usage_summary(self, days, user_id=None):
+        """(per-user/day rows, per-day/model rows) for the last `days` days"""
+        since = self.days_ago_expression
+        with self.reader() as cursor:
+            query = f'SELECT * FROM usage_daily_by_user WHERE day >= {since}'
+            params = [days]
+            if user_id:
+                query += ' AND user_id = %s'
+                params.append(user_id)
+            cursor.execute(query + ' ORDER BY day DESC, input_tokens DESC', params)
+            by_user = rows_to_dicts(cursor)
+
+            cursor.execute(f'SELECT * FROM usage_daily WHERE day >= {since} ORDER BY day DESC', (days,))
+            return by_user, rows_to_dicts(cursor)
+
+    # -- admin -----------------------------------------------------------------
+
+    def table_names(self):
+        raise NotImplementedError
+
+    def dump_tables(self):
+        """Yield (table, chunks) for every table, all read from one consistent snapshot
+
+        chunks is an iterator of CSV bytes (with a header row) that must be
+        consumed before advancing to the next table. Memory use doesn't grow
+        with table size; the snapshot is held until the generator finishes or
+        is closed.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def snapshot(self):
+        """Yield stream(query, params=(), batch_rows=10000) -> (columns, batches) over one read-only snapshot
+
+        Every stream reads the same consistent state through a server-side
+        cursor, so only one batch of rows is in memory at a time however big
+        the result is. Streams must be consumed while the snapshot is open.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _fetch_batches(cursor, batch_rows):
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def meal_batches(self, batch_rows=10000, user_id=None):
+        """Yield lists of meal row tuples (MEAL_EXPORT_COLUMNS order) from one snapshot"""
+        query, params = self._meal_export_query(user_id)
+        with self.snapshot() as stream:
+            _, batches = stream(query, params, batch_rows)
+            yield from batches
+
+    @staticmethod
+    def _meal_export_query(user_id):
+        columns = ', '.join(
+            f'CAST({c} AS DOUBLE PRECISION) AS {c}' if c in MEAL_NUMERIC_COLUMNS else c for c in MEAL_EXPORT_COLUMNS)
+        where = 'WHERE user_id = %s' if user_id else ''
+        return f"SELECT {columns} FROM meals {where} ORDER BY created_at, id", ((user_id,) if user_id else ())
+
+    def table_counts(self):
+        counts = {}
+        with self.reader() as cursor:
+            for table in self.table_names():
+                cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
+                counts[table] = cursor.fetchone()[0]
+        return counts
+
+
+class PostgresStorage(SQLStorage):
+    """PostgreSQL through a per-process psycopg connection pool"""
+
+    name = 'PostgreSQL'
+    identity_column = 'BIGSERIAL PRIMARY KEY'
+    p95_expression = 'PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY latency_ms)'
+    days_ago_expression = 'CURRENT_DATE - %s'
+    meal_date_order = 'meal_date DESC NULLS LAST, logged_at DESC'
+
+    def __init__(self, url, min_size=1, max_size=10, timeout=10.0):
+        self.url = url
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # gunicorn forks after import: each worker opens its own pool on first use
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    from psycopg_pool import ConnectionPool
+                    self._pool = ConnectionPool(
+                        self.url, min_size=self.min_size, max_size=self.max_size,
+                        timeout=self.timeout, open=True, name=f"fuell-{os.getpid()}"
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+    @contextmanager
+    def transaction(self):
+        # pool.connection() commits on success and rolls back on error
+        with self._get_pool().connection() as conn:
+            yield conn.cursor()
+
+    reader = transaction
+
+    @contextmanager
+    def connection(self):
+        """Raw pooled connection for Postgres-only features (COPY, server-side cursors)"""
+        with self._get_pool().connection() as conn:
+            yield conn
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.close()
+
+    # Top-level tables only: partitions (see meal_partitions.py) are read through their parent, and the
+    # pre-partitioning copy meal_partitions.migrate() keeps for rollback would repeat every meal
+    TABLE_NAMES_QUERY = """
+        SELECT relname FROM pg_class
+        WHERE relnamespace = 'public'::regnamespace AND relkind IN ('r', 'p') AND NOT relispartition
+            AND relname <> 'meals_unpartitioned'
+        ORDER BY relname
+    """
+
+    def table_names(self):
+        with self.reader() as cursor:
+            cursor.execute(self.TABLE_NAMES_QUERY)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _column_names(self, cursor, table):
+        cursor.execute('''
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+        ''', (table,))
+        return {row[0] for row in cursor.fetchall()}
+
+    def _add_column(self, cursor, table, column, column_type):
+        # ADD COLUMN needs a brief exclusive lock: give up rather than queue every query behind a long one
+        cursor.execute("SET LOCAL lock_timeout = '5s'")
+        super()._add_column(cursor, table, column, column_type)
+
+    def dump_tables(self):
+        from psycopg import sql
+
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                # Must be the first statement of the transaction: every COPY below then reads one snapshot
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+                cursor.execute(self.TABLE_NAMES_QUERY)
+                for table in [row[0] for row in cursor.fetchall()]:
+                    # COPY (SELECT ...) also works for partitioned tables, which plain COPY TO rejects
+                    statement = sql.SQL('COPY (SELECT * FROM {}) TO STDOUT WITH (FORMAT csv, HEADER)').format(sql.Identifier(table))
+                    yield table, self._copy_out(cursor, statement)
+            conn.rollback()
+
+    @contextmanager
+    def snapshot(self):
+        with self.connection() as conn:
+            conn.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+            names = itertools.count()
+
+            def stream(query, params=(), batch_rows=10000):
+                # Named cursor = server-side cursor: rows are pulled from PostgreSQL batch by batch
+                cursor = conn.cursor(name=f'snapshot_{next(names)}')
+                cursor.itersize = batch_rows
+                cursor.execute(query, params)
+                return [desc[0] for desc in cursor.description], self._fetch_batches(cursor, batch_rows)
+
+            yield stream
+            conn.rollback()
+
+    @staticmethod
+    def _copy_out(cursor, statement):
+        with cursor.copy(statement) as copy:
+            for data in copy:
+                yield bytes(data)
+
+
+class _SQLiteCursor:
+    """Cursor adapter that accepts the %s placeholders used by the shared queries"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), params)
+        return self
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql.replace('%s', '?'), rows)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def _convert_timestamp(value):
+    text = value.decode('utf-8')
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+def _convert_date(value):
+    try:
+        return date.fromisoformat(value.decode('utf-8'))
+    except ValueError:
+        return value.decode('utf-8')
+
+
+# TIMESTAMP/TIMESTAMPTZ/DATE columns come back as datetimes and dates, like they do from PostgreSQL
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+sqlite3.register_converter('TIMESTAMPTZ', _convert_timestamp)
+sqlite3.register_converter('DATE', _convert_date)
+
+
+class SQLiteStorage(SQLStorage):
+    """Embedded SQLite database in WAL mode, one connection per thread"""
+
+    name = 'SQLite'
+    identity_column = 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    # SQLite has no percentile aggregate; p95 is left to the ledger's consumers
+    p95_expression = 'NULL'
+    days_ago_expression = "DATE('now', '-' || %s || ' days')"
+    # NULL sorts lowest in SQLite, so DESC already puts it last
+    meal_date_order = 'meal_date DESC, logged_at DESC'
+
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        # WAL + NORMAL: durable across app crashes, may lose the last commits on power loss
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA foreign_keys=ON',
+        'PRAGMA busy_timeout=5000',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA mmap_size=268435456',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   detect_types=sqlite3.PARSE_DECLTYPES)
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers queue on busy_timeout
+        # instead of failing to upgrade a read lock
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield _SQLiteCursor(conn.cursor())
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @contextmanager
+    def reader(self):
+        yield _SQLiteCursor(self._connect().cursor())
+
+    def _create_view(self, cursor, name, body):
+        cursor.execute(f"DROP VIEW IF EXISTS {name}")
+        cursor.execute(f"CREATE VIEW {name} AS {body}")
+
+    def _column_names(self, cursor, table):
+        cursor.execute(f'PRAGMA table_info({table})')
+        return {row[1] for row in cursor.fetchall()}
+
+    TABLE_NAMES_QUERY = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+
+    def table_names(self):
+        with self.reader() as cursor:
+            cursor.execute(self.TABLE_NAMES_QUERY)
+            return [row[0] for row in cursor.fetchall()]
+
+    def dump_tables(self, chunk_rows=1000):
+        # Own connection without type detection: values are written exactly as stored
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        try:
+            # In WAL mode a read transaction sees one snapshot and never blocks writers
+            conn.execute('BEGIN')
+            tables = [row[0] for row in conn.execute(self.TABLE_NAMES_QUERY)]
+            for table in tables:
+                yield table, self._csv_chunks(conn.execute(f'SELECT * FROM "{table}"'), chunk_rows)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    @contextmanager
+    def snapshot(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+        try:
+            # In WAL mode a read transaction sees one snapshot and never blocks writers
+            conn.execute('BEGIN')
+
+            def stream(query, params=(), batch_rows=10000):
+                cursor = conn.execute(query.replace('%s', '?'), params)
+                return [desc[0] for desc in cursor.description], self._fetch_batches(cursor, batch_rows)
+
+            yield stream
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _csv_chunks(cursor, chunk_rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow([desc[0] for desc in cursor.description])
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            writer.writerows(rows)
+            if buffer.tell():
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+            if not rows:
+                break
+
+    def backup_to(self, path):
+        """Consistent copy of the live database (safe while other workers are writing)"""
+        target = sqlite3.connect(path)
+        try:
+            self._connect().backup(target)
+        finally:
+            target.close()
+
+
+def create_storage(url):
+    """Pick the backend from a DATABASE_URL"""
+    if url.startswith(('postgres://', 'postgresql://')):
+        return PostgresStorage(
+            url,
+            min_size=int(os.environ.get('DATABASE_POOL_MIN', 1)),
+            max_size=int(os.environ.get('DATABASE_POOL_MAX', 10))
+        )
+    if url.startswith('sqlite:///'):
+        return SQLiteStorage(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported DATABASE_URL scheme: {url.split(':', 1)[0]}")
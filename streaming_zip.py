@@ -0,0 +1,62 @@
+"""
+Zip archives generated on the fly
+stream_zip() turns (name, chunks) members into zip bytes as the chunks are
+produced, so an export of any size can be sent as a chunked response
+without being built in memory or on disk first. The output stream isn't
+seekable, so zipfile writes sizes and CRCs in data descriptors after each
+member; every mainstream unzip tool reads these.
+"""
+
+import zipfile
+
+# Hand bytes to the response once this much compressed output has built up
+FLUSH_BYTES = 64 * 1024
+
+
+class _Sink:
+    """Write-only, non-seekable file object that collects zipfile's output"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def file_chunks(path, chunk_size=FLUSH_BYTES):
+    """Read a file as an iterator of byte chunks (for members that already exist on disk)"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_zip(members, compression=zipfile.ZIP_DEFLATED, compresslevel=6):
+    """Yield a zip archive of members, an iterable of (name, iterable of bytes/str chunks)
+
+    Pass compression=zipfile.ZIP_STORED for members that are already compressed.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=compression, compresslevel=compresslevel) as archive:
+        for name, chunks in members:
+            # force_zip64: the member size isn't known up front and may pass 2 GiB
+            with archive.open(name, 'w', force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                    if len(sink.buffer) >= FLUSH_BYTES:
+                        yield sink.drain()
+            if sink.buffer:
+                yield sink.drain()
+    # Central directory
+    yield sink.drain()
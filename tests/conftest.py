@@ -0,0 +1,79 @@
+"""
+Shared fixtures: server_cloud.py imported once against throwaway local state
+(embedded SQLite, cache/admission/metrics files in a temp directory) with
+the Messages API replaced by a recorder that answers with the mock
+upstream's canned reply.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCRATCH = tempfile.mkdtemp(prefix='fuell_tests_')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(SCRATCH, 'server.db')}",
+    'ANTHROPIC_API_KEY': 'test-key',
+    # Nothing listens here: a request the tests didn't expect to go upstream fails loudly
+    'ANTHROPIC_API_URL': 'http://127.0.0.1:9/v1/messages',
+    'ADMISSION_DB_PATH': os.path.join(SCRATCH, 'admission.db'),
+    'ANALYZE_BURST': '1000',
+    'CACHE_DB_PATH': os.path.join(SCRATCH, 'cache.db'),
+    'ANALYZE_CACHE_TTL_SECONDS': '0',
+    'METRICS_DIR': os.path.join(SCRATCH, 'metrics'),
+    'IMAGE_STORE_DIR': os.path.join(SCRATCH, 'images'),
+    'NEAR_DUPLICATE_DB_PATH': os.path.join(SCRATCH, 'near_duplicates.db'),
+    'ANALYZE_NEAR_DUPLICATES': 'reuse',
+    'SESSION_DIR': os.path.join(SCRATCH, 'sessions'),
+})
+
+
+@pytest.fixture(scope='session')
+def server():
+    import server_cloud
+    return server_cloud
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def upstream(server, monkeypatch):
+    """The payloads sent to the Messages API during the test; each gets the mock upstream's canned reply"""
+    from mock_anthropic_server import CANNED_TEXT
+
+    calls = []
+
+    def send(data):
+        calls.append(data)
+        response = requests.models.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response.encoding = 'utf-8'
+        response._content = json.dumps({
+            'id': f"msg_test_{len(calls)}", 'type': 'message', 'role': 'assistant', 'model': data.get('model'),
+            'content': [{'type': 'text', 'text': CANNED_TEXT}], 'stop_reason': 'end_turn',
+            'usage': {'input_tokens': 1200, 'output_tokens': 300},
+        }).encode('utf-8')
+        return response
+
+    monkeypatch.setattr(server.anthropic, 'send', send)
+    return calls
+
+
+def app_analyze_body(description='', images=(), meal_preparation=None):
+    """An analyze body exactly as src/services/api.js sends it"""
+    return {
+        'prompt': {'id': 'analyze', 'version': 1, 'variables': {
+            'description': description, 'multiple_dishes': False, 'meal_preparation': meal_preparation}},
+        'images': list(images),
+        'session': True,
+    }
@@ -0,0 +1,22 @@
+import pytest
+
+from admission_control import AdmissionController, AdmissionRejected
+
+
+def test_rate_limit_rejects_once_the_burst_is_spent(tmp_path):
+    admission = AdmissionController(path=str(tmp_path / 'admission.db'), rate_per_minute=1, burst=2)
+
+    admission.check_rate('alice')
+    admission.check_rate('alice')
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.check_rate('alice')
+
+    assert rejected.value.retry_after >= 1
+    admission.check_rate('bob')
+
+
+def test_zero_rate_turns_the_rate_limit_off(tmp_path):
+    admission = AdmissionController(path=str(tmp_path / 'admission.db'), rate_per_minute=0, burst=1)
+
+    for _ in range(5):
+        admission.check_rate('alice')
@@ -0,0 +1,39 @@
+"""Analyze result cache: per user, invalidated per user"""
+
+import pytest
+
+
+@pytest.fixture
+def cached_analyze(server, client, upstream, monkeypatch):
+    monkeypatch.setattr(server, 'ANALYZE_CACHE_TTL_SECONDS', 3600)
+
+    def analyze(user_id, text='what is in a bowl of pho'):
+        headers = {'X-User-Id': user_id} if user_id else {}
+        response = client.post('/api/analyze', headers=headers, json={
+            'model': 'claude-sonnet-4-5-20250929', 'max_tokens': 100,
+            'messages': [{'role': 'user', 'content': text}]})
+        assert response.status_code == 200
+        return len(upstream)
+    return analyze
+
+
+def test_cached_answers_are_not_shared_between_users(cached_analyze):
+    assert cached_analyze('user_cache_a') == 1
+    assert cached_analyze('user_cache_a') == 1
+    assert cached_analyze('user_cache_b') == 2
+
+
+def test_invalidating_one_user_leaves_others_cached(server, cached_analyze):
+    cached_analyze('user_cache_c', 'ramen')
+    cached_analyze('user_cache_d', 'ramen')
+
+    server.cache.invalidate(server.analyze_cache_namespace('user_cache_c'))
+
+    assert cached_analyze('user_cache_c', 'ramen') == 3
+    # Still served from the cache: no new upstream call
+    assert cached_analyze('user_cache_d', 'ramen') == 3
+
+
+def test_anonymous_requests_are_not_cached(cached_analyze):
+    assert cached_analyze(None, 'udon') == 1
+    assert cached_analyze(None, 'udon') == 2
@@ -0,0 +1,117 @@
+"""Analyze requests shaped like the app's reach the per-user features under the caller's user id"""
+
+from conftest import app_analyze_body
+
+
+def analyze(client, body, user_id):
+    return client.post('/api/analyze?transform=parse,trim', json=body, headers={'X-User-Id': user_id})
+
+
+def test_text_only_analyze_is_answered_from_saved_meal(client, upstream):
+    client.post('/api/user/saved-meals', json={
+        'user_id': 'user_saved', 'id': 'saved_bowl', 'name': 'Chicken burrito bowl',
+        'calories': 650, 'protein': 42, 'carbs': 70, 'fat': 18})
+
+    response = analyze(client, app_analyze_body('chicken burrito bowl'), 'user_saved')
+
+    assert response.status_code == 200
+    assert response.get_json()['saved_meal_match']['id'] == 'saved_bowl'
+    assert upstream == []
+
+
+def test_saved_meals_are_not_matched_for_other_users(client, upstream):
+    client.post('/api/user/saved-meals', json={
+        'user_id': 'user_owner', 'id': 'saved_oats', 'name': 'Blueberry overnight oats', 'calories': 420})
+
+    response = analyze(client, app_analyze_body('blueberry overnight oats'), 'user_stranger')
+
+    assert response.status_code == 200
+    assert 'saved_meal_match' not in response.get_json()
+    assert len(upstream) == 1
+
+
+def jpeg_base64(shade):
+    """A small photo-like JPEG (a gradient with a darker block), base64-encoded as the app sends it"""
+    import base64
+    import io
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (320, 240))
+    draw = ImageDraw.Draw(image)
+    for x in range(320):
+        draw.line([(x, 0), (x, 239)], fill=(x * 255 // 320, 120, 255 - x * 255 // 320))
+    draw.rectangle([80, 60, 200, 180], fill=(shade, shade // 2, 30))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def test_repeated_photo_reuses_the_users_earlier_analysis(client, upstream):
+    photo = jpeg_base64(40)
+
+    first = analyze(client, app_analyze_body(images=[photo]), 'user_photos')
+    second = analyze(client, app_analyze_body(images=[photo]), 'user_photos')
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert 'reused_analysis' in second.get_json()
+    assert len(upstream) == 1
+
+
+def test_photos_are_not_reused_across_users(client, upstream):
+    photo = jpeg_base64(200)
+
+    analyze(client, app_analyze_body(images=[photo]), 'user_first')
+    response = analyze(client, app_analyze_body(images=[photo]), 'user_second')
+
+    assert 'reused_analysis' not in response.get_json()
+    assert len(upstream) == 2
+
+
+def test_session_follow_up_resends_photos_for_the_owner_only(client, upstream):
+    photo = jpeg_base64(90)
+    first = analyze(client, app_analyze_body('lunch', images=[photo]), 'user_session')
+    session_id = first.headers['X-Session-Id']
+
+    follow_up = {'session_id': session_id, 'text': 'it was two eggs', 'prompt': {'id': 'refine', 'version': 1}}
+    assert analyze(client, follow_up, 'user_other').status_code == 404
+    assert client.post('/api/analyze', json=follow_up).status_code == 404
+    response = analyze(client, follow_up, 'user_session')
+
+    assert response.status_code == 200
+    assert response.headers['X-Session-Id'] == session_id
+    first_turn = upstream[-1]['messages'][0]['content']
+    assert first_turn[0]['source']['data'] == photo
+
+
+def test_anonymous_analyze_starts_no_session(client, upstream):
+    response = client.post('/api/analyze', json=app_analyze_body('lunch', images=[jpeg_base64(150)]))
+
+    assert response.status_code == 200
+    assert 'X-Session-Id' not in response.headers
+
+
+def test_upstream_usage_is_ledgered_under_the_user(server, client, upstream):
+    analyze(client, app_analyze_body(images=[jpeg_base64(60)]), 'user_ledger')
+    server.usage_ledger.flush()
+
+    with server.storage.reader() as cursor:
+        cursor.execute('SELECT user_id, status, input_tokens, output_tokens, image_count FROM usage_ledger '
+                       'WHERE user_id = %s', ('user_ledger',))
+        rows = [tuple(row) for row in cursor.fetchall()]
+    assert rows == [('user_ledger', 200, 1200, 300, 1)]
+
+
+def test_rate_limits_are_per_user_behind_one_address(server, client, upstream, monkeypatch):
+    # One request per bucket, refilling far slower than the test runs
+    monkeypatch.setattr(server.admission, 'burst', 1)
+    monkeypatch.setattr(server.admission, 'rate', 1e-6)
+
+    assert analyze(client, app_analyze_body('bucket test one'), 'user_bucket_a').status_code == 200
+    assert analyze(client, app_analyze_body('bucket test two'), 'user_bucket_a').status_code == 429
+    # Same client address (carrier NAT), different user: a bucket of its own
+    assert analyze(client, app_analyze_body('bucket test three'), 'user_bucket_b').status_code == 200
+
+    import sqlite3
+    with sqlite3.connect(server.admission.path) as conn:
+        keys = {key for key, in conn.execute('SELECT key FROM buckets')}
+    assert {'user_bucket_a', 'user_bucket_b'} <= keys
@@ -0,0 +1,32 @@
+"""Async analyze job polling"""
+
+import time
+
+import pytest
+
+
+@pytest.mark.parametrize('wait', ['abc', 'nan', 'inf', ''])
+def test_bad_wait_is_rejected(client, wait):
+    response = client.get(f'/api/analyze/jobs/unknown?wait={wait}')
+
+    assert response.status_code == 400
+
+
+def test_negative_wait_does_not_long_poll(client):
+    started = time.monotonic()
+    response = client.get('/api/analyze/jobs/unknown?wait=-5')
+
+    assert response.status_code == 404
+    assert time.monotonic() - started < 1
+
+
+def test_job_result_is_long_polled(client, upstream):
+    submitted = client.post('/api/analyze/jobs', json={
+        'model': 'claude-sonnet-4-5-20250929', 'max_tokens': 100,
+        'messages': [{'role': 'user', 'content': 'a job to poll for'}]})
+    job_id = submitted.get_json()['job_id']
+
+    job = client.get(f'/api/analyze/jobs/{job_id}?wait=10').get_json()
+
+    assert job['status'] == 'succeeded'
+    assert job['result']['parsed']
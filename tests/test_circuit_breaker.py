@@ -0,0 +1,57 @@
+"""Upstream circuit breaker: stays closed under normal analyze latency, never sticks half-open"""
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
+
+
+def test_normal_analyze_latency_keeps_the_server_breaker_closed(server):
+    configured = server.upstream_breaker
+    breaker = CircuitBreaker(min_calls=10, error_threshold=configured.error_threshold,
+                             slow_call_seconds=configured.slow_call_seconds)
+
+    # Healthy analyses take 30-120 s; the client gives up at the deadline
+    for latency in (30, 45, 60, 75, 90, 105, 110, 60, 80, 100, 110, 95):
+        breaker.record(False, latency)
+
+    assert configured.slow_call_seconds > server.ANTHROPIC_DEADLINE_SECONDS
+    assert breaker.state()['state'] == CLOSED
+
+
+def test_error_rate_still_opens_the_breaker():
+    breaker = CircuitBreaker(min_calls=4)
+    for failed in (False, True, True, False):
+        breaker.record(failed, 40)
+
+    assert breaker.state()['state'] == 'open'
+
+
+@pytest.fixture
+def half_open_breaker(server, monkeypatch):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0, half_open_probes=1)
+    breaker.record(True, 1)  # opens; with no cool-down the next call is a half-open probe
+    monkeypatch.setattr(server, 'upstream_breaker', breaker)
+    return breaker
+
+
+def test_unexpected_failure_hands_the_probe_back(server, monkeypatch, half_open_breaker):
+    def broken_send(data):
+        raise RuntimeError('bug in the request path')
+    monkeypatch.setattr(server.anthropic, 'send', broken_send)
+    payload = {'model': 'claude-sonnet-4-5-20250929', 'max_tokens': 10,
+               'messages': [{'role': 'user', 'content': 'probe please'}]}
+
+    with pytest.raises(RuntimeError):
+        server.call_anthropic(payload)
+
+    assert half_open_breaker.state()['state'] == HALF_OPEN
+    # The slot is free again: another call is admitted as the probe instead of being refused forever
+    assert half_open_breaker.before_call() is True
+
+
+def test_successful_probe_closes_the_breaker(server, upstream, half_open_breaker):
+    payload = {'model': 'claude-sonnet-4-5-20250929', 'max_tokens': 10,
+               'messages': [{'role': 'user', 'content': 'probe please too'}]}
+
+    assert server.call_anthropic(payload).ok
+    assert half_open_breaker.state()['state'] == CLOSED
@@ -0,0 +1,44 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from storage import MEAL_COLUMNS, create_storage
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+import columnar_export  # noqa: E402
+
+
+def test_parquet_export_has_typed_meal_date_and_logged_at(tmp_path):
+    storage = create_storage(f"sqlite:///{tmp_path / 'fuell.db'}")
+    storage.init_schema()
+    meal = dict.fromkeys(MEAL_COLUMNS)
+    meal.update(date='Mon Oct 20 2025', name='Oatmeal', food_items='[{"name": "Oats", "calories": 300}]', calories=350)
+    storage.run(storage.create_meal, '1760950800000', 'alice', meal)
+
+    summary = columnar_export.export_meals(storage, str(tmp_path), 'parquet')
+    storage.close()
+
+    table = pq.read_table(tmp_path / summary['files']['meals'])
+    assert table.schema.field('meal_date').type == pa.date32()
+    assert table.schema.field('logged_at').type == pa.timestamp('us', tz='UTC')
+    row = table.to_pylist()[0]
+    assert row['meal_date'] == date(2025, 10, 20)
+    assert row['logged_at'] == datetime(2025, 10, 20, 9, 0, tzinfo=timezone.utc)
+
+
+def test_parquet_export_fills_rows_not_yet_backfilled(tmp_path):
+    storage = create_storage(f"sqlite:///{tmp_path / 'fuell.db'}")
+    storage.init_schema()
+    meal = dict.fromkeys(MEAL_COLUMNS)
+    meal.update(date='2025-10-20', name='Oatmeal', food_items='[]', calories=350)
+    storage.run(storage.create_meal, '1760950800000', 'alice', meal)
+    with storage.transaction() as cursor:
+        cursor.execute('UPDATE meals SET meal_date = NULL, logged_at = NULL')
+
+    summary = columnar_export.export_meals(storage, str(tmp_path), 'parquet')
+    storage.close()
+
+    row = pq.read_table(tmp_path / summary['files']['meals']).to_pylist()[0]
+    assert (row['meal_date'], row['logged_at']) == (date(2025, 10, 20), datetime(2025, 10, 20, 9, 0, tzinfo=timezone.utc))
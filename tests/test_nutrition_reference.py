@@ -0,0 +1,70 @@
+"""The local nutrition reference: amounts it can answer and ambiguous ones it leaves to Claude"""
+
+import pytest
+
+from conftest import app_analyze_body
+from nutrition_reference import NutritionReference
+
+
+@pytest.fixture(scope='module')
+def reference(tmp_path_factory):
+    reference = NutritionReference(path=str(tmp_path_factory.mktemp('reference') / 'nutrition_reference.bin'))
+    yield reference
+    reference.close()
+
+
+def test_parses_quantities_and_units(reference):
+    estimate = reference.estimate('100g chicken breast and a cup of rice')
+
+    assert [(item['name'], item['weight']) for item in estimate['items']] == [('chicken breast', 100), ('white rice', 158)]
+    assert round(estimate['totals']['calories']) == 370
+
+
+@pytest.mark.parametrize('description, grams', [
+    ('2 eggs', 100),
+    ('chicken breast 150 g', 150),
+    ('2 slices of pizza', 214),
+    ('a pizza slice', 107),
+    ('200g large pizza', 200),
+    ('a cup of whole milk', 244),
+])
+def test_answers_unambiguous_amounts(reference, description, grams):
+    assert sum(item['weight'] for item in reference.estimate(description)['items']) == grams
+
+
+@pytest.mark.parametrize('description', [
+    'one large pizza',
+    'a whole pizza',
+    'half a large pizza',
+    '2 large eggs',
+    'a small banana',
+    'a pizza',
+    'a chicken',
+])
+def test_leaves_ambiguous_amounts_to_claude(reference, description):
+    assert reference.estimate(description) is None
+
+
+def analyze(client, body):
+    return client.post('/api/analyze?transform=parse,trim', json=body, headers={'X-User-Id': 'user_reference'})
+
+
+def test_app_text_analyze_is_answered_from_the_reference(client, upstream):
+    response = analyze(client, app_analyze_body('100g chicken breast and a cup of rice', meal_preparation='homemade'))
+
+    assert response.status_code == 200
+    assert response.get_json()['reference_estimate'] is True
+    assert upstream == []
+
+
+@pytest.mark.parametrize('description, meal_preparation', [
+    ('one large pizza', None),
+    ('100g chicken breast and a cup of rice', 'restaurant'),
+    ('100g chicken breast and a cup of rice', 'prepackaged'),
+])
+def test_app_text_analyze_goes_upstream_when_ambiguous(client, upstream, description, meal_preparation):
+    response = analyze(client, app_analyze_body(description, meal_preparation=meal_preparation))
+
+    assert response.status_code == 200
+    assert 'reference_estimate' not in response.get_json()
+    assert len(upstream) == 1
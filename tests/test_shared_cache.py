@@ -0,0 +1,53 @@
+"""Cross-worker SQLite cache: bounded by entry count as well as bytes"""
+
+import sqlite3
+
+from shared_cache import MemoryCache, SQLiteCache
+
+
+def test_least_recently_used_entries_go_past_max_entries(tmp_path):
+    cache = SQLiteCache(path=str(tmp_path / 'cache.db'), max_entries=10, touch_interval=0)
+    for i in range(10):
+        cache.set('users', f'u{i}', b'x')
+    cache.get('users', 'u0')  # recently used: survives
+
+    cache.set('users', 'u10', b'x')
+
+    assert cache.stats()['entries'] <= 9
+    assert cache.get('users', 'u0') == b'x'
+    assert cache.get('users', 'u1') is None
+    assert cache.get('users', 'u10') == b'x'
+
+
+def test_entry_count_follows_replace_delete_and_invalidate(tmp_path):
+    cache = SQLiteCache(path=str(tmp_path / 'cache.db'))
+    cache.set('targets', 'a', b'1')
+    cache.set('targets', 'a', b'22')
+    cache.set('targets', 'b', b'3')
+    cache.set('saved_meals', 'a', b'4')
+    assert cache.stats()['entries'] == 3
+
+    cache.delete('targets', 'b')
+    cache.invalidate('saved_meals')
+
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == (1, 2)
+
+
+def test_cache_file_from_before_the_entry_cap_is_upgraded(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    SQLiteCache(path=path).set('targets', 'a', b'1')
+    with sqlite3.connect(path) as conn:
+        conn.execute('ALTER TABLE totals DROP COLUMN entries')
+
+    cache = SQLiteCache(path=path, max_entries=5)
+
+    assert cache.stats()['entries'] == 1
+    assert cache.get('targets', 'a') == b'1'
+
+
+def test_memory_cache_reports_its_entry_cap():
+    cache = MemoryCache(max_entries=2)
+    for key in 'abc':
+        cache.set('users', key, b'x')
+
+    assert cache.stats()['entries'] == 2 and cache.stats()['max_entries'] == 2
@@ -0,0 +1,217 @@
+"""
+The storage interface against both backends
+Every test runs on a fresh embedded SQLite file and, when
+TEST_DATABASE_URL points at a PostgreSQL server, on a throwaway database
+created there (skipped otherwise):
+
+    TEST_DATABASE_URL=postgresql://postgres@/postgres?host=/tmp python -m pytest tests/test_storage.py
+"""
+
+import os
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+from storage import MEAL_COLUMNS, create_storage
+
+
+def postgres_database():
+    """(url of a new empty database, drop()) on the TEST_DATABASE_URL server; skips the test without one"""
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL not set')
+    try:
+        import psycopg
+        admin = psycopg.connect(url, autocommit=True, connect_timeout=5)
+    except Exception as e:
+        pytest.skip(f"PostgreSQL unavailable: {e}")
+    name = f"fuell_test_{uuid.uuid4().hex[:12]}"
+    admin.execute(f'CREATE DATABASE {name}')
+
+    def drop():
+        admin.execute(f'DROP DATABASE IF EXISTS {name} WITH (FORCE)')
+        admin.close()
+    return urlunsplit(urlsplit(url)._replace(path=f'/{name}')), drop
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def storage(request, tmp_path):
+    drop = None
+    if request.param == 'sqlite':
+        url = f"sqlite:///{tmp_path / 'fuell.db'}"
+    else:
+        url, drop = postgres_database()
+    backend = create_storage(url)
+    backend.init_schema()
+    yield backend
+    backend.close()
+    if drop:
+        drop()
+
+
+def meal(day, name='Oatmeal', calories=350):
+    values = dict.fromkeys(MEAL_COLUMNS)
+    values.update(date=day, name=name, food_items='[]', calories=calories, protein=12, carbs=60, fat=7)
+    return values
+
+
+def add_meal(storage, meal_id, user_id, day, **kwargs):
+    storage.run(storage.create_meal, meal_id, user_id, meal(day, **kwargs))
+
+
+# -- users, meals, saved meals, targets -------------------------------------------
+
+def test_users(storage):
+    assert not storage.user_exists('alice')
+    assert storage.create_user('alice', 'alice@example.com') is True
+    assert storage.create_user('alice') is False
+    storage.ensure_user('bob')
+    assert storage.user_exists('alice') and storage.user_exists('bob')
+
+
+def test_meal_crud(storage):
+    add_meal(storage, '1760950800000', 'alice', '2025-10-20', name='Oatmeal')
+    add_meal(storage, '1760968800000', 'alice', '2025-10-20', name='Salad')
+
+    meals = storage.list_meals('alice')
+    assert {m['name'] for m in meals} == {'Oatmeal', 'Salad'}
+    assert meals[0]['meal_date'] == date(2025, 10, 20)
+    assert storage.user_exists('alice')
+
+    changed = meal('2025-10-21', name='Big salad', calories=600)
+    assert storage.run(storage.update_meal, '1760968800000', 'alice', changed) is True
+    assert storage.run(storage.update_meal, '1760968800000', 'mallory', changed) is False
+    updated = {m['id']: m for m in storage.list_meals('alice')}['1760968800000']
+    assert (updated['name'], float(updated['calories']), updated['meal_date']) == ('Big salad', 600, date(2025, 10, 21))
+
+    assert storage.run(storage.delete_meal, '1760950800000', 'mallory') is False
+    assert storage.run(storage.delete_meal, '1760950800000', 'alice') is True
+    assert [m['id'] for m in storage.list_meals('alice')] == ['1760968800000']
+
+
+def test_saved_meals_and_targets(storage):
+    storage.ensure_user('alice')
+    storage.upsert_saved_meal('s1', 'alice', {'name': 'Burrito bowl', 'calories': 650})
+    storage.upsert_saved_meal('s1', 'alice', {'name': 'Burrito bowl', 'calories': 700})
+    assert [(m['name'], float(m['calories'])) for m in storage.list_saved_meals('alice')] == [('Burrito bowl', 700)]
+    assert storage.delete_saved_meal('s1', 'bob') is False
+    assert storage.delete_saved_meal('s1', 'alice') is True
+    assert storage.list_saved_meals('alice') == []
+
+    assert storage.get_targets('alice') is None
+    storage.upsert_targets('alice', {'calories': 2200, 'protein': 150})
+    storage.upsert_targets('alice', {'calories': 2000, 'protein': 150})
+    targets = storage.get_targets('alice')
+    assert (float(targets['calories']), float(targets['protein'])) == (2000, 150)
+
+
+# -- batched writes --------------------------------------------------------------
+
+def test_run_batch_rolls_back_only_the_failing_op(storage):
+    outcomes = storage.run_batch([
+        (storage.create_meal, ('100', 'alice', meal('2025-10-01', name='first'))),
+        (storage.create_meal, ('100', 'alice', meal('2025-10-02', name='duplicate id'))),
+        (storage.create_meal, ('101', 'alice', meal('2025-10-03', name='third'))),
+    ])
+
+    assert [error is None for _, error in outcomes] == [True, False, True]
+    assert sorted(m['name'] for m in storage.list_meals('alice')) == ['first', 'third']
+
+
+def test_run_batch_single_op_reports_its_error(storage):
+    add_meal(storage, '200', 'alice', '2025-10-01')
+
+    [(result, error)] = storage.run_batch([(storage.create_meal, ('200', 'alice', meal('2025-10-01')))])
+
+    assert result is None and error is not None
+    assert len(storage.list_meals('alice')) == 1
+
+
+# -- list_meals filters ------------------------------------------------------------
+
+def test_list_meals_date_range(storage):
+    add_meal(storage, '1', 'alice', '2025-10-01', name='October 1')
+    add_meal(storage, '2', 'alice', '2025-10-15T08:00:00.000Z', name='October 15')
+    add_meal(storage, '3', 'alice', 'Mon Oct 20 2025', name='October 20')
+    add_meal(storage, '4', 'bob', '2025-10-15', name='not alice')
+
+    assert [m['name'] for m in storage.list_meals('alice', start=date(2025, 10, 10))] == ['October 20', 'October 15']
+    assert [m['name'] for m in storage.list_meals('alice', end=date(2025, 10, 15))] == ['October 15', 'October 1']
+    assert [m['name'] for m in storage.list_meals('alice', start=date(2025, 10, 2), end=date(2025, 10, 19))] == ['October 15']
+
+
+def test_list_meals_since(storage):
+    add_meal(storage, '1', 'alice', '2025-10-01')
+    # created_at is CURRENT_TIMESTAMP in the database's (UTC) clock; a day either side avoids skew
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    assert len(storage.list_meals('alice', since=now - timedelta(days=1))) == 1
+    assert storage.list_meals('alice', since=now + timedelta(days=1)) == []
+    assert len(storage.list_meals('alice', since=now - timedelta(days=1), start=date(2025, 10, 1))) == 1
+
+
+# -- consistent reads --------------------------------------------------------------
+
+def test_dump_tables_and_meal_batches(storage):
+    add_meal(storage, '1', 'alice', '2025-10-01', name='Oatmeal')
+    add_meal(storage, '2', 'bob', '2025-10-02', name='Salad')
+
+    dumped = {table: b''.join(chunks).decode('utf-8') for table, chunks in storage.dump_tables()}
+    assert 'Oatmeal' in dumped['meals'] and 'Salad' in dumped['meals']
+    assert dumped['users'].splitlines()[0].startswith('user_id')
+
+    rows = [row for batch in storage.meal_batches(batch_rows=1, user_id='alice') for row in batch]
+    assert [(row[0], row[1]) for row in rows] == [('1', 'alice')]
+
+
+# -- meal partitions (PostgreSQL only) ----------------------------------------------
+
+@pytest.fixture
+def partitioned():
+    import meal_partitions
+
+    url, drop = postgres_database()
+    backend = create_storage(url)
+    backend.init_schema()
+    add_meal(backend, '1', 'alice', '2025-09-30', name='September')
+    add_meal(backend, '2', 'alice', '2025-10-15', name='October')
+    assert meal_partitions.migrate(backend, months_ahead=0) is True
+    yield backend
+    backend.close()
+    drop()
+
+
+def test_partitioned_meals_prune_on_meal_date(partitioned):
+    with partitioned.connection() as conn:
+        plan = '\n'.join(row[0] for row in conn.execute('''
+            EXPLAIN SELECT * FROM meals WHERE user_id = %s AND meal_date >= %s AND meal_date <= %s
+        ''', ('alice', date(2025, 10, 1), date(2025, 10, 31))).fetchall())
+    assert 'meals_p2025_10' in plan
+    assert 'meals_p2025_09' not in plan and 'meals_default' not in plan
+
+    assert [m['name'] for m in partitioned.list_meals('alice', start=date(2025, 10, 1))] == ['October']
+
+
+def test_partitioned_meals_keep_ids_unique_and_move_on_date_edits(partitioned):
+    [(_, error)] = partitioned.run_batch([(partitioned.create_meal, ('1', 'alice', meal('2025-10-20')))])
+    assert error is not None
+
+    # A new day moves the row to that month; an unreadable one to the DEFAULT partition
+    assert partitioned.run(partitioned.update_meal, '1', 'alice', meal('2025-10-02', name='Moved')) is True
+    assert partitioned.run(partitioned.update_meal, '2', 'alice', meal('someday', name='Undated')) is True
+    with partitioned.connection() as conn:
+        rows = dict(conn.execute('SELECT id, tableoid::regclass::text FROM meals').fetchall())
+    assert rows == {'1': 'meals_p2025_10', '2': 'meals_default'}
+
+
+def test_dumps_leave_out_the_pre_partitioning_copy(partitioned):
+    import meal_partitions
+
+    dumped = {table: b''.join(chunks).decode('utf-8') for table, chunks in partitioned.dump_tables()}
+    assert 'meals_unpartitioned' not in dumped and 'meals_unpartitioned' not in partitioned.table_names()
+    assert len(dumped['meals'].splitlines()) == 3
+
+    assert meal_partitions.drop_unpartitioned(partitioned) is True
+    assert meal_partitions.drop_unpartitioned(partitioned) is False
@@ -0,0 +1,133 @@
+"""
+Usage ledger for /api/analyze
+Buffers one row per upstream call (tokens, images, payload size, model,
+latency) in memory and writes them to the usage_ledger table in batches
+from a background thread, so the request path never waits on an INSERT.
+Callers can hand over the raw upstream response body instead of its usage;
+the tokens are then read from it on the flusher thread too.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+LEDGER_COLUMNS = (
+    'user_id', 'model', 'status', 'input_tokens', 'output_tokens',
+    'cache_creation_input_tokens', 'cache_read_input_tokens',
+    'image_count', 'payload_bytes', 'latency_ms', 'created_at',
+)
+
+
+def count_images(data):
+    """Count image blocks across all messages in a Messages API payload"""
+    count = 0
+    for message in (data or {}).get('messages', []):
+        content = message.get('content')
+        if isinstance(content, list):
+            count += sum(1 for block in content if isinstance(block, dict) and block.get('type') == 'image')
+    return count
+
+
+class UsageLedger:
+    """In-memory buffer of usage rows flushed to the database in batches"""
+
+    def __init__(self, storage, batch_size=200, flush_interval=5.0, max_buffer=20000, on_usage=None):
+        self.storage = storage
+        # Called from flush() with the usage of every row recorded with a response_body
+        self.on_usage = on_usage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Bounded: if the database is down for a long time we drop the oldest rows, not the server
+        self.buffer = deque(maxlen=max_buffer)
+        self.dropped = 0
+        self.flushed = 0
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def record(self, user_id=None, model=None, status=None, usage=None, image_count=0,
+               payload_bytes=None, latency_ms=None, response_body=None):
+        """Queue one upstream call; never touches the database
+
+        Pass either usage or response_body (the raw Messages JSON), whose
+        usage and model are read when the row is flushed.
+        """
+        usage = usage or {}
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(((
+            user_id, model, status,
+            usage.get('input_tokens'), usage.get('output_tokens'),
+            usage.get('cache_creation_input_tokens'), usage.get('cache_read_input_tokens'),
+            image_count, payload_bytes,
+            round(latency_ms) if latency_ms is not None else None,
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+        ), response_body))
+        self._ensure_thread()
+        if len(self.buffer) >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write everything currently buffered in one transaction; returns rows written"""
+        with self._flush_lock:
+            entries = []
+            while self.buffer:
+                entries.append(self.buffer.popleft())
+            if not entries:
+                return 0
+
+            rows = [self._resolve(row, body) for row, body in entries]
+            try:
+                self.storage.insert_usage(LEDGER_COLUMNS, rows)
+            except Exception as e:
+                print(f"⚠️ Usage ledger flush failed ({len(rows)} rows re-queued): {e}")
+                # Put rows back in their original order ahead of anything recorded meanwhile
+                self.buffer.extendleft((row, None) for row in reversed(rows))
+                return 0
+
+            self.flushed += len(rows)
+            return len(rows)
+
+    def _resolve(self, row, body):
+        """The row with usage (and model) filled in from a raw response body"""
+        if body is None:
+            return row
+        try:
+            response = json.loads(body)
+        except ValueError:
+            return row
+        usage = response.get('usage') or {}
+        if self.on_usage:
+            try:
+                self.on_usage(usage)
+            except Exception as e:
+                print(f"⚠️ Usage callback failed: {e}")
+        return (row[0], response.get('model') or row[1], row[2],
+                usage.get('input_tokens'), usage.get('output_tokens'),
+                usage.get('cache_creation_input_tokens'), usage.get('cache_read_input_tokens')) + row[7:]
+
+    def stats(self):
+        return {'buffered': len(self.buffer), 'flushed': self.flushed, 'dropped': self.dropped}
+
+    def _ensure_thread(self):
+        # gunicorn forks workers after import, so each process needs its own flusher thread
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='usage-ledger-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
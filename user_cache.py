@@ -0,0 +1,65 @@
+"""
+Per-user read-through cache for rarely-changing documents
+Targets and saved meals are read on every app launch but only change through
+a few write endpoints. Serialized responses are stored in a shared_cache
+backend (one copy for all gunicorn workers with the SQLite backend) under a
+per-user namespace; writes invalidate that namespace so every worker misses
+on its next read.
+"""
+
+import hashlib
+import threading
+
+ETAG_LENGTH = 32
+
+
+class ReadThroughCache:
+    """Serialized per-user responses plus their strong ETags"""
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def namespace(kind, user_id):
+        return f"{kind}:{user_id}"
+
+    def get_or_load(self, kind, user_id, loader):
+        """Return (body, etag); loader() produces the serialized body (str or bytes) on a miss"""
+        namespace = self.namespace(kind, user_id)
+        cached = self.backend.get(namespace, 'body')
+        if cached is not None:
+            self._count(hit=True)
+            # Stored as etag + body so hits don't re-hash the document
+            return cached[ETAG_LENGTH:], cached[:ETAG_LENGTH].decode('ascii')
+
+        self._count(hit=False)
+        # Taken before loading so a write that lands mid-load stops us caching the old rows
+        generation = self.backend.generation(namespace)
+        body = loader()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:ETAG_LENGTH]
+        self.backend.set(namespace, 'body', etag.encode('ascii') + body, ttl=self.ttl, generation=generation)
+        return body, etag
+
+    def invalidate(self, kind, user_id):
+        self.backend.invalidate(self.namespace(kind, user_id))
+
+    def generation(self, kind, user_id):
+        """Changes whenever invalidate() runs for this document, in any worker"""
+        return self.backend.generation(self.namespace(kind, user_id))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'backend': self.backend.stats()}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1